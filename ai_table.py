@@ -0,0 +1,88 @@
+"""Precomputed perfect-play table for tic-tac-toe.
+
+Every position reachable from the empty board (5,478 of them) is solved once
+with minimax when this module is imported, so answering an AI reply is a single
+dictionary lookup.
+"""
+from typing import Dict, NamedTuple, Optional
+import bitboard
+
+# Tie-break order between equally good moves: center, corners, then edges
+MOVE_ORDER = (4, 0, 2, 6, 8, 1, 3, 5, 7)
+
+
+class Entry(NamedTuple):
+    """Solved position."""
+    value: int  # game-theoretic result with best play: 1 X wins, -1 O wins, 0 tie
+    best_move: Optional[int]  # board index (0-8) for the side to move, None if game over
+
+
+def side_to_move(board: str) -> Optional[str]:
+    """Return 'X' or 'O' for the player to move, or None if the piece counts are impossible."""
+    x_count = board.count('X')
+    o_count = board.count('O')
+    if x_count == o_count:
+        return 'X'
+    if x_count == o_count + 1:
+        return 'O'
+    return None
+
+
+def _solve(x: int, o: int, x_to_move: bool, scores: Dict[int, int], table: Dict[str, Entry]) -> int:
+    """Minimax from X's point of view; faster wins (and slower losses) score higher."""
+    key = x | o << 9
+    if key in scores:
+        return scores[key]
+
+    winner = bitboard.winner(x, o)
+    if winner is not None:
+        empty = 9 - (x | o).bit_count()
+        score = 0
+        if winner == 'X':
+            score = 1 + empty
+        elif winner == 'O':
+            score = -1 - empty
+        scores[key] = score
+        table[bitboard.decode(x, o)] = Entry((score > 0) - (score < 0), None)
+        return score
+
+    legal = bitboard.legal_moves(x, o)
+    best_score = None
+    best_move = None
+    for i in MOVE_ORDER:
+        bit = 1 << i
+        if not legal & bit:
+            continue
+        if x_to_move:
+            score = _solve(x | bit, o, False, scores, table)
+        else:
+            score = _solve(x, o | bit, True, scores, table)
+        if best_score is None or (score > best_score if x_to_move else score < best_score):
+            best_score = score
+            best_move = i
+
+    scores[key] = best_score
+    table[bitboard.decode(x, o)] = Entry((best_score > 0) - (best_score < 0), best_move)
+    return best_score
+
+
+def _build_table() -> Dict[str, Entry]:
+    table: Dict[str, Entry] = {}
+    _solve(0, 0, True, {}, table)
+    return table
+
+
+TABLE = _build_table()
+
+
+def lookup(board: str) -> Optional[Entry]:
+    """Get the solved entry for a board, or None if it can't be reached in a real game."""
+    return TABLE.get(board)
+
+
+def best_move(board: str, symbol: str) -> Optional[int]:
+    """Best board index for symbol to play, or None if it isn't symbol's turn in a reachable position."""
+    entry = TABLE.get(board)
+    if entry is None or side_to_move(board) != symbol:
+        return None
+    return entry.best_move
@@ -0,0 +1,281 @@
+"""Backends that share game updates and matchmaking between server workers.
+
+Every worker keeps its own game state cache, event hub and long-poll waiters.
+After committing a change, main.py stages the game's new status on the
+backend, and the backend calls on_status with statuses committed by other
+workers so they reach this worker's cache and subscribers too. Matchmaking
+also goes through the backend, so players can be paired across workers.
+
+- InProcessBackend: a single worker. There is nothing to share, and the
+  matchmaking queue is in memory.
+- SQLiteChangeFeed: several workers on one SQLite file. Statuses and matches
+  are appended to the game_events table in the same transaction as the change.
+  Each worker polls the table for rows it hasn't seen. The matchmaking queue
+  is the match_queue table. Another worker's move reaches this worker's cache
+  within one poll interval; until then, status reads check the cached move
+  count against the games row, so they never answer with an older state.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional, Union
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from database import WRITE_TRANSACTION, Game, GameEvent, MatchRequest
+from matchmaking import Match, MatchmakingQueue
+from schemas import GameStatusResponse
+
+logger = logging.getLogger("backend")
+
+StatusCallback = Callable[[GameStatusResponse], None]
+# Creates a game on db, without committing, between (created_by, opponent_id)
+CreateGame = Callable[[AsyncSession, int, int], Awaitable[Game]]
+
+
+class Backend:
+    """Interface shared by the backends.
+
+    find_match is common to both: a player is paired straight away, or waits
+    on a future until someone pairs with them or the wait runs out.
+    """
+
+    async def start(self, on_status: StatusCallback):
+        """Start delivering other workers' statuses to on_status."""
+
+    async def stop(self):
+        """Stop delivering statuses."""
+
+    def stage_status(self, db: AsyncSession, status: GameStatusResponse):
+        """Share a game's new status with the other workers when db commits."""
+
+    async def is_current(self, status: GameStatusResponse) -> bool:
+        """Whether a cached status is still the game's latest, or another worker has moved since."""
+        return True
+
+    async def find_match(self, player_id: int, wait: float, create_game: CreateGame) -> Optional[Match]:
+        """Pair the player with the longest waiting player, or wait up to wait seconds to be paired.
+
+        Returns the player's side of the new game, or None if nobody came.
+        """
+        joined = await self._pair_or_join(player_id, create_game)
+        if isinstance(joined, Match):
+            return joined
+        try:
+            while True:
+                try:
+                    return await asyncio.wait_for(asyncio.shield(joined), wait)
+                except asyncio.TimeoutError:
+                    if await self._leave(player_id):
+                        return None
+                    # Taken for a match as the wait ran out; its game is being created
+        except asyncio.CancelledError:
+            await self._leave(player_id)
+            raise
+
+    async def _pair_or_join(self, player_id: int, create_game: CreateGame) -> Union[Match, asyncio.Future]:
+        """Create a game with the longest waiting player, or start waiting (one atomic step)."""
+        raise NotImplementedError
+
+    async def _leave(self, player_id: int) -> bool:
+        """Stop waiting. False if a match is on its way to the player's future."""
+        raise NotImplementedError
+
+    async def matchmaking_stats(self) -> dict:
+        raise NotImplementedError
+
+
+class InProcessBackend(Backend):
+    """One worker: game updates stay in this process, matchmaking uses MatchmakingQueue."""
+
+    def __init__(self, session_factory: async_sessionmaker, queue: MatchmakingQueue):
+        self._session_factory = session_factory
+        self.queue = queue
+
+    async def _pair_or_join(self, player_id, create_game):
+        # No await before join, so two newcomers can't both find the queue empty
+        partner_id = self.queue.pop_partner(player_id)
+        if partner_id is None:
+            return self.queue.join(player_id)
+        try:
+            async with self._session_factory() as db:
+                await db.connection(execution_options=WRITE_TRANSACTION)
+                game = await create_game(db, partner_id, player_id)
+                await db.commit()
+        except BaseException:
+            self.queue.requeue(partner_id)
+            raise
+        self.queue.resolve(partner_id, Match(game.game_id, player_id, 'X'))
+        return Match(game.game_id, partner_id, 'O')
+
+    async def _leave(self, player_id):
+        return self.queue.leave(player_id)
+
+    async def matchmaking_stats(self):
+        return self.queue.stats()
+
+
+class SQLiteChangeFeed(Backend):
+    """Workers sharing one SQLite database, through the game_events and match_queue tables.
+
+    Event ids are in commit order because SQLite has one writer at a time, so
+    reading past the last id seen never skips a row. Rows older than retention
+    seconds are pruned.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker, poll_interval: float = 0.05,
+                 retention: float = 60.0, origin: Optional[str] = None):
+        self._session_factory = session_factory
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.origin = origin or str(os.getpid())
+        self._on_status: Optional[StatusCallback] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_event = 0
+        # Players waiting through this worker, with the last event id when they joined
+        self._futures: Dict[int, asyncio.Future] = {}
+        self._joined_after: Dict[int, int] = {}
+        self.statuses_received = 0
+        self.enqueued = 0
+        self.matched = 0
+        self.timed_out = 0
+
+    async def start(self, on_status):
+        self._on_status = on_status
+        async with self._session_factory() as db:
+            self._last_event = await db.scalar(select(func.max(GameEvent.event_id))) or 0
+        self._task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def stage_status(self, db, status):
+        db.add(GameEvent(kind="status", key=status.game_id, origin=self.origin,
+                         payload=status.model_dump_json(), created_at=time.time()))
+
+    async def _poll(self):
+        pruned = time.monotonic()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.read_events()
+                if time.monotonic() - pruned >= self.retention:
+                    await self._prune()
+                    pruned = time.monotonic()
+            except Exception:
+                logger.exception("change feed poll failed")
+
+    async def is_current(self, status):
+        async with self._session_factory() as db:
+            move_count = await db.scalar(select(Game.move_count).where(Game.game_id == status.game_id))
+        return move_count == status.move_count
+
+    async def read_events(self):
+        """Deliver the events committed since the last read."""
+        async with self._session_factory() as db:
+            rows = (await db.execute(
+                select(GameEvent.event_id, GameEvent.kind, GameEvent.key, GameEvent.origin, GameEvent.payload)
+                .where(GameEvent.event_id > self._last_event)
+                .order_by(GameEvent.event_id)
+            )).all()
+        for event_id, kind, key, origin, payload in rows:
+            self._last_event = event_id
+            if kind == "status" and origin != self.origin:
+                self.statuses_received += 1
+                self._on_status(GameStatusResponse.model_validate_json(payload))
+            elif kind == "match":
+                self._resolve(key, Match(**json.loads(payload)))
+
+    async def _prune(self):
+        async with self._session_factory() as db:
+            await db.connection(execution_options=WRITE_TRANSACTION)
+            await db.execute(delete(GameEvent).where(GameEvent.created_at < time.time() - self.retention))
+            await db.commit()
+
+    def _resolve(self, player_id: int, match: Optional[Match]):
+        future = self._futures.pop(player_id, None)
+        self._joined_after.pop(player_id, None)
+        if future is not None and not future.done():
+            future.set_result(match)
+
+    def _future(self, player_id: int, joined_after: int) -> asyncio.Future:
+        if player_id not in self._futures:
+            self._futures[player_id] = asyncio.get_running_loop().create_future()
+            self._joined_after[player_id] = joined_after
+        return self._futures[player_id]
+
+    async def _pair_or_join(self, player_id, create_game):
+        async with self._session_factory() as db:
+            # The write lock makes pairing or joining atomic across workers, so
+            # the queue never holds more than one player
+            await db.connection(execution_options=WRITE_TRANSACTION)
+            last_event = await db.scalar(select(func.max(GameEvent.event_id))) or 0
+            waiting = await db.scalar(select(MatchRequest.player_id).order_by(MatchRequest.request_id).limit(1))
+            if waiting == player_id:
+                return self._future(player_id, last_event)
+            if waiting is None:
+                db.add(MatchRequest(player_id=player_id, enqueued_at=time.time()))
+                await db.commit()
+                self.enqueued += 1
+                return self._future(player_id, last_event)
+            await db.execute(delete(MatchRequest).where(MatchRequest.player_id == waiting))
+            game = await create_game(db, waiting, player_id)
+            theirs = Match(game.game_id, player_id, 'X')
+            db.add(GameEvent(kind="match", key=waiting, origin=self.origin,
+                             payload=json.dumps(theirs._asdict()), created_at=time.time()))
+            await db.commit()
+        self.matched += 1
+        self._resolve(waiting, theirs)  # if they wait on this worker; others read the event
+        return Match(game.game_id, waiting, 'O')
+
+    async def _leave(self, player_id):
+        async with self._session_factory() as db:
+            await db.connection(execution_options=WRITE_TRANSACTION)
+            removed = (await db.execute(delete(MatchRequest).where(MatchRequest.player_id == player_id))).rowcount
+            payload = None
+            if not removed:
+                # Matched, unless another request of theirs already left the queue
+                payload = await db.scalar(
+                    select(GameEvent.payload)
+                    .where(GameEvent.kind == "match", GameEvent.key == player_id,
+                           GameEvent.event_id > self._joined_after.get(player_id, self._last_event))
+                    .order_by(GameEvent.event_id.desc()).limit(1)
+                )
+            await db.commit()
+        if removed:
+            self.timed_out += 1
+        self._resolve(player_id, Match(**json.loads(payload)) if payload else None)
+        return payload is None
+
+    async def matchmaking_stats(self):
+        async with self._session_factory() as db:
+            depth, oldest = (await db.execute(
+                select(func.count(), func.min(MatchRequest.enqueued_at)).select_from(MatchRequest)
+            )).one()
+        return {
+            "depth": depth,
+            "oldest_wait_seconds": time.time() - oldest if oldest else 0.0,
+            # Counted by this worker only
+            "enqueued": self.enqueued,
+            "matched": self.matched,
+            "timed_out": self.timed_out,
+            "statuses_received": self.statuses_received,
+        }
+
+
+def create_backend(name: str, session_factory: async_sessionmaker, queue: MatchmakingQueue,
+                   poll_interval: float = 0.05) -> Backend:
+    """Backend by its STATE_BACKEND name: "local" or "sqlite"."""
+    if name == "local":
+        return InProcessBackend(session_factory, queue)
+    if name == "sqlite":
+        return SQLiteChangeFeed(session_factory, poll_interval=poll_interval)
+    raise ValueError(f"Unknown state backend {name!r}, expected 'local' or 'sqlite'")
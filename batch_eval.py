@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Vectorized winner and legal-move evaluation over many boards at once.
+
+Needs NumPy (the optional "analytics" extra). Boards can be given as:
+- a list of 9-char board strings (or a NumPy "S9" array of them)
+- a uint8 array of shape (n, 9), cells 0 = empty, 1 = X, 2 = O
+- a uint16 array of shape (n, 2) of (x_mask, o_mask) bitboards, as in bitboard.py
+
+Results match game_logic.check_winner and bitboard.legal_moves board for board.
+Packed bitboards are the fast path; strings first have to be joined and parsed.
+
+Run it directly to time winners() on each format against a check_winner loop:
+python batch_eval.py [--boards 1000000]
+"""
+import argparse
+import time
+from typing import List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+import bitboard
+
+# Winner codes returned by winners(), indexed into WINNER_NAMES
+NONE, X, O, TIE = 0, 1, 2, 3
+WINNER_NAMES: Tuple[Optional[str], ...] = (None, 'X', 'O', 'TIE')
+
+_CELL_BITS = np.left_shift(1, np.arange(9)).astype(np.uint16)
+
+
+def _build_codes() -> np.ndarray:
+    """Winner code for every (x_mask, o_mask) pair, indexed by x_mask | o_mask << 9."""
+    keys = np.arange(1 << 18, dtype=np.uint32)
+    x, o = keys & bitboard.FULL, keys >> 9
+    winning = np.array(bitboard.WINNING, dtype=bool)
+    codes = np.full(len(keys), NONE, dtype=np.uint8)
+    codes[(x | o) == bitboard.FULL] = TIE
+    codes[winning[o]] = O
+    codes[winning[x]] = X  # last, so X takes precedence like check_winner
+    return codes
+
+
+# 256KB, so winners() is a single gather per board
+_CODES = _build_codes()
+
+Boards = Union[Sequence[str], np.ndarray]
+
+
+def to_bitboards(boards: Boards) -> Tuple[np.ndarray, np.ndarray]:
+    """Convert boards in any accepted format to (x_masks, o_masks) uint16 arrays."""
+    if isinstance(boards, np.ndarray) and boards.dtype == np.uint16:
+        if boards.ndim != 2 or boards.shape[1] != 2:
+            raise ValueError("uint16 boards must have shape (n, 2)")
+        return boards[:, 0], boards[:, 1]
+
+    if isinstance(boards, np.ndarray) and boards.dtype == np.uint8:
+        if boards.ndim != 2 or boards.shape[1] != 9:
+            raise ValueError("uint8 boards must have shape (n, 9)")
+        return _pack(boards == 1), _pack(boards == 2)
+
+    if isinstance(boards, np.ndarray) and boards.dtype.kind == "S":
+        raw = np.ascontiguousarray(boards, dtype="S9").view(np.uint8)
+    else:
+        raw = np.frombuffer("".join(boards).encode("ascii"), dtype=np.uint8)
+    cells = raw.reshape(-1, 9)
+    return _pack(cells == ord('X')), _pack(cells == ord('O'))
+
+
+def _pack(cells: np.ndarray) -> np.ndarray:
+    """(n, 9) bools to n 9-bit masks, with cell i as bit i."""
+    return cells.astype(np.uint16) @ _CELL_BITS
+
+
+def winners(boards: Boards) -> np.ndarray:
+    """Winner code (NONE, X, O or TIE) for each board, same as check_winner."""
+    x, o = to_bitboards(boards)
+    return _CODES[x.astype(np.uint32) | o.astype(np.uint32) << 9]
+
+
+def winner_names(codes: np.ndarray) -> List[Optional[str]]:
+    """Winner codes back to check_winner's values ('X', 'O', 'TIE' or None)."""
+    return [WINNER_NAMES[c] for c in codes.tolist()]
+
+
+def legal_moves(boards: Boards) -> np.ndarray:
+    """Mask of empty cells for each board, same as bitboard.legal_moves."""
+    x, o = to_bitboards(boards)
+    return ~(x | o) & np.uint16(bitboard.FULL)
+
+
+def legal_move_cells(boards: Boards) -> np.ndarray:
+    """(n, 9) bool array, True where a move can be played."""
+    return (legal_moves(boards)[:, None] & _CELL_BITS) != 0
+
+
+def main():
+    from game_logic import check_winner
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--boards", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    cells = rng.integers(0, 3, size=(args.boards, 9), dtype=np.uint8)
+    boards = ["".join(".XO"[c] for c in row) for row in cells.tolist()]
+    x, o = to_bitboards(cells)
+    formats = [("strings", boards), ("uint8 cells", cells), ("uint16 bitboards", np.stack([x, o], axis=1))]
+
+    start = time.perf_counter()
+    expected = [check_winner(b) for b in boards]
+    loop = time.perf_counter() - start
+    print(f"{args.boards} boards, check_winner loop: {loop:.3f}s")
+    for name, data in formats:
+        start = time.perf_counter()
+        codes = winners(data)
+        elapsed = time.perf_counter() - start
+        assert winner_names(codes) == expected
+        print(f"winners() on {name}: {elapsed:.3f}s ({loop / elapsed:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
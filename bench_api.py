@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""Load test the API with concurrent simulated players.
+
+Starts main.app with uvicorn on localhost (or targets --url, or starts
+`main.py --workers N` with --workers) and runs N player threads. Each thread
+registers, then plays full games: against the AI, or in PvP pairs where it
+waits for the opponent with long polling. Requests use the same paths and
+payloads as client.py.
+
+Reports p50/p95/p99 latency per endpoint and moves/sec, and saves the results
+as JSON so runs from different commits can be compared with --compare.
+
+Usage: python bench_api.py [--players 20] [--games 3] [--pvp 0.5] [--workers N]
+                           [--output bench_api_results.json] [--compare old.json]
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+import requests
+
+LONG_POLL_WAIT = 5
+
+
+class Recorder:
+    """Thread-safe latency samples per endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.moves = 0
+
+    def add(self, endpoint, seconds, ok):
+        with self._lock:
+            self.samples[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def add_move(self):
+        with self._lock:
+            self.moves += 1
+
+
+class Player:
+    """One simulated player, with the same requests client.py makes."""
+
+    def __init__(self, base_url, recorder, name):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.name = name
+        self.http = requests.Session()
+        self.player_id = None
+
+    def _request(self, endpoint, method, path, **kwargs):
+        start = time.perf_counter()
+        response = self.http.request(method, f"{self.base_url}{path}", timeout=LONG_POLL_WAIT + 30, **kwargs)
+        self.recorder.add(endpoint, time.perf_counter() - start, response.status_code < 400)
+        return response
+
+    def register_player(self):
+        response = self._request("POST /players", "POST", "/players", json={"name": self.name})
+        self.player_id = response.json()["player_id"]
+
+    def create_game(self, opponent):
+        response = self._request("POST /games", "POST", "/games",
+                                 json={"created_by": self.player_id, "opponent": opponent})
+        return response.json()["game_id"]
+
+    def get_game_status(self, game_id, since=None):
+        if since is None:
+            return self._request("GET /games/{id}", "GET", f"/games/{game_id}").json()
+        return self._request("GET /games/{id}?wait", "GET", f"/games/{game_id}",
+                             params={"since": since, "wait": LONG_POLL_WAIT}).json()
+
+    def make_move(self, game_id, row, col):
+        response = self._request("POST /moves", "POST", "/moves", json={
+            "game_id": game_id, "player_id": self.player_id, "row": row, "col": col,
+        })
+        if response.status_code == 200:
+            self.recorder.add_move()
+        return response
+
+    def get_player_history(self):
+        self._request("GET /players/{id}/history", "GET", f"/players/{self.player_id}/history")
+
+    def play(self, game_id, rng):
+        """Play random legal moves until the game is done."""
+        status = self.get_game_status(game_id)
+        while status["status"] != "done":
+            if status["current_turn"] == str(self.player_id):
+                free = [i for i, cell in enumerate(status["board_state"]) if cell == "."]
+                cell = rng.choice(free)
+                self.make_move(game_id, cell // 3, cell % 3)
+                status = self.get_game_status(game_id)
+            else:
+                status = self.get_game_status(game_id, since=status["move_count"])
+
+
+def _run_ai_player(player, games, seed):
+    rng = random.Random(seed)
+    player.register_player()
+    for _ in range(games):
+        player.play(player.create_game("AI"), rng)
+    player.get_player_history()
+
+
+def _run_pvp_pair(first, second, games, seed):
+    rng = random.Random(seed)
+    first.register_player()
+    second.register_player()
+    for _ in range(games):
+        game_id = first.create_game(str(second.player_id))
+        other = threading.Thread(target=second.play, args=(game_id, random.Random(rng.random())))
+        other.start()
+        first.play(game_id, rng)
+        other.join()
+    first.get_player_history()
+    second.get_player_history()
+
+
+def _percentile(sorted_samples, q):
+    index = min(len(sorted_samples) - 1, max(0, round(q * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def summarize(recorder, elapsed):
+    endpoints = {}
+    for endpoint, samples in sorted(recorder.samples.items()):
+        ordered = sorted(samples)
+        endpoints[endpoint] = {
+            "count": len(ordered),
+            "errors": recorder.errors[endpoint],
+            "mean_ms": statistics.fmean(ordered) * 1000,
+            "p50_ms": _percentile(ordered, 0.50) * 1000,
+            "p95_ms": _percentile(ordered, 0.95) * 1000,
+            "p99_ms": _percentile(ordered, 0.99) * 1000,
+        }
+    return {
+        "elapsed_s": elapsed,
+        "moves": recorder.moves,
+        "moves_per_s": recorder.moves / elapsed if elapsed else 0.0,
+        "requests_per_s": sum(len(s) for s in recorder.samples.values()) / elapsed if elapsed else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _start_server():
+    """Run main.app with uvicorn in a background thread on a free port."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_api_'), 'bench.db')}"
+    import uvicorn
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    return server, thread, f"http://127.0.0.1:{port}"
+
+
+def start_workers(workers):
+    """Run main.py --workers N as a subprocess on a free port, with a fresh database."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='bench_api_'), 'bench.db')}")
+    main_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+    process = subprocess.Popen(
+        [sys.executable, main_py, "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            requests.get(base_url, timeout=1)
+            return process, base_url
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"{workers} workers didn't start on port {port}")
+
+
+def stop_workers(process):
+    process.terminate()
+    process.wait(timeout=30)
+
+
+def run_load(base_url, players, games, pvp=0.5, seed=0):
+    """Run the simulated players against base_url and return the summarized results."""
+    recorder = Recorder()
+    run_id = uuid.uuid4().hex[:8]
+    pvp_players = int(players * pvp) // 2 * 2
+    threads = []
+    for i in range(0, pvp_players, 2):
+        pair = (Player(base_url, recorder, f"bench-{run_id}-{i}"),
+                Player(base_url, recorder, f"bench-{run_id}-{i + 1}"))
+        threads.append(threading.Thread(target=_run_pvp_pair, args=(*pair, games, seed + i)))
+    for i in range(pvp_players, players):
+        player = Player(base_url, recorder, f"bench-{run_id}-{i}")
+        threads.append(threading.Thread(target=_run_ai_player, args=(player, games, seed + i)))
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(recorder, time.perf_counter() - start)
+
+
+def print_report(results, baseline=None):
+    print(f"{results['moves']} moves in {results['elapsed_s']:.2f}s: "
+          f"{results['moves_per_s']:.0f} moves/s, {results['requests_per_s']:.0f} requests/s")
+    print(f"{'endpoint':<28}{'count':>7}{'errors':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for endpoint, row in results["endpoints"].items():
+        line = (f"{endpoint:<28}{row['count']:>7}{row['errors']:>7}"
+                f"{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}")
+        old = (baseline or {}).get("endpoints", {}).get(endpoint)
+        if old:
+            line += f"   p95 {row['p95_ms'] - old['p95_ms']:+.2f} ms vs {baseline.get('commit') or 'baseline'}"
+        print(line)
+    if baseline:
+        print(f"moves/s {results['moves_per_s'] - baseline['moves_per_s']:+.0f} vs {baseline.get('commit') or 'baseline'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="target a running server instead of starting one")
+    parser.add_argument("--players", type=int, default=20, help="concurrent players")
+    parser.add_argument("--games", type=int, default=3, help="games per player (or pair)")
+    parser.add_argument("--pvp", type=float, default=0.5, help="fraction of players in PvP pairs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="start main.py --workers N instead of an in-process server")
+    parser.add_argument("--output", default="bench_api_results.json", help="where to save results")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    server = thread = process = None
+    base_url = args.url
+    if base_url is None and args.workers:
+        process, base_url = start_workers(args.workers)
+    elif base_url is None:
+        server, thread, base_url = _start_server()
+
+    try:
+        results = run_load(base_url, args.players, args.games, args.pvp, args.seed)
+    finally:
+        if server is not None:
+            server.should_exit = True
+            thread.join()
+        if process is not None:
+            stop_workers(process)
+
+    results.update({
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"players": args.players, "games": args.games, "pvp": args.pvp,
+                   "url": args.url or "in-process", "workers": args.workers},
+    })
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
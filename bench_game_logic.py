@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for the game_logic functions on the move path.
+
+Each function runs over every reachable board position (the keys of
+ai_table.TABLE). After warmup, each timed sample loops over all the inputs
+enough times to take at least MIN_SAMPLE_TIME, like timeit's autorange.
+Reports ns/op as min/median/mean/stdev/max across samples.
+
+--save writes the results as a baseline. --check compares the best (min) ns/op,
+the figure least disturbed by other load on the machine, against a baseline
+and exits non-zero if any function got slower by more than --threshold.
+Baselines only compare on the machine that saved them, so none is committed:
+save one from the base commit, then check the change against it. Without a
+baseline file, --check says so and skips the comparison.
+
+Usage: python bench_game_logic.py [--repeats 20] [--warmup 3]
+                                  [--save FILE | --check FILE] [--threshold 0.25]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import ai_table
+import game_logic
+
+DEFAULT_BASELINE = "bench_game_logic_baseline.json"
+MIN_SAMPLE_TIME = 0.02  # seconds
+
+
+def _cases():
+    """Inputs for each function, built from every reachable position."""
+    boards = sorted(ai_table.TABLE)
+    in_progress = [b for b in boards if game_logic.check_winner(b) is None]
+    to_move = [(b, ai_table.side_to_move(b)) for b in in_progress]
+    return {
+        "check_winner": (game_logic.check_winner, [(b,) for b in boards]),
+        "make_move_on_board": (game_logic.make_move_on_board, [
+            (b, i // 3, i % 3, symbol)
+            for b, symbol in to_move
+            for i in range(9) if b[i] == '.'
+        ]),
+        "_find_winning_move": (game_logic._find_winning_move, to_move),
+        "ai_make_move": (game_logic.ai_make_move, [(b,) for b, symbol in to_move if symbol == 'O']),
+    }
+
+
+def _time_pass(func, inputs, loops=1):
+    start = time.perf_counter_ns()
+    for _ in range(loops):
+        for args in inputs:
+            func(*args)
+    return (time.perf_counter_ns() - start) / (len(inputs) * loops)
+
+
+def _calibrate(func, inputs):
+    """Number of passes over inputs that takes at least MIN_SAMPLE_TIME."""
+    loops = 1
+    while _time_pass(func, inputs, loops) * len(inputs) * loops < MIN_SAMPLE_TIME * 1e9:
+        loops *= 2
+    return loops
+
+
+def run(repeats=20, warmup=3):
+    """Benchmark every function; returns {name: stats in ns/op}."""
+    results = {}
+    for name, (func, inputs) in _cases().items():
+        for _ in range(warmup):
+            _time_pass(func, inputs)
+        loops = _calibrate(func, inputs)
+        samples = [_time_pass(func, inputs, loops) for _ in range(repeats)]
+        results[name] = {
+            "inputs": len(inputs),
+            "loops": loops,
+            "min": min(samples),
+            "median": statistics.median(samples),
+            "mean": statistics.fmean(samples),
+            "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+            "max": max(samples),
+        }
+    return results
+
+
+def check(results, baseline, threshold):
+    """Return (name, baseline ns, current ns) for each function slower than allowed."""
+    regressions = []
+    for name, old in baseline["results"].items():
+        new = results.get(name)
+        if new is not None and new["min"] > old["min"] * (1 + threshold):
+            regressions.append((name, old["min"], new["min"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=20, help="timed samples per function")
+    parser.add_argument("--warmup", type=int, default=3, help="untimed passes per function")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--save", nargs="?", const=DEFAULT_BASELINE, help="save results as a baseline")
+    group.add_argument("--check", nargs="?", const=DEFAULT_BASELINE, help="fail if slower than this baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown of the min before --check fails (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    results = run(args.repeats, args.warmup)
+    print(f"{'function':<22}{'inputs':>8}{'min':>9}{'median':>9}{'mean':>9}{'stdev':>9}{'max':>9}  (ns/op)")
+    for name, row in results.items():
+        print(f"{name:<22}{row['inputs']:>8}{row['min']:>9.0f}{row['median']:>9.0f}"
+              f"{row['mean']:>9.0f}{row['stdev']:>9.0f}{row['max']:>9.0f}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "results": results}, f, indent=2)
+        print(f"Saved baseline to {args.save}")
+    elif args.check:
+        if not os.path.exists(args.check):
+            print(f"No baseline at {args.check}; save one with --save first. Skipping the check.")
+            return
+        with open(args.check) as f:
+            baseline = json.load(f)
+        regressions = check(results, baseline, args.threshold)
+        for name, old, new in regressions:
+            print(f"REGRESSION {name}: {old:.0f} -> {new:.0f} ns/op (+{new / old - 1:.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No function is more than {args.threshold:.0%} slower than {args.check}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""Benchmark concurrent move writes against SQLite profiles.
+
+Runs the real move path (main._apply_move) from many concurrent clients and
+reports moves/sec for:
+- default: SQLite defaults (rollback journal, synchronous=FULL)
+- tuned: database.SQLITE_PRAGMAS (WAL, synchronous=NORMAL, ...)
+- tuned+group: tuned, with moves batched by GroupCommitWriter
+
+Usage: python bench_sqlite.py [--clients 32] [--games 4]
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+# Keep main's import-time init_db away from the real database file
+_tmpdir = tempfile.mkdtemp(prefix="bench_sqlite_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmpdir, 'unused.db')}"
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+import main  # noqa: E402
+from database import Base, Game, Move, Player, WRITE_TRANSACTION, configure_sqlite  # noqa: E402
+from group_commit import GroupCommitWriter  # noqa: E402
+from schemas import MoveCreate  # noqa: E402
+
+# A full game that ends in a tie, so every game is 9 moves
+TIE_GAME = [(0, 0), (0, 1), (0, 2), (1, 0), (1, 1), (2, 0), (1, 2), (2, 2), (2, 1)]
+
+
+async def _setup(session_factory, engine, clients, games):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with session_factory() as db:
+        db.add_all([Player(player_id=1, name="x"), Player(player_id=2, name="o")])
+        db.add_all([
+            Game(created_by=1, opponent_id=2, is_ai=False, status="progress",
+                 board_state="." * 9, move_count=0)
+            for _ in range(clients * games)
+        ])
+        await db.commit()
+        game_ids = (await db.scalars(Game.__table__.select().with_only_columns(Game.game_id))).all()
+        db.add_all([Move(game_id=g, to_move="initial", board_id=0, board_state="." * 9) for g in game_ids])
+        await db.commit()
+    return game_ids
+
+
+async def _client(game_ids, session_factory, writer):
+    for game_id in game_ids:
+        for i, (row, col) in enumerate(TIE_GAME):
+            move = MoveCreate(game_id=game_id, player_id=1 if i % 2 == 0 else 2, row=row, col=col)
+            if writer is not None:
+                await writer.submit(lambda db, move=move: main._apply_move(db, move))
+            else:
+                async with session_factory() as db:
+                    await db.connection(execution_options=WRITE_TRANSACTION)
+                    await main._apply_move(db, move)
+                    await db.commit()
+
+
+async def run_profile(name, tuned, group, clients, games):
+    path = os.path.join(_tmpdir, f"{name.replace('+', '_')}.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", connect_args={"check_same_thread": False})
+    if tuned:
+        configure_sqlite(engine.sync_engine)
+    session_factory = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    game_ids = await _setup(session_factory, engine, clients, games)
+    writer = GroupCommitWriter(session_factory, execution_options=WRITE_TRANSACTION) if group else None
+
+    chunks = [game_ids[i::clients] for i in range(clients)]
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(chunk, session_factory, writer) for chunk in chunks))
+    elapsed = time.perf_counter() - start
+
+    if writer is not None:
+        await writer.close()
+    await engine.dispose()
+    moves = len(game_ids) * len(TIE_GAME)
+    return moves, elapsed, writer
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32, help="concurrent clients")
+    parser.add_argument("--games", type=int, default=4, help="games per client")
+    args = parser.parse_args()
+
+    profiles = [("default", False, False), ("tuned", True, False), ("tuned+group", True, True)]
+    print(f"{args.clients} clients x {args.games} games x {len(TIE_GAME)} moves")
+    print(f"{'profile':<14}{'moves':>8}{'seconds':>10}{'moves/sec':>12}")
+    try:
+        for name, tuned, group in profiles:
+            moves, elapsed, writer = asyncio.run(run_profile(name, tuned, group, args.clients, args.games))
+            line = f"{name:<14}{moves:>8}{elapsed:>10.2f}{moves / elapsed:>12.0f}"
+            if writer is not None and writer.batches:
+                line += f"   ({writer.units / writer.batches:.1f} moves/commit)"
+            print(line)
+    finally:
+        shutil.rmtree(_tmpdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,64 @@
+"""Bitboard representation of a tic-tac-toe board.
+
+A position is two 9-bit masks, one per player, where bit i is board index i
+(row * 3 + col). Win checks are mask tests against the 8 line masks and the
+legal moves are a single AND NOT. encode/decode convert to and from the
+9-char string format stored in Move.board_state.
+"""
+from functools import lru_cache
+from typing import Iterator, Optional
+
+FULL = 0x1FF  # all 9 cells
+
+# The 8 winning lines: rows, columns, diagonals
+WIN_MASKS = (
+    0b000000111, 0b000111000, 0b111000000,
+    0b001001001, 0b010010010, 0b100100100,
+    0b100010001, 0b001010100,
+)
+
+# WINNING[mask] is True if mask contains a full line, precomputed for all 512 masks
+WINNING = tuple(any(mask & line == line for line in WIN_MASKS) for mask in range(FULL + 1))
+
+_X_BITS = str.maketrans("XO.", "100")
+_O_BITS = str.maketrans("XO.", "010")
+
+
+# There are only 3^9 possible boards, so the cache never evicts a real one
+@lru_cache(maxsize=3 ** 9)
+def encode(board: str) -> tuple[int, int]:
+    """Convert a 9-char board string to (x_mask, o_mask)."""
+    # Reversed so that board index 0 ends up as the lowest bit
+    return int(board.translate(_X_BITS)[::-1], 2), int(board.translate(_O_BITS)[::-1], 2)
+
+
+def decode(x: int, o: int) -> str:
+    """Convert (x_mask, o_mask) back to a 9-char board string."""
+    return "".join(
+        'X' if x >> i & 1 else 'O' if o >> i & 1 else '.'
+        for i in range(9)
+    )
+
+
+def winner(x: int, o: int) -> Optional[str]:
+    """Returns 'X', 'O', 'TIE', or None, same as game_logic.check_winner."""
+    if WINNING[x]:
+        return 'X'
+    if WINNING[o]:
+        return 'O'
+    if x | o == FULL:
+        return 'TIE'
+    return None
+
+
+def legal_moves(x: int, o: int) -> int:
+    """Mask of empty cells."""
+    return FULL & ~(x | o)
+
+
+def iter_bits(mask: int) -> Iterator[int]:
+    """Yield the board index of each set bit, lowest first."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
@@ -0,0 +1,194 @@
+"""In-memory caches of game state and responses."""
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional
+
+from schemas import GameStatusResponse
+
+
+class GameStateCache:
+    """LRU + TTL cache of GameStatusResponse keyed by game_id.
+
+    Written through by the endpoints that change a game, after their commit,
+    so an entry is always the committed state. Only games in progress are
+    kept; a finished game is evicted when its last move is written.
+    Not thread-safe: use it from the event loop.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[int, tuple[float, GameStatusResponse]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, game_id: int) -> Optional[GameStatusResponse]:
+        """Return the cached status, or None on a miss or expired entry."""
+        entry = self._entries.get(game_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, status = entry
+        if expires_at <= self._clock():
+            del self._entries[game_id]
+            self.evictions += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(game_id)
+        self.hits += 1
+        return status
+
+    def peek(self, game_id: int) -> Optional[GameStatusResponse]:
+        """Return the cached status without counting a hit or miss or refreshing its LRU position."""
+        entry = self._entries.get(game_id)
+        if entry is None or entry[0] <= self._clock():
+            return None
+        return entry[1]
+
+    def put(self, status: GameStatusResponse):
+        """Store a game's committed status, or drop it if the game is done."""
+        if status.status == "done":
+            self.evict(status.game_id)
+            return
+        self._entries[status.game_id] = (self._clock() + self.ttl, status)
+        self._entries.move_to_end(status.game_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def put_if_newer(self, status: GameStatusResponse) -> bool:
+        """Store a status committed elsewhere, unless the cache has this move or a later one."""
+        entry = self._entries.get(status.game_id)
+        if entry is not None and entry[1].move_count >= status.move_count:
+            return False
+        self.put(status)
+        return True
+
+    def evict(self, game_id: int):
+        """Drop a game from the cache."""
+        if self._entries.pop(game_id, None) is not None:
+            self.evictions += 1
+
+    def clear(self):
+        """Drop every entry (counters are kept)."""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedResponse(NamedTuple):
+    """A serialized response body and its ETag."""
+    body: bytes
+    etag: str
+
+
+class ResponseCache:
+    """LRU cache of serialized responses keyed by game_id.
+
+    For responses that can never change, such as a finished game's moves, so
+    there is no TTL or invalidation. Not thread-safe: use it from the event loop.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, CachedResponse]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, game_id: int) -> Optional[CachedResponse]:
+        """Return the cached response, or None on a miss."""
+        cached = self._entries.get(game_id)
+        if cached is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(game_id)
+        self.hits += 1
+        return cached
+
+    def put(self, game_id: int, cached: CachedResponse):
+        """Store a response, evicting the least recently used past max_entries."""
+        self._entries[game_id] = cached
+        self._entries.move_to_end(game_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __contains__(self, game_id: int) -> bool:
+        return game_id in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": sum(len(cached.body) for cached in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class IdempotencyCache:
+    """LRU of recent move responses by idempotency key.
+
+    Each entry is the (request JSON, response JSON) pair stored with the key,
+    so a retry is answered without touching the database. Not thread-safe:
+    use it from the event loop.
+    """
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[str, str]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[tuple[str, str]]:
+        """Return the stored (request, response), or None on a miss."""
+        stored = self._entries.get(key)
+        if stored is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return stored
+
+    def put(self, key: str, request: str, response: str):
+        """Remember a response, evicting the least recently used past max_entries."""
+        self._entries[key] = (request, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry (counters are kept)."""
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        """Counters for monitoring."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -1,19 +1,51 @@
 #!/usr/bin/env python3
+import json
+import math
 import requests
 import sys
 import time
+import uuid
 
 BASE_URL = "http://localhost:8000"
+POLL_INTERVAL = 3  # seconds between status polls when the event stream is unavailable
+EVENTS_READ_TIMEOUT = 30  # server sends a keepalive every 15s
+LONG_POLL_WAIT = 25  # seconds the server may hold a status request open
+MATCHMAKING_TRIES = 4  # long polls to wait for a match before giving up
+MOVE_TIMEOUT = 10  # seconds before a move request is retried, with the same Idempotency-Key
+
+# Last ETag and body per URL, so repeat GETs can be answered with 304 Not Modified
+_conditional_cache = {}
 
 def print_board(board_state):
-    """Print the board in a readable format"""
+    """Print the board in a readable format, whatever its size"""
+    size = math.isqrt(len(board_state))
+    width = len(str(size - 1))
     print("\nCurrent Board:")
-    print("  0 1 2")
-    for i in range(3):
-        row = board_state[i*3:(i+1)*3]
-        print(f"{i} {' '.join(row)}")
+    print(" " * (width + 1) + " ".join(str(col).rjust(width) for col in range(size)))
+    for i in range(size):
+        row = board_state[i*size:(i+1)*size]
+        print(f"{str(i).rjust(width)} {' '.join(cell.rjust(width) for cell in row)}")
     print()
 
+def conditional_get(url):
+    """GET url with If-None-Match for the copy we already have.
+    
+    Returns (response, data): data is the JSON body, reused from the last
+    response on 304, or None if the request failed.
+    """
+    cached = _conditional_cache.get(url)
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    response = requests.get(url, headers=headers)
+    if response.status_code == 304 and cached:
+        return response, cached[1]
+    if response.status_code != 200:
+        return response, None
+    data = response.json()
+    etag = response.headers.get("ETag")
+    if etag:
+        _conditional_cache[url] = (etag, data)
+    return response, data
+
 def get_player_by_name(name):
     """Check if a player with this name exists"""
     response = requests.get(f"{BASE_URL}/players/by-name/{name}")
@@ -42,22 +74,25 @@ def get_active_games(player_id):
 
 def get_player_history(player_id):
     """Get all games for a player (completed and in-progress)"""
-    response = requests.get(f"{BASE_URL}/players/{player_id}/history")
-    if response.status_code == 200:
-        data = response.json()
+    response, data = conditional_get(f"{BASE_URL}/players/{player_id}/history")
+    if data is not None:
         return data.get('games', [])
     return []
 
 def get_game_moves(game_id):
     """Get all moves in a game"""
-    response = requests.get(f"{BASE_URL}/games/{game_id}/moves")
-    if response.status_code == 200:
-        return response.json()
-    return None
+    response, data = conditional_get(f"{BASE_URL}/games/{game_id}/moves")
+    return data
 
-def create_game(player_id, opponent):
+def ask_board_size():
+    """Board size for a new game: 3 unless the player picks a larger one"""
+    size = input("Board size (Enter for 3x3, e.g. 15 for five in a row): ").strip()
+    return int(size) if size.isdigit() else 3
+
+def create_game(player_id, opponent, board_size=3):
     """Create a new game vs AI or another player"""
-    response = requests.post(f"{BASE_URL}/games", json={"created_by": player_id, "opponent": opponent})
+    response = requests.post(f"{BASE_URL}/games",
+                             json={"created_by": player_id, "opponent": opponent, "board_size": board_size})
     if response.status_code == 200:
         data = response.json()
         print(f"✓ Game created! Game ID: {data['game_id']}")
@@ -75,18 +110,71 @@ def find_existing_game(player_id, opponent_id):
         return data['game_id']
     return None
 
+def find_match(player_id):
+    """Wait in the matchmaking queue for any opponent; returns (game_id, opponent) or (None, None)"""
+    print("Looking for an opponent...")
+    for _ in range(MATCHMAKING_TRIES):
+        response = requests.post(f"{BASE_URL}/matchmaking/enqueue",
+                                 json={"player_id": player_id, "wait": LONG_POLL_WAIT})
+        if response.status_code != 200:
+            print(f"✗ Error finding a match: {response.text}")
+            return None, None
+        data = response.json()
+        if data['status'] == "matched":
+            print(f"✓ Matched with Player {data['opponent_id']}! Game ID: {data['game_id']}")
+            return data['game_id'], str(data['opponent_id'])
+        print("Still looking...")
+    print("No opponent found, try again later.")
+    return None, None
+
 def get_game_status(game_id):
     """Get current game status"""
-    response = requests.get(f"{BASE_URL}/games/{game_id}")
-    if response.status_code == 200:
-        return response.json()
-    else:
+    response, data = conditional_get(f"{BASE_URL}/games/{game_id}")
+    if data is None:
         print(f"✗ Error getting game status: {response.text}")
-        return None
+    return data
+
+def wait_for_update(game_id, status):
+    """Wait until the board changes: event stream first, then long polling, then plain polling"""
+    try:
+        with requests.get(f"{BASE_URL}/games/{game_id}/events", stream=True,
+                          timeout=(5, EVENTS_READ_TIMEOUT)) as response:
+            if response.status_code == 200:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[len("data:"):])
+                    if event['board_state'] != status['board_state'] or event['status'] == 'done':
+                        return
+                return
+    except requests.exceptions.RequestException:
+        pass
+    
+    try:
+        response = requests.get(f"{BASE_URL}/games/{game_id}",
+                                params={"since": status['move_count'], "wait": LONG_POLL_WAIT},
+                                timeout=LONG_POLL_WAIT + 5)
+        if response.status_code == 200:
+            return
+    except requests.exceptions.RequestException:
+        pass
+    time.sleep(POLL_INTERVAL)
 
 def make_move(game_id, player_id, row, col):
-    """Make a move"""
-    response = requests.post(f"{BASE_URL}/moves", json={"game_id": game_id, "player_id": player_id, "row": row, "col": col})
+    """Make a move, retrying once if the connection drops or times out.
+
+    The retry has the same Idempotency-Key, so a move the server already
+    applied is answered with its saved response instead of being played again.
+    """
+    move = {"game_id": game_id, "player_id": player_id, "row": row, "col": col}
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    try:
+        response = requests.post(f"{BASE_URL}/moves", json=move, headers=headers, timeout=MOVE_TIMEOUT)
+    except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+        response = requests.post(f"{BASE_URL}/moves", json=move, headers=headers, timeout=MOVE_TIMEOUT)
+    if response.status_code == 409:
+        print("✗ The game changed while your move was sent; check the board and try again")
+        return None
     if response.status_code == 200:
         return response.json()
     else:
@@ -159,8 +247,9 @@ def play_game(player_id, game_id, opponent):
                 
                 row, col = int(parts[0]), int(parts[1])
                 
-                if row < 0 or row > 2 or col < 0 or col > 2:
-                    print("Invalid coordinates! Use 0, 1, or 2 for row and column")
+                size = status.get('board_size', 3)
+                if row < 0 or row >= size or col < 0 or col >= size:
+                    print(f"Invalid coordinates! Use 0 to {size - 1} for row and column")
                     continue
                 
             except ValueError:
@@ -181,8 +270,8 @@ def play_game(player_id, game_id, opponent):
                 time.sleep(1)  # Short delay for AI
             else:
                 opponent_symbol = 'O' if status['created_by'] == player_id else 'X'
-                print(f"Waiting for opponent ({opponent_symbol})... (polling every 3s)")
-                time.sleep(3)  # Poll every 3 seconds
+                print(f"Waiting for opponent ({opponent_symbol})...")
+                wait_for_update(game_id, status)
 
 def view_game_moves(game_id, player_id):
     """View all moves in a completed game"""
@@ -344,25 +433,27 @@ def main():
         
         if game_type == '2':
             # Multiplayer
-            opponent_id = input("Enter opponent's Player ID: ").strip()
-            if not opponent_id.isdigit():
+            opponent_id = input("Enter opponent's Player ID (or press Enter to find a match): ").strip()
+            if not opponent_id:
+                game_id, opponent = find_match(player_id)
+            elif not opponent_id.isdigit():
                 print("Invalid player ID!")
                 continue
-            
-            opponent = opponent_id
-            
-            # Check for existing game
-            print("\nChecking for existing game...")
-            game_id = find_existing_game(player_id, int(opponent_id))
-            
-            if not game_id:
-                print("No existing game found. Creating new game...")
-                game_id, opponent = create_game(player_id, opponent)
+            else:
+                opponent = opponent_id
+                
+                # Check for existing game
+                print("\nChecking for existing game...")
+                game_id = find_existing_game(player_id, int(opponent_id))
+                
+                if not game_id:
+                    print("No existing game found. Creating new game...")
+                    game_id, opponent = create_game(player_id, opponent, ask_board_size())
             
         else:
             # AI game
             print("\nCreating a game against AI...")
-            game_id, opponent = create_game(player_id, "AI")
+            game_id, opponent = create_game(player_id, "AI", ask_board_size())
         
         if not game_id:
             continue
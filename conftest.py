@@ -0,0 +1,6 @@
+"""Shared pytest setup."""
+import os
+import tempfile
+
+# Point the app at a throwaway database before database.py is imported
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
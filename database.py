@@ -1,11 +1,119 @@
-∏"""Database models and session management."""
-from sqlalchemy import create_engine, Column, Integer, String
+"""Database models and session management.
+
+The API uses the async engine (AsyncSessionLocal / get_async_db). The sync
+engine is kept for schema setup and scripts.
+
+Configuration comes from the environment:
+- DATABASE_URL: sync URL, default sqlite:///./tic_tac_toe.db
+- ASYNC_DATABASE_URL: async URL, derived from DATABASE_URL if unset
+  (sqlite -> sqlite+aiosqlite, postgresql -> postgresql+asyncpg)
+- DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE: connection
+  pool settings for server databases (ignored for SQLite)
+- SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE, SQLITE_CACHE_SIZE:
+  override the pragmas applied to every SQLite connection (see SQLITE_PRAGMAS)
+- COMPACT_MOVES=1: new moves store only the cell played, not a copy of the
+  board or the player (see move_values)
+"""
+import logging
+import os
+import time
+from typing import Optional
+from sqlalchemy import create_engine, event, inspect, text, Boolean, Column, Float, Index, Integer, String
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 
-DATABASE_URL = "sqlite:///./tic_tac_toe.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+import bitboard
+
+logger = logging.getLogger("database")
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./tic_tac_toe.db")
+COMPACT_MOVES = os.environ.get("COMPACT_MOVES") == "1"
+
+# Async drivers for each sync backend
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+
+def _async_url(url: str) -> str:
+    """Swap a sync database URL's driver for its async counterpart."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for {backend}, set ASYNC_DATABASE_URL")
+    return parsed.set(drivername=_ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def _engine_options(url: str) -> dict:
+    """Engine keyword arguments for a database URL."""
+    if make_url(url).get_backend_name() == "sqlite":
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", "20")),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": True,
+    }
+
+
+# Applied to every SQLite connection. WAL lets readers run alongside the writer,
+# and synchronous=NORMAL only fsyncs at checkpoints, which is safe in WAL mode
+# (a power cut can lose the last commits but never corrupts the file).
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", "-16384")),  # negative means KiB
+}
+
+
+def configure_sqlite(sync_engine, pragmas: Optional[dict] = None):
+    """Apply pragmas on every new connection and let SQLAlchemy own transactions.
+
+    pysqlite (and aiosqlite on top of it) issues its own BEGIN lazily, which
+    breaks SAVEPOINT. Turning that off and emitting BEGIN ourselves is the
+    recipe from the SQLAlchemy SQLite dialect docs.
+    """
+    pragmas = SQLITE_PRAGMAS if pragmas is None else pragmas
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    @event.listens_for(sync_engine, "begin")
+    def _on_begin(conn):
+        conn.exec_driver_sql(f"BEGIN {conn.get_execution_options().get('sqlite_begin', 'DEFERRED')}")
+
+
+# Execution options for a transaction that will write. On SQLite it starts with
+# BEGIN IMMEDIATE so the write lock is taken up front; a deferred transaction
+# that reads first and then writes fails with "database is locked" instead of
+# waiting when another writer got there in between. Other databases ignore it.
+WRITE_TRANSACTION = {"sqlite_begin": "IMMEDIATE"}
+
+
+ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_options(ASYNC_DATABASE_URL))
+if engine.dialect.name == "sqlite":
+    configure_sqlite(engine)
+if async_engine.dialect.name == "sqlite":
+    configure_sqlite(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -20,28 +128,284 @@ class Player(Base):
 class Game(Base):
     """Game model."""
     __tablename__ = "games"
+    __table_args__ = (
+        # Player lookups filter on either side of the game, usually with a status
+        Index("ix_games_created_by_status", "created_by", "status"),
+        Index("ix_games_opponent_id_status", "opponent_id", "status"),
+    )
     
     game_id = Column(Integer, primary_key=True, index=True)
     created_by = Column(Integer)
-    opponent = Column(String)  # "AI" or player_id
+    opponent_id = Column(Integer)  # player_id, None when playing the AI
+    is_ai = Column(Boolean, default=False)
     status = Column(String)  # "done" or "progress"
     last_move = Column(Integer)  # player_id who made the last move
+    board_state = Column(String)  # current board, same as the latest Move.board_state
+    move_count = Column(Integer, default=0)  # moves played, board_id of the latest Move
+    winner = Column(String)  # "X", "O", "TIE" or None while in progress
+    board_size = Column(Integer, nullable=False, default=3, server_default="3")  # rows and columns
+    win_length = Column(Integer, nullable=False, default=3, server_default="3")  # in a row needed to win
+    # Bumped by every UPDATE, which only applies WHERE version is the one read
+    # (SQLAlchemy raises StaleDataError otherwise), so a change made from a
+    # stale copy of the game can't overwrite a newer one
+    version = Column(Integer, nullable=False, server_default="1")
+    
+    __mapper_args__ = {"version_id_col": version}
+    
+    @property
+    def opponent(self) -> str:
+        """Opponent as the API reports it: "AI" or the player_id as a string."""
+        return "AI" if self.is_ai else str(self.opponent_id)
 
 
 class Move(Base):
     """Move model."""
     __tablename__ = "moves"
+    __table_args__ = (
+        # Unique, so two writers can never both add the same move number
+        Index("ix_moves_game_id_board_id", "game_id", "board_id", unique=True),
+    )
     
-    move_id = Column(Integer, primary_key=True, index=True)
-    game_id = Column(Integer, index=True)
-    to_move = Column(String)  # player_id or "AI"
+    move_id = Column(Integer, primary_key=True)
+    game_id = Column(Integer)
+    to_move = Column(String)  # player_id or "AI", None when stored compactly
     board_id = Column(Integer)  # for ordering moves
-    board_state = Column(String)  # "XOXO.OXX." format (9 chars)
+    board_state = Column(String)  # "XOXO.OXX." format (9 chars), None when stored compactly
+    cell = Column(Integer)  # board index (row * board_size + col) played, None for the initial board
+
+
+class IdempotencyKey(Base):
+    """Response to a move sent with an Idempotency-Key header, replayed on retries."""
+    __tablename__ = "idempotency_keys"
+    
+    key = Column(String, primary_key=True)  # "<player_id>:<header value>"
+    request = Column(String)  # MoveCreate JSON the key was first used with
+    response = Column(String)  # MoveResponse JSON
+    created_at = Column(Float)  # unix time, for prune_idempotency_keys
+
+
+class GameEvent(Base):
+    """Change feed entry that server workers share with STATE_BACKEND=sqlite."""
+    __tablename__ = "game_events"
+    # Ids are never reused, even once pruning has emptied the table, so
+    # workers reading past the last id they saw don't skip new events
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    event_id = Column(Integer, primary_key=True)  # commit order, since SQLite serializes writers
+    kind = Column(String)  # "status" or "match"
+    key = Column(Integer)  # game_id of a status, player_id who was matched
+    origin = Column(String)  # worker that wrote it
+    payload = Column(String)  # JSON: the GameStatusResponse or the Match
+    created_at = Column(Float)  # unix time, for pruning
+
+
+class MatchRequest(Base):
+    """Player waiting in the shared matchmaking queue (STATE_BACKEND=sqlite)."""
+    __tablename__ = "match_queue"
+    
+    request_id = Column(Integer, primary_key=True)  # FIFO order
+    player_id = Column(Integer, unique=True)
+    enqueued_at = Column(Float)  # unix time
+
+
+def move_values(game_id: int, board_id: int, to_move: str, board_state: str,
+                cell: Optional[int] = None) -> dict:
+    """Column values for a new Move row.
+
+    With COMPACT_MOVES only the cell is kept; game_logic.replay_moves rebuilds
+    the board and player from the cells and the game.
+    """
+    if COMPACT_MOVES:
+        return {"game_id": game_id, "board_id": board_id, "to_move": None, "board_state": None, "cell": cell}
+    return {"game_id": game_id, "board_id": board_id, "to_move": to_move,
+            "board_state": board_state, "cell": cell}
 
 
 def init_db():
     """Initialize database tables."""
     Base.metadata.create_all(bind=engine)
+    upgrade_schema(engine)
+
+
+def upgrade_schema(bind):
+    """Bring a database created by an older version up to the current models."""
+    _add_current_board_columns(bind)
+    _add_opponent_columns(bind)
+    if "version" not in _game_columns(bind):
+        with bind.begin() as conn:
+            conn.execute(text("ALTER TABLE games ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+    if "board_size" not in _game_columns(bind):
+        # Every game before variants was 3x3
+        with bind.begin() as conn:
+            conn.execute(text("ALTER TABLE games ADD COLUMN board_size INTEGER NOT NULL DEFAULT 3"))
+            conn.execute(text("ALTER TABLE games ADD COLUMN win_length INTEGER NOT NULL DEFAULT 3"))
+    _create_move_number_index(bind)
+    _autoincrement_event_ids(bind)
+    if "cell" not in _columns(bind, "moves"):
+        with bind.begin() as conn:
+            conn.execute(text("ALTER TABLE moves ADD COLUMN cell INTEGER"))
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+    # Only once their replacements exist
+    with bind.begin() as conn:
+        # Superseded by ix_moves_game_id_board_id
+        conn.execute(text("DROP INDEX IF EXISTS ix_moves_game_id"))
+        # Duplicated the primary key, which SQLite already stores as the rowid
+        conn.execute(text("DROP INDEX IF EXISTS ix_moves_move_id"))
+
+
+def _create_move_number_index(bind):
+    """Create the unique (game_id, board_id) index, replacing a non-unique one from older versions.
+    
+    If the table already holds duplicate move numbers, left by concurrent moves
+    before the index was unique, a non-unique index is kept or created instead
+    and a warning logged.
+    """
+    existing = {index["name"]: index for index in inspect(bind).get_indexes("moves")}
+    current = existing.get("ix_moves_game_id_board_id")
+    if current is not None and current["unique"]:
+        return
+    with bind.begin() as conn:
+        duplicate = conn.execute(text(
+            "SELECT game_id FROM moves GROUP BY game_id, board_id HAVING COUNT(*) > 1 LIMIT 1"
+        )).first()
+        if duplicate is not None:
+            logger.warning("moves has duplicate move numbers (e.g. game %s); "
+                           "ix_moves_game_id_board_id left non-unique", duplicate[0])
+            if current is None:
+                conn.execute(text("CREATE INDEX ix_moves_game_id_board_id ON moves (game_id, board_id)"))
+            return
+        if current is not None:
+            conn.execute(text("DROP INDEX ix_moves_game_id_board_id"))
+        conn.execute(text("CREATE UNIQUE INDEX ix_moves_game_id_board_id ON moves (game_id, board_id)"))
+
+
+def _autoincrement_event_ids(bind):
+    """Recreate game_events with AUTOINCREMENT if an older version created it without.
+    
+    The table only holds the last minute of changes, so its rows are dropped.
+    """
+    if bind.dialect.name != "sqlite":
+        return
+    with bind.begin() as conn:
+        sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'game_events'")).scalar()
+        if sql is None or "AUTOINCREMENT" in sql.upper():
+            return
+        conn.execute(text("DROP TABLE game_events"))
+    GameEvent.__table__.create(bind)
+
+
+def _columns(bind, table: str) -> set:
+    return {column["name"] for column in inspect(bind).get_columns(table)}
+
+
+def _game_columns(bind) -> set:
+    return _columns(bind, "games")
+
+
+def _add_current_board_columns(bind):
+    """Add board_state, move_count and winner to games, backfilled from moves."""
+    if "board_state" in _game_columns(bind):
+        return
+
+    with bind.begin() as conn:
+        conn.execute(text("ALTER TABLE games ADD COLUMN board_state VARCHAR"))
+        conn.execute(text("ALTER TABLE games ADD COLUMN move_count INTEGER DEFAULT 0"))
+        conn.execute(text("ALTER TABLE games ADD COLUMN winner VARCHAR"))
+        conn.execute(text("""
+            UPDATE games SET
+                board_state = COALESCE((
+                    SELECT board_state FROM moves
+                    WHERE moves.game_id = games.game_id
+                    ORDER BY board_id DESC LIMIT 1
+                ), '.........'),
+                move_count = COALESCE((
+                    SELECT MAX(board_id) FROM moves WHERE moves.game_id = games.game_id
+                ), 0)
+        """))
+        done = conn.execute(text("SELECT game_id, board_state FROM games WHERE status = 'done'")).all()
+        for game_id, board in done:
+            conn.execute(
+                text("UPDATE games SET winner = :winner WHERE game_id = :game_id"),
+                {"winner": bitboard.winner(*bitboard.encode(board)), "game_id": game_id},
+            )
+
+
+def _add_opponent_columns(bind):
+    """Replace the string opponent column with opponent_id and is_ai.
+
+    The old column is left in place (SQLite can't always drop columns) but
+    is no longer read or written.
+    """
+    if "opponent_id" in _game_columns(bind):
+        return
+
+    with bind.begin() as conn:
+        conn.execute(text("ALTER TABLE games ADD COLUMN opponent_id INTEGER"))
+        conn.execute(text("ALTER TABLE games ADD COLUMN is_ai BOOLEAN DEFAULT 0"))
+        conn.execute(text("""
+            UPDATE games SET
+                is_ai = (opponent = 'AI'),
+                opponent_id = CASE WHEN opponent = 'AI' THEN NULL ELSE CAST(opponent AS INTEGER) END
+        """))
+
+
+def prune_idempotency_keys(bind, max_age: float = 86400.0) -> int:
+    """Delete stored Idempotency-Key responses older than max_age seconds; returns how many."""
+    with bind.begin() as conn:
+        return conn.execute(
+            text("DELETE FROM idempotency_keys WHERE created_at < :cutoff"),
+            {"cutoff": time.time() - max_age},
+        ).rowcount
+
+
+def compact_moves(bind, games_per_batch: int = 1000) -> int:
+    """Convert stored moves to the compact format, one batch of games per transaction.
+
+    Each move's cell is worked out from the board before it, then the board
+    copy and player are dropped. Returns the number of moves converted. Run
+    VACUUM afterwards to give the space back to the filesystem.
+    """
+    converted = 0
+    last_game_id = 0
+    while True:
+        with bind.begin() as conn:
+            game_ids = conn.execute(
+                text("SELECT game_id FROM games WHERE game_id > :last ORDER BY game_id LIMIT :n"),
+                {"last": last_game_id, "n": games_per_batch},
+            ).scalars().all()
+            if not game_ids:
+                return converted
+            last_game_id = game_ids[-1]
+            rows = conn.execute(
+                text("""
+                    SELECT move_id, moves.game_id, board_id, moves.board_state, cell, board_size
+                    FROM moves JOIN games ON games.game_id = moves.game_id
+                    WHERE moves.game_id BETWEEN :first AND :last
+                    ORDER BY moves.game_id, board_id
+                """),
+                {"first": game_ids[0], "last": last_game_id},
+            ).all()
+            updates = []
+            boards = {}
+            for move_id, game_id, board_id, board, cell, size in rows:
+                before = boards.get(game_id, "." * (size * size))
+                if board is None:
+                    # Already compact: rebuild its board so the next move can be diffed
+                    if cell is not None:
+                        board = before[:cell] + ("X" if board_id % 2 else "O") + before[cell + 1:]
+                    boards[game_id] = board or before
+                    continue
+                changed = [i for i in range(len(board)) if board[i] != before[i]]
+                updates.append({"move_id": move_id, "cell": changed[0] if board_id and changed else None})
+                boards[game_id] = board
+            if updates:
+                conn.execute(
+                    text("UPDATE moves SET cell = :cell, board_state = NULL, to_move = NULL WHERE move_id = :move_id"),
+                    updates,
+                )
+            converted += len(updates)
 
 
 def get_db():
@@ -52,3 +416,8 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db():
+    """Get async database session."""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,65 @@
+"""In-process pub/sub hub for game updates."""
+import asyncio
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class GameEventHub:
+    """Fans out game events to the asyncio queues subscribed to each game.
+
+    Each queue is fed through the loop that subscribed it, with
+    call_soon_threadsafe, so publish works from any thread. The endpoints all
+    publish from the event loop; the other thread is for a process running
+    more than one loop, such as the tests, where TestClient and a uvicorn
+    server in a thread share this hub.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: Dict[int, Dict[asyncio.Queue, asyncio.AbstractEventLoop]] = {}
+
+    def subscribe(self, game_id: int) -> asyncio.Queue:
+        """Start receiving events for a game. Must be called from the event loop."""
+        queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers.setdefault(game_id, {})[queue] = loop
+        return queue
+
+    def unsubscribe(self, game_id: int, queue: asyncio.Queue):
+        """Stop receiving events for a game."""
+        with self._lock:
+            subscribers = self._subscribers.get(game_id)
+            if subscribers is None:
+                return
+            subscribers.pop(queue, None)
+            if not subscribers:
+                del self._subscribers[game_id]
+
+    @contextmanager
+    def subscription(self, game_id: int) -> Iterator[asyncio.Queue]:
+        """Subscribe for the duration of a with block."""
+        queue = self.subscribe(game_id)
+        try:
+            yield queue
+        finally:
+            self.unsubscribe(game_id, queue)
+
+    def publish(self, game_id: int, event: dict):
+        """Send an event to every subscriber of a game."""
+        with self._lock:
+            subscribers = list(self._subscribers.get(game_id, {}).items())
+        for queue, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                pass  # subscriber's loop already closed
+
+    def subscriber_count(self, game_id: int) -> int:
+        """Number of active subscribers for a game."""
+        with self._lock:
+            return len(self._subscribers.get(game_id, {}))
+
+
+hub = GameEventHub()
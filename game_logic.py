@@ -1,102 +1,141 @@
 """Game logic functions for tic-tac-toe."""
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 import random
-from sqlalchemy.orm import Session
 from database import Game, Move
+import ai_table
+import bitboard
+from variants import STANDARD, Variant
 
 
-def empty_board() -> str:
+def empty_board(size: int = 3) -> str:
     """Returns empty board representation."""
-    return "." * 9
+    return "." * (size * size)
 
 
-def get_board_position(row: int, col: int) -> int:
-    """Convert row,col to board index (0-8)."""
-    return row * 3 + col
+def get_board_position(row: int, col: int, size: int = 3) -> int:
+    """Convert row,col to board index (0-8 on a 3x3 board)."""
+    return row * size + col
 
 
-def make_move_on_board(board: str, row: int, col: int, symbol: str) -> str:
+def make_move_on_board(board: str, row: int, col: int, symbol: str, size: int = 3) -> str:
     """Make a move on the board."""
-    pos = get_board_position(row, col)
+    pos = get_board_position(row, col, size)
     if board[pos] != '.':
         raise ValueError("Invalid move: position already taken")
     return board[:pos] + symbol + board[pos+1:]
 
 
 def check_winner(board: str) -> Optional[str]:
-    """Check if there's a winner. Returns 'X', 'O', 'TIE', or None."""
-    # Check rows
-    for i in range(0, 9, 3):
-        if board[i] != '.' and board[i] == board[i+1] == board[i+2]:
-            return board[i]
-    
-    # Check columns
-    for i in range(3):
-        if board[i] != '.' and board[i] == board[i+3] == board[i+6]:
-            return board[i]
-    
-    # Check diagonals
-    if board[0] != '.' and board[0] == board[4] == board[8]:
-        return board[0]
-    if board[2] != '.' and board[2] == board[4] == board[6]:
-        return board[2]
-    
-    # Check for tie
-    if '.' not in board:
-        return 'TIE'
-    
-    return None
+    """Check if there's a winner on a 3x3 board. Returns 'X', 'O', 'TIE', or None."""
+    return bitboard.winner(*bitboard.encode(board))
+
+
+def check_winner_after(board: str, cell: int, variant: Variant, stones: int) -> Optional[str]:
+    """Winner after a stone was played on cell, with stones on the board now.
 
+    3x3 boards use the bitboard check; larger ones only look at the lines
+    through cell (see variants.Variant.winner_after).
+    """
+    if variant == STANDARD:
+        return check_winner(board)
+    return variant.winner_after(board, cell, stones)
 
-def get_current_board(db: Session, game_id: int) -> str:
-    """Get the current board state for a game."""
-    moves = db.query(Move).filter(Move.game_id == game_id).order_by(Move.board_id).all()
-    if moves:
-        return moves[-1].board_state
-    return empty_board()
+
+def get_variant(game: Game) -> Variant:
+    """The game's board size and win length."""
+    return Variant(game.board_size, game.win_length)
 
 
 def _find_winning_move(board: str, symbol: str) -> Optional[int]:
     """Find a winning move for the given symbol."""
-    for i in range(9):
-        if board[i] == '.':
-            # Try this move
-            test_board = board[:i] + symbol + board[i+1:]
-            if check_winner(test_board) == symbol:
-                return i
+    x, o = bitboard.encode(board)
+    mine = x if symbol == 'X' else o
+    for i in bitboard.iter_bits(bitboard.legal_moves(x, o)):
+        if bitboard.WINNING[mine | 1 << i]:
+            return i
     return None
 
 
-def ai_make_move(board: str) -> tuple[int, int]:
-    """Strategic AI: tries to win, block, or make smart moves."""
+def heuristic_move(board: str, symbol: str = 'O', rng=random) -> Optional[int]:
+    """Pick a move for symbol: win, block, center, corner, then any edge.
+
+    Returns a board index, or None if the board is full.
+    """
     available = [i for i in range(9) if board[i] == '.']
     if not available:
-        return None, None
+        return None
     
     # 1. Try to win
-    winning_move = _find_winning_move(board, 'O')
+    winning_move = _find_winning_move(board, symbol)
     if winning_move is not None:
-        return winning_move // 3, winning_move % 3
+        return winning_move
     
     # 2. Block opponent from winning
-    blocking_move = _find_winning_move(board, 'X')
+    blocking_move = _find_winning_move(board, 'X' if symbol == 'O' else 'O')
     if blocking_move is not None:
-        return blocking_move // 3, blocking_move % 3
+        return blocking_move
     
     # 3. Take center if available
     if board[4] == '.':
-        return 1, 1
+        return 4
     
     # 4. Take a corner (strategic positions)
     corners = [0, 2, 6, 8]
     available_corners = [c for c in corners if board[c] == '.']
     if available_corners:
-        move = random.choice(available_corners)
-        return move // 3, move % 3
+        return rng.choice(available_corners)
     
     # 5. Take any remaining edge
-    move = random.choice(available)
-    return move // 3, move % 3
+    return rng.choice(available)
+
+
+def variant_move(board: str, variant: Variant, symbol: str = 'O') -> Optional[int]:
+    """Pick a move for symbol on a larger board: win, block, then build next to the stones.
+
+    Without a win or a block, plays the empty cell with the most stones
+    around it, nearest the center. Returns a board index, or None if the
+    board is full.
+    """
+    available = [i for i, cell in enumerate(board) if cell == '.']
+    if not available:
+        return None
+    
+    for target in (symbol, 'X' if symbol == 'O' else 'O'):
+        for i in available:
+            if variant.completes_line(board, i, target):
+                return i
+    
+    size = variant.size
+    center = (size - 1) / 2
+    
+    def rank(i: int) -> tuple:
+        row, col = divmod(i, size)
+        neighbours = sum(
+            board[r * size + c] != '.'
+            for r in range(max(row - 1, 0), min(row + 2, size))
+            for c in range(max(col - 1, 0), min(col + 2, size))
+        )
+        return -neighbours, abs(row - center) + abs(col - center), i
+    
+    return min(available, key=rank)
+
+
+def ai_make_move(board: str, variant: Variant = STANDARD) -> tuple[int, int]:
+    """Perfect-play AI using the precomputed table, with heuristics as fallback.
+
+    The heuristics (win, block, center, corner) only kick in for boards that
+    can't come up in a real game and so aren't in the table. Boards other than
+    3x3 use variant_move.
+    """
+    if variant != STANDARD:
+        move = variant_move(board, variant, 'O')
+    else:
+        move = ai_table.best_move(board, 'O')
+        if move is None:
+            move = heuristic_move(board, 'O')
+    if move is None:
+        return None, None
+    return divmod(move, variant.size)
 
 
 def get_current_turn(game: Game, last_move: Optional[int]) -> str:
@@ -112,3 +151,26 @@ def get_current_turn(game: Game, last_move: Optional[int]) -> str:
     else:
         return str(game.created_by)
 
+
+def replay_moves(game: Game, moves: Iterable[Move]) -> Iterator[tuple[Move, str, str]]:
+    """Yield (move, player, board after the move) for a game's moves in board_id order.
+
+    Moves stored compactly (see database.move_values) have no board or player;
+    the board is rebuilt from the cells played and the player from the turn
+    order, since the creator always moves first as X.
+    """
+    board = empty_board(game.board_size)
+    for move in moves:
+        if move.board_state is not None:
+            board = move.board_state
+        elif move.cell is not None:
+            board = board[:move.cell] + ('X' if move.board_id % 2 else 'O') + board[move.cell + 1:]
+        player = move.to_move
+        if player is None:
+            if move.board_id == 0:
+                player = "initial"
+            elif move.board_id % 2:
+                player = str(game.created_by)
+            else:
+                player = game.opponent
+        yield move, player, board
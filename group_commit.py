@@ -0,0 +1,102 @@
+"""Group commit: run write units from many requests in one transaction."""
+import asyncio
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+T = TypeVar("T")
+
+
+class GroupCommitWriter:
+    """Batches write units into shared transactions.
+
+    Units submitted within max_delay of each other (up to max_batch of them)
+    run one after another on a single session, each inside its own SAVEPOINT,
+    and are committed together. A unit that raises only rolls back its own
+    savepoint and gets the exception; the rest of the batch still commits.
+    Because units run one at a time, a unit's reads and writes can't interleave
+    with another unit from this process.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        max_batch: int = 64,
+        max_delay: float = 0.002,
+        execution_options: Optional[dict] = None,
+    ):
+        self._session_factory = session_factory
+        self._execution_options = execution_options
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.batches = 0
+        self.units = 0
+
+    async def submit(self, work: Callable[[AsyncSession], Awaitable[T]]) -> T:
+        """Run work(session) in the next batch and return its result once committed."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+        future = loop.create_future()
+        self._queue.put_nowait((work, future))
+        return await future
+
+    async def close(self):
+        """Stop the background writer task."""
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch):
+        done = []
+        try:
+            async with self._session_factory() as db:
+                if self._execution_options:
+                    await db.connection(execution_options=self._execution_options)
+                for work, future in batch:
+                    if future.cancelled():
+                        continue
+                    try:
+                        async with db.begin_nested():
+                            result = await work(db)
+                    except Exception as e:
+                        if not future.done():  # the caller may have given up while it ran
+                            future.set_exception(e)
+                    else:
+                        done.append((future, result))
+                await db.commit()
+        except Exception as e:
+            # Nothing was committed: fail every unit still waiting, run or not
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.units += len(done)
+        for future, result in done:
+            if not future.done():
+                future.set_result(result)
@@ -1,225 +1,690 @@
-from fastapi import FastAPI, HTTPException, Depends
-from sqlalchemy.orm import Session
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Depends, Header, Query
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.exc import StaleDataError
 from typing import Optional
 
-from database import init_db, get_db, Player, Game, Move
+from database import (
+    init_db, get_async_db, async_engine, AsyncSessionLocal, WRITE_TRANSACTION, Player, Game, Move,
+    IdempotencyKey, move_values
+)
+from cache import CachedResponse, GameStateCache, IdempotencyCache, ResponseCache
+from events import hub
+from matchmaking import matchmaking
+from backend import create_backend
+from group_commit import GroupCommitWriter
+import profiling
 from schemas import (
     PlayerCreate, PlayerResponse, GameCreate, GameResponse,
     MoveCreate, MoveResponse, GameStatusResponse, ActiveGamesResponse,
-    MoveHistoryItem, MovesHistoryResponse, GameHistoryItem, AllGamesResponse
+    MoveHistoryItem, MovesHistoryResponse, GameHistoryItem, AllGamesResponse,
+    MoveBatchRequest, MoveBatchResult, MoveBatchResponse,
+    GameBatchRequest, GameBatchResult, GameBatchResponse,
+    MatchmakingRequest, MatchmakingResponse
 )
 from game_logic import (
-    empty_board, make_move_on_board, check_winner,
-    get_current_board, ai_make_move, get_current_turn
+    make_move_on_board, check_winner_after, get_variant,
+    ai_make_move, get_current_turn, replay_moves
 )
+from search import SearchPool
+from variants import STANDARD, Variant, variant_for
 
 init_db()
 
-app = FastAPI()
+logger = logging.getLogger("main")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Receive other workers' game updates and prune old Idempotency-Keys while the app runs."""
+    await backend.start(_remote_status)
+    if ai_search.workers:
+        await asyncio.get_running_loop().run_in_executor(None, ai_search.start)
+    pruner = asyncio.create_task(_prune_idempotency_keys_periodically())
+    yield
+    pruner.cancel()
+    await backend.stop()
+    ai_search.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
+
+# Seconds between keepalive comments on idle event streams
+EVENTS_KEEPALIVE = 15
+# Longest a status request may block waiting for a move
+MAX_LONG_POLL_WAIT = 60
+# Largest page size for a player's game history
+MAX_HISTORY_PAGE = 1000
+# Most moves or games in one batch request
+MAX_BATCH_SIZE = 1000
+
+# Active games' state, so status reads skip the database
+game_cache = GameStateCache(
+    max_entries=int(os.environ.get("GAME_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("GAME_CACHE_TTL", "300")),
+)
+
+# Finished games' status and /moves bodies, which never change
+finished_status_cache = ResponseCache(max_entries=int(os.environ.get("FINISHED_STATUS_CACHE_SIZE", "10000")))
+moves_cache = ResponseCache(max_entries=int(os.environ.get("MOVES_CACHE_SIZE", "10000")))
+
+# Recent Idempotency-Key responses, so retries of a move skip the database
+idempotency_cache = IdempotencyCache(max_entries=int(os.environ.get("IDEMPOTENCY_CACHE_SIZE", "10000")))
+# Seconds saved Idempotency-Key responses are kept, and between prunes of older ones
+IDEMPOTENCY_KEY_TTL = float(os.environ.get("IDEMPOTENCY_KEY_TTL", "86400"))
+IDEMPOTENCY_PRUNE_INTERVAL = 3600
+
+# AI replies on boards larger than 3x3 are searched in worker processes,
+# started with the app, within AI_TIME_BUDGET_MS; AI_WORKERS=0 plays the
+# quick heuristic instead
+ai_search = SearchPool(
+    workers=int(os.environ.get("AI_WORKERS", str(min(os.cpu_count() or 1, 4)))),
+    time_budget=float(os.environ.get("AI_TIME_BUDGET_MS", "250")) / 1000,
+)
+
+# Cache-Control for finished games, which never change, and for everything else
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# GROUP_COMMIT=1 batches concurrent moves into shared transactions
+group_writer = None
+if os.environ.get("GROUP_COMMIT") == "1":
+    group_writer = GroupCommitWriter(
+        AsyncSessionLocal,
+        max_batch=int(os.environ.get("GROUP_COMMIT_MAX_BATCH", "64")),
+        max_delay=float(os.environ.get("GROUP_COMMIT_MAX_DELAY_MS", "2")) / 1000,
+        execution_options=WRITE_TRANSACTION,
+    )
+
+# STATE_BACKEND=sqlite shares game updates and matchmaking between workers (see backend.py)
+backend = create_backend(
+    os.environ.get("STATE_BACKEND", "local"), AsyncSessionLocal, matchmaking,
+    poll_interval=float(os.environ.get("CHANGE_FEED_POLL_MS", "50")) / 1000,
+)
+
+
+# PROFILING=1 records per-route timings, DB queries and game logic time, served on /metrics
+if os.environ.get("PROFILING") == "1":
+    app.add_middleware(
+        profiling.ProfilingMiddleware,
+        engine=async_engine.sync_engine,
+        slow_ms=float(os.environ.get("PROFILING_SLOW_MS", "500")),
+        profile_dir=os.environ.get("PROFILE_DIR", "profiles"),
+    )
+    profiling.instrument_game_logic(sys.modules[__name__])
+
+
+def _game_status(game: Game) -> GameStatusResponse:
+    """Build the status response for a game row."""
+    current_turn = None
+    winner = None
+    
+    if game.status == "progress":
+        current_turn = get_current_turn(game, game.last_move)
+    else:
+        winner = game.winner
+    
+    return GameStatusResponse(
+        game_id=game.game_id,
+        created_by=game.created_by,
+        opponent=game.opponent,
+        status=game.status,
+        board_state=game.board_state,
+        move_count=game.move_count,
+        current_turn=current_turn,
+        winner=winner,
+        board_size=game.board_size,
+        win_length=game.win_length
+    )
+
+
+def _game_etag(game_id: int, move_count: int) -> str:
+    """Strong ETag for a game's status or moves, which only change when a move is made."""
+    return f'"{game_id}-{move_count}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header covers etag (weak comparison, as the header uses)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def _not_modified(etag: str, immutable: bool = False) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": IMMUTABLE if immutable else REVALIDATE})
+
+
+def _json_response(body, etag: Optional[str] = None, if_none_match: Optional[str] = None,
+                   immutable: bool = False) -> Response:
+    """Send a response model (or its already serialized bytes) as JSON.
+    
+    Returning a Response skips FastAPI's validation and serialization of the
+    return value, which is redundant for models built here from database rows.
+    The route's response_model still documents the shape. With an etag, answers
+    304 Not Modified when If-None-Match already has it.
+    """
+    if etag is not None and _etag_matches(if_none_match, etag):
+        return _not_modified(etag, immutable)
+    if isinstance(body, BaseModel):
+        body = body.model_dump_json()
+    headers = None
+    if etag is not None:
+        headers = {"ETag": etag, "Cache-Control": IMMUTABLE if immutable else REVALIDATE}
+    return Response(body, media_type="application/json", headers=headers)
+
+
+def _cache_finished_status(status: GameStatusResponse) -> CachedResponse:
+    """Keep a finished game's serialized status for conditional and repeat reads."""
+    cached = CachedResponse(status.model_dump_json().encode(), _game_etag(status.game_id, status.move_count))
+    finished_status_cache.put(status.game_id, cached)
+    return cached
+
+
+def _status_response(status: GameStatusResponse, if_none_match: Optional[str] = None) -> Response:
+    """JSON response for a game status, with its ETag."""
+    if status.status == "done":
+        cached = _cache_finished_status(status)
+        return _json_response(cached.body, cached.etag, if_none_match, immutable=True)
+    return _json_response(status, _game_etag(status.game_id, status.move_count), if_none_match)
+
+
+def _stage_status(db: AsyncSession, game: Game) -> GameStatusResponse:
+    """A changed game's status, staged on db for the other workers to receive once committed."""
+    status = _game_status(game)
+    backend.stage_status(db, status)
+    return status
+
+
+def _status_committed(status: GameStatusResponse):
+    """Write a game's new state through to the cache and its event stream subscribers."""
+    game_cache.put(status)
+    if status.status == "done":
+        _cache_finished_status(status)
+    hub.publish(status.game_id, status.model_dump())
+
+
+def _remote_status(status: GameStatusResponse):
+    """Apply a state another worker committed, unless this worker already has it or a later one."""
+    if status.game_id in finished_status_cache or not game_cache.put_if_newer(status):
+        return
+    if status.status == "done":
+        _cache_finished_status(status)
+    hub.publish(status.game_id, status.model_dump())
 
 @app.post("/players", response_model=PlayerResponse)
-def register_player(player: PlayerCreate, db: Session = Depends(get_db)):
+async def register_player(player: PlayerCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new player."""
+    await db.connection(execution_options=WRITE_TRANSACTION)
     db_player = Player(name=player.name)
     db.add(db_player)
-    db.commit()
-    db.refresh(db_player)
+    await db.commit()
     return PlayerResponse(player_id=db_player.player_id, name=db_player.name)
 
 
 @app.get("/players/by-name/{name}", response_model=Optional[PlayerResponse])
-def get_player_by_name(name: str, db: Session = Depends(get_db)):
+async def get_player_by_name(name: str, db: AsyncSession = Depends(get_async_db)):
     """Get a player by name (for login)."""
-    player = db.query(Player).filter(Player.name == name).first()
+    player = await db.scalar(select(Player).where(Player.name == name))
     if player:
         return PlayerResponse(player_id=player.player_id, name=player.name)
     return None
 
 
 @app.get("/players/{player_id}/games", response_model=ActiveGamesResponse)
-def get_player_games(player_id: int, db: Session = Depends(get_db)):
+async def get_player_games(player_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get all active games for a player."""
-    games = db.query(Game).filter(
+    games = await db.scalars(select(Game).where(
         Game.status == "progress",
-        ((Game.created_by == player_id) | (Game.opponent == str(player_id)))
-    ).all()
+        ((Game.created_by == player_id) | (Game.opponent_id == player_id))
+    ))
     
-    game_responses = [
-        GameResponse(
-            game_id=game.game_id,
-            created_by=game.created_by,
-            opponent=game.opponent,
-            status=game.status,
-            last_move=game.last_move
-        )
-        for game in games
-    ]
-    
-    return ActiveGamesResponse(games=game_responses)
+    return _json_response(ActiveGamesResponse(games=[_game_response(game) for game in games]))
 
 
 @app.get("/players/{player_id}/history", response_model=AllGamesResponse)
-def get_player_history(player_id: int, db: Session = Depends(get_db)):
-    """Get all games for a player, chronologically ordered."""
-    player = db.query(Player).filter(Player.player_id == player_id).first()
+async def get_player_history(
+    player_id: int,
+    after: Optional[str] = Query(None, pattern=r"^\d+:\d+$"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_HISTORY_PAGE),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get all games for a player, chronologically ordered.
+    
+    Pages with keyset pagination: pass the previous page's next_after as after.
+    The cursor is the last game's created_at and game_id, as games without an
+    initial board all have created_at 0.
+    The ETag is a hash of the body, so a 304 saves the transfer but not the query.
+    """
+    player = await db.get(Player, player_id)
     if not player:
         raise HTTPException(status_code=404, detail="Player not found")
     
-    games = db.query(Game).filter(
-        ((Game.created_by == player_id) | (Game.opponent == str(player_id)))
-    ).all()
-    
-    game_items = []
-    for game in games:
-        first_move = db.query(Move).filter(Move.game_id == game.game_id).order_by(Move.board_id).first()
-        
-        winner = None
-        if game.status == 'done':
-            last_move = db.query(Move).filter(Move.game_id == game.game_id).order_by(Move.board_id.desc()).first()
-            if last_move:
-                winner = check_winner(last_move.board_state)
-        
-        game_items.append(
-            GameHistoryItem(
-                game_id=game.game_id,
-                created_by=game.created_by,
-                opponent=game.opponent,
-                status=game.status,
-                winner=winner,
-                created_at=first_move.move_id if first_move else 0
-            )
+    # created_at is the move_id of the game's initial board, joined in the same query
+    created_at = func.coalesce(Move.move_id, 0).label("created_at")
+    query = select(Game, created_at).outerjoin(
+        Move, (Move.game_id == Game.game_id) & (Move.board_id == 0)
+    ).where(
+        (Game.created_by == player_id) | (Game.opponent_id == player_id)
+    )
+    if after is not None:
+        after_created_at, after_game_id = map(int, after.split(":"))
+        query = query.where(
+            (created_at > after_created_at)
+            | ((created_at == after_created_at) & (Game.game_id > after_game_id))
         )
+    query = query.order_by(created_at, Game.game_id)
+    if limit is not None:
+        query = query.limit(limit)
     
-    game_items.sort(key=lambda x: x.created_at)
+    game_items = [
+        GameHistoryItem(
+            game_id=game.game_id,
+            created_by=game.created_by,
+            opponent=game.opponent,
+            status=game.status,
+            winner=game.winner,
+            created_at=game_created_at
+        )
+        for game, game_created_at in (await db.execute(query)).all()
+    ]
     
-    return AllGamesResponse(games=game_items)
-
+    next_after = None
+    if limit is not None and len(game_items) == limit:
+        next_after = f"{game_items[-1].created_at}:{game_items[-1].game_id}"
+    
+    body = AllGamesResponse(games=game_items, next_after=next_after).model_dump_json().encode()
+    etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+    return _json_response(body, etag, if_none_match)
 
 
-@app.post("/games", response_model=GameResponse)
-def create_game(game: GameCreate, db: Session = Depends(get_db)):
-    """Create a new game."""
-    player = db.query(Player).filter(Player.player_id == game.created_by).first()
-    if not player:
-        raise HTTPException(status_code=404, detail="Player not found")
+async def _create_game(db: AsyncSession, game: GameCreate) -> Game:
+    """Validate and add a game with its initial board on db without committing."""
+    is_ai = game.opponent == "AI"
+    opponent_id = None
+    if not is_ai:
+        if not game.opponent.isdigit():
+            raise HTTPException(status_code=400, detail="Opponent must be \"AI\" or a player ID")
+        opponent_id = int(game.opponent)
+    try:
+        variant = variant_for(game.board_size, game.win_length)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    if game.opponent != "AI":
-        opponent = db.query(Player).filter(Player.player_id == int(game.opponent)).first()
-        if not opponent:
-            raise HTTPException(status_code=404, detail="Opponent not found")
+    # Check both players exist with one query
+    player_ids = {game.created_by} if is_ai else {game.created_by, opponent_id}
+    found = set((await db.scalars(select(Player.player_id).where(Player.player_id.in_(player_ids)))).all())
+    if game.created_by not in found:
+        raise HTTPException(status_code=404, detail="Player not found")
+    if opponent_id is not None and opponent_id not in found:
+        raise HTTPException(status_code=404, detail="Opponent not found")
     
     new_game = Game(
         created_by=game.created_by,
-        opponent=game.opponent,
+        opponent_id=opponent_id,
+        is_ai=is_ai,
         status="progress",
-        last_move=None
+        last_move=None,
+        board_state=variant.empty_board(),
+        move_count=0,
+        board_size=variant.size,
+        win_length=variant.win_length
     )
     db.add(new_game)
-    db.commit()
-    db.refresh(new_game)
+    await db.flush()  # assigns game_id for the initial move
     
-    initial_move = Move(
+    db.add(Move(**move_values(
         game_id=new_game.game_id,
-        to_move="initial",
         board_id=0,
-        board_state=empty_board()
-    )
-    db.add(initial_move)
-    db.commit()
-    
+        to_move="initial",
+        board_state=variant.empty_board()
+    )))
+    await db.flush()
+    return new_game
+
+
+def _game_response(game: Game) -> GameResponse:
+    """Build the response for a newly created game."""
     return GameResponse(
-        game_id=new_game.game_id,
-        created_by=new_game.created_by,
-        opponent=new_game.opponent,
-        status=new_game.status,
-        last_move=new_game.last_move
+        game_id=game.game_id,
+        created_by=game.created_by,
+        opponent=game.opponent,
+        status=game.status,
+        last_move=game.last_move,
+        board_size=game.board_size,
+        win_length=game.win_length
     )
 
 
+@app.post("/games", response_model=GameResponse)
+async def create_game(game: GameCreate, db: AsyncSession = Depends(get_async_db)):
+    """Create a new game.
+    
+    The game row and its initial board are written in one transaction.
+    """
+    await db.connection(execution_options=WRITE_TRANSACTION)
+    new_game = await _create_game(db, game)
+    await db.commit()
+    game_cache.put(_game_status(new_game))
+    return _game_response(new_game)
+
+
+@app.post("/matchmaking/enqueue", response_model=MatchmakingResponse)
+async def enqueue_for_match(request: MatchmakingRequest):
+    """Pair the player with an opponent for a PvP game.
+    
+    The player who has waited longest is matched first and moves first (X);
+    their game is created in one transaction and their waiting request returns
+    it. With nobody waiting, the request joins the queue and is held up to
+    wait seconds (long polling), answering status "timeout" if nobody comes.
+    Sessions are short-lived, so waiting players don't hold connections. The
+    queue is shared by all workers through the state backend.
+    """
+    async with AsyncSessionLocal() as db:
+        if await db.get(Player, request.player_id) is None:
+            raise HTTPException(status_code=404, detail="Player not found")
+    
+    async def create_match_game(db: AsyncSession, created_by: int, opponent_id: int) -> Game:
+        return await _create_game(db, GameCreate(created_by=created_by, opponent=str(opponent_id)))
+    
+    match = await backend.find_match(request.player_id, request.wait, create_match_game)
+    if match is None:
+        return MatchmakingResponse(status="timeout")
+    return MatchmakingResponse(status="matched", **match._asdict())
+
+
+@app.post("/games/batch", response_model=GameBatchResponse)
+async def create_games(batch: GameBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    """Create many games in one transaction.
+    
+    Each game is validated like POST /games and created in its own savepoint,
+    so a rejected game doesn't stop the others. Results are in request order.
+    """
+    if len(batch.games) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} games per batch")
+    
+    await db.connection(execution_options=WRITE_TRANSACTION)
+    results = []
+    created = []
+    for game in batch.games:
+        try:
+            async with db.begin_nested():
+                new_game = await _create_game(db, game)
+        except HTTPException as e:
+            results.append(GameBatchResult(status_code=e.status_code, detail=e.detail))
+        else:
+            created.append(new_game)
+            results.append(GameBatchResult(status_code=200, game=_game_response(new_game)))
+    await db.commit()
+    for new_game in created:
+        game_cache.put(_game_status(new_game))
+    return GameBatchResponse(results=results)
+
+
 @app.get("/games/find", response_model=Optional[GameResponse])
-def find_game(player1: int, player2: int, db: Session = Depends(get_db)):
+async def find_game(player1: int, player2: int, db: AsyncSession = Depends(get_async_db)):
     """Find an existing in-progress game between two players."""
-    game = db.query(Game).filter(
+    game = await db.scalar(select(Game).where(
         Game.status == "progress",
-        ((Game.created_by == player1) & (Game.opponent == str(player2))) |
-        ((Game.created_by == player2) & (Game.opponent == str(player1)))
-    ).first()
+        ((Game.created_by == player1) & (Game.opponent_id == player2)) |
+        ((Game.created_by == player2) & (Game.opponent_id == player1))
+    ).limit(1))
     
     if game:
-        return GameResponse(
-            game_id=game.game_id,
-            created_by=game.created_by,
-            opponent=game.opponent,
-            status=game.status,
-            last_move=game.last_move
-        )
+        return _game_response(game)
     return None
 
 
+async def _load_game_status(game_id: int) -> Optional[GameStatusResponse]:
+    """Read a game's status from the cache, or with a short-lived session on a miss."""
+    status = game_cache.get(game_id)
+    if status is not None and await backend.is_current(status):
+        return status
+    async with AsyncSessionLocal() as db:
+        game = await db.get(Game, game_id)
+        if not game:
+            return None
+        status = _game_status(game)
+    # A move may have committed, and been written through, since the read
+    if not game_cache.put_if_newer(status):
+        return game_cache.get(game_id) or status
+    return status
+
+
 @app.get("/games/{game_id}", response_model=GameStatusResponse)
-def get_game_status(game_id: int, db: Session = Depends(get_db)):
-    """Get current game status including board state and whose turn it is."""
-    game = db.query(Game).filter(Game.game_id == game_id).first()
-    if not game:
+async def get_game_status(
+    game_id: int,
+    since: Optional[int] = None,
+    wait: float = Query(0, ge=0, le=MAX_LONG_POLL_WAIT),
+    if_none_match: Optional[str] = Header(None),
+):
+    """Get current game status including board state and whose turn it is.
+    
+    With since=<move_count> and wait=<seconds>, blocks until the game's move
+    count differs from since or the wait runs out (long polling).
+    
+    Sends an ETag that changes with every move and answers If-None-Match with
+    304 from the cache; finished games are marked immutable.
+    """
+    cached = finished_status_cache.get(game_id)
+    if cached is not None:
+        return _json_response(cached.body, cached.etag, if_none_match, immutable=True)
+    
+    if since is None or wait == 0:
+        status = await _load_game_status(game_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Game not found")
+        return _status_response(status, if_none_match)
+    
+    # Subscribe before reading so a move committed in between isn't missed
+    with hub.subscription(game_id) as queue:
+        status = await _load_game_status(game_id)
+        if status is None:
+            raise HTTPException(status_code=404, detail="Game not found")
+        if status.move_count != since or status.status == "done":
+            return _status_response(status)
+        try:
+            event = await asyncio.wait_for(queue.get(), wait)
+        except asyncio.TimeoutError:
+            return _status_response(status)
+        return _status_response(GameStatusResponse(**event))
+
+
+@app.get("/games/{game_id}/events")
+async def game_events(game_id: int):
+    """Stream game status as Server-Sent Events, one event per committed move.
+    
+    The first event is the current status. The stream ends once the game is done.
+    """
+    # Subscribe before reading so a move committed in between isn't missed
+    queue = hub.subscribe(game_id)
+    status = await _load_game_status(game_id)
+    if status is None:
+        hub.unsubscribe(game_id, queue)
         raise HTTPException(status_code=404, detail="Game not found")
     
-    board = get_current_board(db, game_id)
-    
-    current_turn = None
-    winner = None
-    
-    if game.status == "progress":
-        current_turn = get_current_turn(game, game.last_move)
-    else:
-        winner = check_winner(board)
-    
-    return GameStatusResponse(
-        game_id=game.game_id,
-        created_by=game.created_by,
-        opponent=game.opponent,
-        status=game.status,
-        board_state=board,
-        current_turn=current_turn,
-        winner=winner
-    )
+    async def stream():
+        try:
+            yield f"data: {json.dumps(status.model_dump())}\n\n"
+            if status.status == "done":
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENTS_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+                if event["status"] == "done":
+                    return
+        finally:
+            hub.unsubscribe(game_id, queue)
+    
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 
 @app.get("/games/{game_id}/moves", response_model=MovesHistoryResponse)
-def get_game_moves(game_id: int, db: Session = Depends(get_db)):
-    """Get all moves in a game, chronologically ordered."""
-    game = db.query(Game).filter(Game.game_id == game_id).first()
+async def get_game_moves(
+    game_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Get all moves in a game, chronologically ordered.
+    
+    A finished game's moves never change, so its serialized body is cached.
+    The ETag changes with every move; a matching If-None-Match skips loading the moves.
+    """
+    cached = moves_cache.get(game_id)
+    if cached is not None:
+        return _json_response(cached.body, cached.etag, if_none_match, immutable=True)
+    
+    game = await db.get(Game, game_id)
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
+    done = game.status == "done"
+    etag = _game_etag(game_id, game.move_count)
+    if _etag_matches(if_none_match, etag):
+        return _not_modified(etag, immutable=done)
     
-    moves = db.query(Move).filter(Move.game_id == game_id).order_by(Move.board_id).all()
+    moves = await db.scalars(select(Move).where(Move.game_id == game_id).order_by(Move.board_id))
     
     move_items = [
         MoveHistoryItem(
             move_id=move.move_id,
             move_number=move.board_id,
-            player=move.to_move,
-            board_state=move.board_state
+            player=player,
+            board_state=board
         )
-        for move in moves
+        for move, player, board in replay_moves(game, moves)
     ]
     
-    return MovesHistoryResponse(game_id=game_id, moves=move_items)
+    body = MovesHistoryResponse(game_id=game_id, moves=move_items).model_dump_json().encode()
+    if done:
+        moves_cache.put(game_id, CachedResponse(body, etag))
+    return _json_response(body, etag, immutable=done)
 
 
-@app.post("/moves", response_model=MoveResponse)
-def make_move(move: MoveCreate, db: Session = Depends(get_db)):
-    """Make a move in a game."""
-    if move.row < 0 or move.row > 2 or move.col < 0 or move.col > 2:
-        raise HTTPException(status_code=400, detail="Invalid coordinates")
-    
-    game = db.query(Game).filter(Game.game_id == move.game_id).first()
+async def _prune_idempotency_keys() -> int:
+    """Delete saved Idempotency-Key responses older than IDEMPOTENCY_KEY_TTL; returns how many."""
+    async with AsyncSessionLocal() as db:
+        await db.connection(execution_options=WRITE_TRANSACTION)
+        result = await db.execute(
+            delete(IdempotencyKey).where(IdempotencyKey.created_at < time.time() - IDEMPOTENCY_KEY_TTL)
+        )
+        await db.commit()
+    return result.rowcount
+
+
+async def _prune_idempotency_keys_periodically():
+    """Prune old Idempotency-Keys at startup and every IDEMPOTENCY_PRUNE_INTERVAL seconds after."""
+    while True:
+        try:
+            await _prune_idempotency_keys()
+        except Exception:
+            logger.exception("pruning Idempotency-Keys failed")
+        await asyncio.sleep(IDEMPOTENCY_PRUNE_INTERVAL)
+
+
+async def _flush_idempotency_key(db: AsyncSession):
+    """Save a move's Idempotency-Key, turning a concurrent request with the same key into 409 Conflict.
+
+    Runs after the move itself was flushed, so a conflict here is the key,
+    not the game.
+    """
+    try:
+        await db.flush()
+    except IntegrityError:
+        raise HTTPException(
+            status_code=409,
+            detail="Another request with this Idempotency-Key is in progress; retry to get its response",
+        )
+
+
+def _replay(request: str, saved_request: str, body: str) -> Response:
+    """The saved response for a retried Idempotency-Key, if the retry is the same move."""
+    if request != saved_request:
+        raise HTTPException(status_code=422, detail="Idempotency-Key was already used for a different move")
+    response = _json_response(body)
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+async def _flush_move(db: AsyncSession):
+    """Write a move, turning a lost race with another writer into 409 Conflict.
+
+    The game's UPDATE only applies to the version that was read, and move
+    numbers are unique per game, so a move based on a stale copy of the game
+    fails here instead of overwriting the newer state.
+    """
+    try:
+        await db.flush()
+    except (StaleDataError, IntegrityError):
+        raise HTTPException(status_code=409, detail="The game was changed by another request; reload it and retry")
+
+
+async def _plan_ai_reply(move: MoveCreate) -> Optional[tuple[str, int]]:
+    """Search the AI's reply to a move on a larger board, before any write transaction starts.
+    
+    The search takes up to AI_TIME_BUDGET_MS, so it runs in the search pool
+    without holding the database's write lock. Returns (board after the
+    player's move, AI's board index), or None if there's nothing to search.
+    _apply_move still validates the move and only uses the reply if the board
+    it was searched for is the one it plays on.
+    
+    Only the game state cache is looked at, so PvP and 3x3 moves cost nothing
+    extra; a game that isn't cached gets the quick heuristic for this move.
+    """
+    if ai_search.workers == 0:
+        return None
+    status = game_cache.peek(move.game_id)
+    if status is None or status.opponent != "AI" or status.current_turn != str(move.player_id):
+        return None
+    variant = Variant(status.board_size, status.win_length)
+    if variant == STANDARD or not variant.contains(move.row, move.col):
+        return None
+    cell = variant.position(move.row, move.col)
+    if status.board_state[cell] != '.':
+        return None
+    board = status.board_state[:cell] + 'X' + status.board_state[cell + 1:]
+    if variant.winner_after(board, cell, status.move_count + 1) is not None:
+        return None
+    reply = await ai_search.best_move(board, variant)
+    return None if reply is None else (board, reply)
+
+
+async def _apply_move(db: AsyncSession, move: MoveCreate,
+                      ai_reply: Optional[tuple[str, int]] = None) -> tuple[MoveResponse, Game]:
+    """Validate and apply a move (and the AI's reply) on db without committing.
+    
+    ai_reply is a reply from _plan_ai_reply; without one, or if the board
+    changed since, the AI plays ai_make_move.
+    """
+    game = await db.get(Game, move.game_id)
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
     
+    variant = get_variant(game)
+    if not variant.contains(move.row, move.col):
+        raise HTTPException(status_code=400, detail="Invalid coordinates")
+    
     if game.status == 'done':
         raise HTTPException(status_code=400, detail="Game is already complete")
     
-    board = get_current_board(db, move.game_id)
+    board = game.board_state
     
     current_turn = get_current_turn(game, game.last_move)
     
@@ -235,92 +700,248 @@ def make_move(move: MoveCreate, db: Session = Depends(get_db)):
         symbol = 'O'  # Opponent is always O
     
     try:
-        new_board = make_move_on_board(board, move.row, move.col, symbol)
+        new_board = make_move_on_board(board, move.row, move.col, symbol, variant.size)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     
-    winner = check_winner(new_board)
+    cell = variant.position(move.row, move.col)
+    game.move_count += 1
+    winner = check_winner_after(new_board, cell, variant, game.move_count)
     is_done = winner is not None
     
-    move_count = db.query(Move).filter(Move.game_id == move.game_id).count()
-    new_move = Move(
+    new_move = Move(**move_values(
         game_id=move.game_id,
+        board_id=game.move_count,
         to_move=current_turn,
-        board_id=move_count,
-        board_state=new_board
-    )
+        board_state=new_board,
+        cell=cell
+    ))
     db.add(new_move)
     
     game.last_move = int(current_turn)
+    game.board_state = new_board
     if is_done:
         game.status = 'done'
+        game.winner = winner
     
-    db.commit()
-    
-    if is_done:
+    if is_done or not game.is_ai:
+        await _flush_move(db)
         return MoveResponse(
             move_id=new_move.move_id,
             game_id=move.game_id,
             board_state=new_board,
             to_move=current_turn,
-            game_status="done",
-            winner=winner if winner != 'TIE' else None
-        )
-    
-    if game.opponent == "AI":
-        ai_row, ai_col = ai_make_move(new_board)
-        ai_symbol = 'O'
-        try:
-            ai_board = make_move_on_board(new_board, ai_row, ai_col, ai_symbol)
-        except ValueError as e:
-            raise HTTPException(status_code=500, detail=f"AI error: {str(e)}")
-        
-        # Check winner after AI move
-        winner = check_winner(ai_board)
-        is_done = winner is not None
-        
-        # Save AI move
-        move_count = db.query(Move).filter(Move.game_id == move.game_id).count()
-        ai_move = Move(
-            game_id=move.game_id,
-            to_move="AI",
-            board_id=move_count,
-            board_state=ai_board
-        )
-        db.add(ai_move)
-        
-        # Update game status
-        game.last_move = None  # AI doesn't have a player_id
-        if is_done:
-            game.status = 'done'
-        
-        db.commit()
-        
-        return MoveResponse(
-            move_id=ai_move.move_id,
-            game_id=move.game_id,
-            board_state=ai_board,
-            to_move="AI",
-            game_status="done" if is_done else "progress",
+            game_status=game.status,
             winner=winner if is_done and winner != 'TIE' else None
-        )
+        ), game
+    
+    if ai_reply is not None and ai_reply[0] == new_board:
+        ai_row, ai_col = divmod(ai_reply[1], variant.size)
     else:
-        return MoveResponse(
-            move_id=new_move.move_id,
-            game_id=move.game_id,
-            board_state=new_board,
-            to_move=current_turn,
-            game_status="progress",
-            winner=None
-        )
+        ai_row, ai_col = ai_make_move(new_board, variant)
+    ai_symbol = 'O'
+    try:
+        ai_board = make_move_on_board(new_board, ai_row, ai_col, ai_symbol, variant.size)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=f"AI error: {str(e)}")
+    
+    # Check winner after AI move
+    ai_cell = variant.position(ai_row, ai_col)
+    game.move_count += 1
+    winner = check_winner_after(ai_board, ai_cell, variant, game.move_count)
+    is_done = winner is not None
+    
+    # Save AI move
+    ai_move = Move(**move_values(
+        game_id=move.game_id,
+        board_id=game.move_count,
+        to_move="AI",
+        board_state=ai_board,
+        cell=ai_cell
+    ))
+    db.add(ai_move)
+    
+    # Update game status
+    game.last_move = None  # AI doesn't have a player_id
+    game.board_state = ai_board
+    if is_done:
+        game.status = 'done'
+        game.winner = winner
+    
+    await _flush_move(db)
+    return MoveResponse(
+        move_id=ai_move.move_id,
+        game_id=move.game_id,
+        board_state=ai_board,
+        to_move="AI",
+        game_status="done" if is_done else "progress",
+        winner=winner if is_done and winner != 'TIE' else None
+    ), game
+
+
+@app.post("/moves", response_model=MoveResponse)
+async def make_move(
+    move: MoveCreate,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Make a move in a game.
+    
+    Against the AI, the human move and the AI reply are saved in one transaction.
+    On boards larger than 3x3 the reply is searched before it starts.
+    With GROUP_COMMIT=1 the transaction is shared with other requests' moves.
+    
+    With an Idempotency-Key header, the response is saved along with the move,
+    and a retry with the same key gets it back (with Idempotent-Replayed: true)
+    instead of being applied again. Recent keys are answered from memory.
+    """
+    request = move.model_dump_json()
+    key = f"{move.player_id}:{idempotency_key}" if idempotency_key else None
+    if key is not None:
+        stored = idempotency_cache.get(key)
+        if stored is not None:
+            return _replay(request, *stored)
+    ai_reply = await _plan_ai_reply(move)
+    
+    async def apply(db: AsyncSession) -> tuple[str, str, Optional[GameStatusResponse]]:
+        """The request and response JSON saved for the move, and the game's new status unless it's a replay."""
+        if key is not None:
+            saved = await db.get(IdempotencyKey, key)
+            if saved is not None:
+                return saved.request, saved.response, None
+        response, game = await _apply_move(db, move, ai_reply)
+        body = response.model_dump_json()
+        if key is not None:
+            db.add(IdempotencyKey(key=key, request=request, response=body, created_at=time.time()))
+            await _flush_idempotency_key(db)
+        return request, body, _stage_status(db, game)
+    
+    if group_writer is not None:
+        saved_request, body, status = await group_writer.submit(apply)
+    else:
+        await db.connection(execution_options=WRITE_TRANSACTION)
+        saved_request, body, status = await apply(db)
+        await db.commit()
+    if key is not None:
+        idempotency_cache.put(key, saved_request, body)
+    if status is None:
+        return _replay(request, saved_request, body)
+    _status_committed(status)
+    return _json_response(body)
+
+
+@app.post("/moves/batch", response_model=MoveBatchResponse)
+async def make_moves(batch: MoveBatchRequest, db: AsyncSession = Depends(get_async_db)):
+    """Make many moves, across any number of games, in one transaction.
+    
+    Moves are applied in order, each validated like POST /moves and run in its
+    own savepoint, so a rejected move doesn't undo the others. A later move can
+    build on an earlier one in the same batch. Results are in request order.
+    """
+    if len(batch.moves) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} moves per batch")
+    
+    await db.connection(execution_options=WRITE_TRANSACTION)
+    results = []
+    changed = {}
+    for move in batch.moves:
+        try:
+            async with db.begin_nested():
+                response, game = await _apply_move(db, move)
+        except HTTPException as e:
+            results.append(MoveBatchResult(status_code=e.status_code, detail=e.detail))
+        else:
+            changed[game.game_id] = game
+            results.append(MoveBatchResult(status_code=200, move=response))
+    statuses = [_stage_status(db, game) for game in changed.values()]
+    await db.commit()
+    for status in statuses:
+        _status_committed(status)
+    return MoveBatchResponse(results=results)
+
+
+@app.get("/stats")
+async def get_stats():
+    """Internal counters for monitoring."""
+    return {
+        "game_cache": game_cache.stats(),
+        "finished_status_cache": finished_status_cache.stats(),
+        "moves_cache": moves_cache.stats(),
+        "idempotency_cache": idempotency_cache.stats(),
+        "ai_search": ai_search.stats(),
+        "matchmaking": await backend.matchmaking_stats(),
+    }
 
 
 @app.get("/")
-def root():
+async def root():
     """Root endpoint."""
     return {"message": "Tic Tac Toe API"}
 
 
+def _serve_worker(config, sock):
+    """One worker process of _run_workers: serve config's app on the shared socket."""
+    import uvicorn
+    
+    config.configure_logging()
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def _run_workers(host: str, port: int, workers: int):
+    """Serve main:app from several uvicorn worker processes sharing one listening socket.
+    
+    Like uvicorn.run(..., workers=N), except that the socket is created with
+    IPPROTO_TCP. asyncio only sets TCP_NODELAY on connections accepted from a
+    TCP-proto socket, and uvicorn's own socket leaves proto at 0, so responses on
+    kept-alive connections waited about 40ms on Nagle's algorithm.
+    Only public uvicorn APIs are used (Server.run with sockets), so this
+    doesn't depend on uvicorn's process supervisor, whose signature changes
+    between versions. Unlike it, a worker that dies isn't restarted.
+    SIGTERM or SIGINT stops every worker.
+    Each worker imports main itself; the tables were created above, before any of them start.
+    """
+    import multiprocessing
+    import signal
+    import socket
+    import uvicorn
+    
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+    config = uvicorn.Config("main:app", host=host, port=port)
+    # spawn, like uvicorn, so each worker starts without this process's threads
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=_serve_worker, args=(config, sock)) for _ in range(workers)]
+    
+    def stop(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+    
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    
+    parser = argparse.ArgumentParser(description="Run the Tic Tac Toe API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="server processes; more than one share state with STATE_BACKEND=sqlite")
+    args = parser.parse_args()
+    
+    if args.workers == 1:
+        uvicorn.run(app, host=args.host, port=args.port)
+    else:
+        if os.environ.setdefault("STATE_BACKEND", "sqlite") != "sqlite":
+            parser.error("--workers needs STATE_BACKEND=sqlite")
+        _run_workers(args.host, args.port, args.workers)
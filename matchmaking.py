@@ -0,0 +1,98 @@
+"""In-process matchmaking queue that pairs players looking for a PvP game."""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+
+class Match(NamedTuple):
+    """A player's side of a new matched game."""
+    game_id: int
+    opponent_id: int
+    symbol: str  # 'X' for the player who waited, who moves first
+
+
+class MatchmakingQueue:
+    """FIFO queue of players waiting for an opponent.
+
+    Each waiting player holds a future that is resolved with their Match when
+    a newcomer pairs with them, or with None when they stop waiting, so
+    pairing is a pop from the front of an OrderedDict. Used from the event
+    loop only, so there's no locking; each server process has its own queue.
+    """
+
+    def __init__(self):
+        self._waiting: "OrderedDict[int, Tuple[asyncio.Future, float]]" = OrderedDict()
+        # Players taken from the queue whose game is being created
+        self._pairing: Dict[int, asyncio.Future] = {}
+        self.enqueued = 0
+        self.matched = 0
+        self.timed_out = 0
+        self._matched_wait = 0.0
+
+    def pop_partner(self, player_id: int) -> Optional[int]:
+        """Take the longest waiting player other than player_id, if any.
+
+        None too if player_id is already being matched, so they don't get two games.
+        """
+        if player_id in self._pairing:
+            return None
+        for partner_id in self._waiting:  # player_id can only be first, so at most two steps
+            if partner_id != player_id:
+                future, since = self._waiting.pop(partner_id)
+                self._matched_wait += time.monotonic() - since
+                self._pairing[partner_id] = future
+                return partner_id
+        return None
+
+    def requeue(self, player_id: int):
+        """Put a popped player back at the front, e.g. when their game couldn't be created."""
+        future = self._pairing.pop(player_id)
+        self._waiting[player_id] = (future, time.monotonic())
+        self._waiting.move_to_end(player_id, last=False)
+
+    def join(self, player_id: int) -> asyncio.Future:
+        """Start waiting at the back, or share the future of a player already waiting."""
+        if player_id in self._pairing:
+            return self._pairing[player_id]
+        entry = self._waiting.get(player_id)
+        if entry is not None:
+            return entry[0]
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[player_id] = (future, time.monotonic())
+        self.enqueued += 1
+        return future
+
+    def leave(self, player_id: int) -> bool:
+        """Stop waiting. False if a match is being made for the player, who should wait for it."""
+        entry = self._waiting.pop(player_id, None)
+        if entry is not None:
+            self.timed_out += 1
+            if not entry[0].done():
+                entry[0].set_result(None)  # for other requests sharing the future
+            return True
+        return player_id not in self._pairing
+
+    def resolve(self, player_id: int, match: Match):
+        """Hand a popped player their match."""
+        future = self._pairing.pop(player_id)
+        self.matched += 1
+        if not future.done():
+            future.set_result(match)
+
+    def __len__(self) -> int:
+        return len(self._waiting)
+
+    def stats(self) -> dict:
+        oldest = next(iter(self._waiting.values()), None)
+        return {
+            "depth": len(self._waiting),
+            "enqueued": self.enqueued,
+            "matched": self.matched,
+            "timed_out": self.timed_out,
+            "avg_wait_seconds": self._matched_wait / self.matched if self.matched else 0.0,
+            "oldest_wait_seconds": time.monotonic() - oldest[1] if oldest else 0.0,
+        }
+
+
+matchmaking = MatchmakingQueue()
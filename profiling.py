@@ -0,0 +1,239 @@
+"""Opt-in request profiling: per-route timings, DB queries and game logic time.
+
+ProfilingMiddleware wraps the ASGI app and records, for each request, its wall
+time, the number and duration of DB queries it ran, and the time spent in
+game_logic functions. Totals per route are served as Prometheus text on
+/metrics. Requests slower than slow_ms are logged, and a request sent with the
+X-Profile header is run under cProfile with the stats dumped to profile_dir.
+
+Numbers are attributed through a context variable, so work done on another
+task, such as moves committed by the group commit writer, isn't counted
+against the request.
+"""
+import cProfile
+import functools
+import logging
+import os
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+from starlette.routing import Match
+
+logger = logging.getLogger("profiling")
+
+PROFILE_HEADER = b"x-profile"
+# Upper bounds of the request duration histogram, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@dataclass
+class RequestStats:
+    """What one request spent its time on."""
+    db_queries: int = 0
+    db_seconds: float = 0.0
+    logic_seconds: float = 0.0
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("profiling_request", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault("profiling_query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    starts = conn.info.get("profiling_query_start")
+    if stats is not None and starts:
+        stats.db_queries += 1
+        stats.db_seconds += time.perf_counter() - starts.pop()
+
+
+def instrument_engine(sync_engine):
+    """Count query time on an engine against the current request (idempotent)."""
+    if not event.contains(sync_engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def timed_logic(func):
+    """Wrap a game_logic function so its time counts against the current request."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stats = _current.get()
+        if stats is None:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats.logic_seconds += time.perf_counter() - start
+    wrapper.profiling_timed = True
+    return wrapper
+
+
+def instrument_game_logic(module):
+    """Replace the game_logic functions a module imported with timed wrappers."""
+    for name, value in vars(module).items():
+        if callable(value) and getattr(value, "__module__", None) == "game_logic" \
+                and not getattr(value, "profiling_timed", False):
+            setattr(module, name, timed_logic(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class RouteMetrics:
+    """Totals per (method, route), rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._routes = {}
+        self._statuses = {}
+
+    def observe(self, method: str, route: str, status: int, seconds: float, stats: RequestStats):
+        key = (method, route)
+        totals = self._routes.get(key)
+        if totals is None:
+            totals = self._routes[key] = {
+                "count": 0, "seconds": 0.0, "buckets": [0] * len(DURATION_BUCKETS),
+                "db_queries": 0, "db_seconds": 0.0, "logic_seconds": 0.0,
+            }
+        totals["count"] += 1
+        totals["seconds"] += seconds
+        for i, bound in enumerate(DURATION_BUCKETS):
+            if seconds <= bound:
+                totals["buckets"][i] += 1
+        totals["db_queries"] += stats.db_queries
+        totals["db_seconds"] += stats.db_seconds
+        totals["logic_seconds"] += stats.logic_seconds
+        status_key = (method, route, status)
+        self._statuses[status_key] = self._statuses.get(status_key, 0) + 1
+
+    def render(self) -> str:
+        lines = [
+            "# HELP http_requests_total Requests handled, by route and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        for (method, route, status), count in sorted(self._statuses.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{_escape(route)}",status="{status}"}} {count}')
+
+        lines += [
+            "# HELP http_request_duration_seconds Wall time per request.",
+            "# TYPE http_request_duration_seconds histogram",
+        ]
+        for (method, route), totals in sorted(self._routes.items()):
+            labels = f'method="{method}",route="{_escape(route)}"'
+            for bound, count in zip(DURATION_BUCKETS, totals["buckets"]):
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {totals["count"]}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {totals["seconds"]}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {totals["count"]}')
+
+        for name, key, help_text in (
+            ("http_request_db_queries_total", "db_queries", "DB queries run by requests."),
+            ("http_request_db_seconds_total", "db_seconds", "Time requests spent in DB queries."),
+            ("http_request_game_logic_seconds_total", "logic_seconds", "Time requests spent in game_logic."),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for (method, route), totals in sorted(self._routes.items()):
+                lines.append(f'{name}{{method="{method}",route="{_escape(route)}"}} {totals[key]}')
+        return "\n".join(lines) + "\n"
+
+
+metrics = RouteMetrics()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that records RequestStats per route and serves /metrics."""
+
+    def __init__(self, app, metrics: RouteMetrics = metrics, engine=None,
+                 slow_ms: float = 500.0, profile_dir: Optional[str] = None):
+        self.app = app
+        self.metrics = metrics
+        self.slow_ms = slow_ms
+        self.profile_dir = profile_dir
+        self._profiling = False
+        if engine is not None:
+            instrument_engine(engine)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if scope["path"] == "/metrics":
+            await self._serve_metrics(send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        profiler = None
+        if self.profile_dir is not None and not self._profiling \
+                and any(name == PROFILE_HEADER for name, _ in scope.get("headers", ())):
+            profiler = cProfile.Profile()
+            self._profiling = True
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+            _current.reset(token)
+            route = self._route_path(scope)
+            self.metrics.observe(scope["method"], route, status, elapsed, stats)
+            if elapsed * 1000 >= self.slow_ms:
+                logger.warning(
+                    "slow request %s %s: %.1f ms (%d queries, %.1f ms db, %.1f ms game logic)",
+                    scope["method"], scope["path"], elapsed * 1000,
+                    stats.db_queries, stats.db_seconds * 1000, stats.logic_seconds * 1000,
+                )
+            if profiler is not None:
+                self._dump_profile(profiler, scope["method"], route)
+
+    def _route_path(self, scope) -> str:
+        """The matched route's path template, so /games/1 and /games/2 share a label."""
+        route = scope.get("route")
+        if route is not None and hasattr(route, "path"):
+            return route.path
+        router = getattr(scope.get("app"), "router", None)
+        for candidate in getattr(router, "routes", ()):
+            match, _ = candidate.matches(scope)
+            if match == Match.FULL:
+                return candidate.path
+        return "unmatched"
+
+    def _dump_profile(self, profiler, method, route):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        slug = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+        path = os.path.join(self.profile_dir, f"{int(time.time() * 1000)}-{method}-{slug}.prof")
+        profiler.dump_stats(path)
+        logger.info("wrote profile %s", path)
+
+    async def _serve_metrics(self, send):
+        body = self.metrics.render().encode()
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/plain; version=0.0.4; charset=utf-8"),
+                (b"content-length", str(len(body)).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -1,7 +1,9 @@
 """Pydantic schemas for API request/response models."""
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 
+from variants import MAX_SIZE, MIN_SIZE
+
 
 class PlayerCreate(BaseModel):
     """Player creation request."""
@@ -18,6 +20,8 @@ class GameCreate(BaseModel):
     """Game creation request."""
     created_by: int
     opponent: str  # "AI" or player_id
+    board_size: int = Field(3, ge=MIN_SIZE, le=MAX_SIZE)
+    win_length: Optional[int] = None  # in a row to win, default the board size up to 5
 
 
 class GameResponse(BaseModel):
@@ -27,6 +31,8 @@ class GameResponse(BaseModel):
     opponent: str
     status: str
     last_move: Optional[int] = None
+    board_size: int = 3
+    win_length: int = 3
 
 
 class MoveCreate(BaseModel):
@@ -54,8 +60,11 @@ class GameStatusResponse(BaseModel):
     opponent: str
     status: str
     board_state: str
+    move_count: int = 0  # changes with every move, usable as a version for long polling
     current_turn: Optional[str] = None
     winner: Optional[str] = None
+    board_size: int = 3
+    win_length: int = 3
 
 
 class ActiveGamesResponse(BaseModel):
@@ -90,4 +99,52 @@ class GameHistoryItem(BaseModel):
 class AllGamesResponse(BaseModel):
     """All games response."""
     games: List[GameHistoryItem]
+    next_after: Optional[str] = None  # "created_at:game_id" cursor for after=, None on the last page
+
+
+class MoveBatchRequest(BaseModel):
+    """Batch of moves, applied in order."""
+    moves: List[MoveCreate]
+
+
+class MoveBatchResult(BaseModel):
+    """Outcome of one move in a batch."""
+    status_code: int  # what POST /moves would have returned
+    move: Optional[MoveResponse] = None
+    detail: Optional[str] = None  # error message when status_code isn't 200
+
+
+class MoveBatchResponse(BaseModel):
+    """Batch move response, one result per requested move."""
+    results: List[MoveBatchResult]
+
+
+class GameBatchRequest(BaseModel):
+    """Batch of games to create."""
+    games: List[GameCreate]
 
+
+class GameBatchResult(BaseModel):
+    """Outcome of one game in a batch."""
+    status_code: int  # what POST /games would have returned
+    game: Optional[GameResponse] = None
+    detail: Optional[str] = None  # error message when status_code isn't 200
+
+
+class GameBatchResponse(BaseModel):
+    """Batch game creation response, one result per requested game."""
+    results: List[GameBatchResult]
+
+
+class MatchmakingRequest(BaseModel):
+    """Request to be paired with a PvP opponent."""
+    player_id: int
+    wait: float = Field(30, ge=0, le=60)  # seconds to wait for an opponent
+
+
+class MatchmakingResponse(BaseModel):
+    """Matchmaking outcome: "matched" with the new game, or "timeout"."""
+    status: str
+    game_id: Optional[int] = None
+    opponent_id: Optional[int] = None
+    symbol: Optional[str] = None  # 'X' moves first
@@ -0,0 +1,386 @@
+"""Alpha-beta search AI for boards larger than 3x3.
+
+search_move runs iterative deepening negamax with alpha-beta pruning over
+the board, deepening one ply at a time until its time budget runs out and
+answering with the best move of the deepest finished iteration. Positions
+are Zobrist-hashed into a transposition table that is kept between searches
+in the same process, so the next move's search starts from what this one
+learned.
+
+Candidate moves are the empty cells within two of a stone. They are ordered
+by the transposition table's best move, then by how much each would add to
+either side's lines; only the best MAX_WIDTH are searched. A side that can
+win plays the win, and one facing a win only looks at blocking it.
+
+The evaluation scores every run of win_length cells holding stones of one
+side only, updated incrementally as stones are placed. Each move touches
+4 * win_length windows.
+
+SearchPool runs searches in worker processes, so a search never holds up the
+event loop, and it collects nodes/sec and hit-rate stats.
+"""
+import asyncio
+import multiprocessing
+import random
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from variants import DIRECTIONS, Variant
+
+WIN = 1 << 64  # beyond any evaluation; a win at ply p scores WIN - p
+# Most candidate moves searched at each node, best ordered first
+MAX_WIDTH = 12
+# Transposition table entries kept per variant before it is cleared
+MAX_TT_ENTRIES = 1_000_000
+
+# Above any sum of WINs from the windows through one cell
+OWN_WIN = WIN << 8
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class SearchResult(NamedTuple):
+    """Outcome of one search_move call."""
+    move: Optional[int]  # board index, None if the board is full
+    value: int  # for the side to move; beyond WIN - 1000 is a forced win
+    depth: int  # deepest iteration finished
+    nodes: int
+    tt_probes: int
+    tt_hits: int
+    seconds: float
+
+
+class _Geometry(NamedTuple):
+    through: Tuple[Tuple[int, ...], ...]  # per cell, the windows (runs of win_length cells) it's in
+    window_count: int
+    near: Tuple[Tuple[int, ...], ...]  # per cell, the cells within two
+    zobrist: Tuple[Tuple[int, int], ...]  # per cell, random keys for X and O
+    # Indexed by a window's code, x + o * (win_length + 1) for its stone counts:
+    score: Tuple[int, ...]  # the window's evaluation for X
+    # Per side to move, what a stone there is worth to either side: its rank
+    # as a move, plus WIN if the opponent would complete the window, or
+    # OWN_WIN if the side to move would
+    rank: Tuple[Tuple[int, ...], Tuple[int, ...]]
+
+
+@lru_cache(maxsize=None)
+def _geometry(variant: Variant) -> _Geometry:
+    size, k = variant.size, variant.win_length
+    windows = []
+    for row in range(size):
+        for col in range(size):
+            for dr, dc in DIRECTIONS:
+                if variant.contains(row + dr * (k - 1), col + dc * (k - 1)):
+                    windows.append([variant.position(row + dr * i, col + dc * i) for i in range(k)])
+    through = [[] for _ in range(variant.cells)]
+    for i, window in enumerate(windows):
+        for cell in window:
+            through[cell].append(i)
+    near = tuple(
+        tuple(variant.position(r, c)
+              for r in range(max(row - 2, 0), min(row + 3, size))
+              for c in range(max(col - 2, 0), min(col + 3, size))
+              if (r, c) != (row, col))
+        for row, col in (divmod(cell, size) for cell in range(variant.cells))
+    )
+    # Seeded so every worker process hashes positions the same way
+    rng = random.Random(variant.size * 100 + variant.win_length)
+    zobrist = tuple((rng.getrandbits(64), rng.getrandbits(64)) for _ in range(variant.cells))
+
+    # A window with n stones of one side only is worth 8^(n-1) to that side
+    weights = (0,) + tuple(8 ** n for n in range(k - 1))
+    codes = [(x, o) for o in range(k + 1) for x in range(k + 1)]
+    score = tuple(0 if x and o or x == k or o == k else weights[x] - weights[o] for x, o in codes)
+
+    def gain(mine: int, theirs: int, win: int) -> int:
+        """What a stone is worth to the side with mine stones in the window."""
+        if theirs or mine >= k:
+            return 0
+        if mine + 1 == k:
+            return win
+        return weights[mine + 1] - weights[mine]
+
+    rank = (
+        tuple(gain(x, o, OWN_WIN) + gain(o, x, WIN) for x, o in codes),
+        tuple(gain(o, x, OWN_WIN) + gain(x, o, WIN) for x, o in codes),
+    )
+    return _Geometry(tuple(map(tuple, through)), len(windows), near, zobrist, score, rank)
+
+
+# Transposition tables of this process, per variant: hash -> (depth, value, flag, best move)
+_tables: Dict[Variant, Dict[int, Tuple[int, int, int, Optional[int]]]] = {}
+
+
+class _Timeout(Exception):
+    pass
+
+
+class _Search:
+    """State of one search: the board, its running evaluation and hash, and counters."""
+
+    def __init__(self, board: str, variant: Variant, deadline: float):
+        geometry = _geometry(variant)
+        self.through = geometry.through
+        self.near = geometry.near
+        self.zobrist = geometry.zobrist
+        self.window_score = geometry.score
+        self.rank = geometry.rank
+        # Added to a window's code for a stone of X (piece 1) or O (piece 2)
+        self.steps = (0, 1, variant.win_length + 1)
+        self.cells = [0] * variant.cells  # 0 empty, 1 X, 2 O
+        self.codes = [0] * geometry.window_count
+        self.score = 0  # for X
+        self.hash = 0
+        self.stones = []
+        # Empty or not, the cells within two of a stone, with how many stones they're near
+        self.frontier = set()
+        self.near_count = [0] * variant.cells
+        for cell, symbol in enumerate(board):
+            if symbol != '.':
+                self.place(cell, 1 if symbol == 'X' else 2)
+        table = _tables.setdefault(variant, {})
+        if len(table) > MAX_TT_ENTRIES:
+            table.clear()
+        self.table = table
+        self.deadline = deadline
+        self.nodes = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+
+    def place(self, cell: int, piece: int):
+        codes, window_score, step = self.codes, self.window_score, self.steps[piece]
+        for w in self.through[cell]:
+            code = codes[w]
+            self.score += window_score[code + step] - window_score[code]
+            codes[w] = code + step
+        self.cells[cell] = piece
+        self.hash ^= self.zobrist[cell][piece - 1]
+        self.stones.append(cell)
+        near_count = self.near_count
+        for other in self.near[cell]:
+            if not near_count[other]:
+                self.frontier.add(other)
+            near_count[other] += 1
+
+    def remove(self, cell: int, piece: int):
+        codes, window_score, step = self.codes, self.window_score, self.steps[piece]
+        for w in self.through[cell]:
+            code = codes[w]
+            self.score += window_score[code - step] - window_score[code]
+            codes[w] = code - step
+        self.cells[cell] = 0
+        self.hash ^= self.zobrist[cell][piece - 1]
+        self.stones.pop()
+        near_count = self.near_count
+        for other in self.near[cell]:
+            near_count[other] -= 1
+            if not near_count[other]:
+                self.frontier.discard(other)
+
+    def candidates(self, piece: int, first: Optional[int]) -> Tuple[List[int], Optional[int]]:
+        """Moves to search in order, and a winning move for piece if it has one."""
+        cells = self.cells
+        if not self.stones:
+            return [len(cells) // 2], None
+        empty = [cell for cell in self.frontier if not cells[cell]]
+        if not empty:  # the stones' surroundings are full
+            empty = [cell for cell, occupied in enumerate(cells) if not occupied]
+        rank, codes, through = self.rank[piece - 1].__getitem__, self.codes.__getitem__, self.through
+        ranked = []
+        blocks = []
+        for cell in empty:
+            value = sum(map(rank, map(codes, through[cell])))
+            if value >= OWN_WIN:
+                return [cell], cell
+            if value >= WIN:
+                blocks.append(cell)
+            ranked.append((value, cell))
+        if blocks:
+            return blocks, None
+        ranked.sort(reverse=True)
+        moves = [cell for _, cell in ranked[:MAX_WIDTH]]
+        if first is not None and not cells[first] and first in self.frontier:
+            if first in moves:
+                moves.remove(first)
+            moves.insert(0, first)
+        return moves, None
+
+    def negamax(self, depth: int, alpha: int, beta: int, piece: int, ply: int) -> int:
+        self.nodes += 1
+        if time.perf_counter() > self.deadline:
+            raise _Timeout
+        if len(self.stones) == len(self.cells):
+            return 0
+        if depth == 0:
+            return self.score if piece == 1 else -self.score
+
+        alpha_start = alpha
+        self.tt_probes += 1
+        entry = self.table.get(self.hash)
+        first = None
+        if entry is not None:
+            self.tt_hits += 1
+            entry_depth, value, flag, first = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                elif flag == UPPER:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+
+        moves, winning = self.candidates(piece, first)
+        if winning is not None:
+            return WIN - ply
+        best_value = -WIN
+        best_move = moves[0]
+        for cell in moves:
+            self.place(cell, piece)
+            try:
+                value = -self.negamax(depth - 1, -beta, -alpha, 3 - piece, ply + 1)
+            finally:
+                self.remove(cell, piece)
+            if value > best_value:
+                best_value, best_move = value, cell
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        flag = UPPER if best_value <= alpha_start else LOWER if best_value >= beta else EXACT
+        self.table[self.hash] = (depth, best_value, flag, best_move)
+        return best_value
+
+    def root(self, depth: int, piece: int, first: Optional[int]) -> Tuple[int, int]:
+        """Best (value, move) searching depth plies."""
+        moves, winning = self.candidates(piece, first)
+        if winning is not None:
+            return WIN, winning
+        alpha, beta = -WIN - 1, WIN + 1
+        best_move = moves[0]
+        for cell in moves:
+            self.place(cell, piece)
+            try:
+                value = -self.negamax(depth - 1, -beta, -alpha, 3 - piece, 1)
+            finally:
+                self.remove(cell, piece)
+            if value > alpha:
+                alpha, best_move = value, cell
+        self.table[self.hash] = (depth, alpha, EXACT, best_move)
+        return alpha, best_move
+
+
+def search_move(board: str, size: int, win_length: int, symbol: str = 'O',
+                time_budget: float = 0.2, max_depth: Optional[int] = None) -> SearchResult:
+    """Best move for symbol found within time_budget seconds.
+
+    Always answers: if even the first iteration doesn't finish in time, the
+    highest ranked candidate is played.
+    """
+    started = time.perf_counter()
+    variant = Variant(size, win_length)
+    search = _Search(board, variant, started + time_budget)
+    piece = 1 if symbol == 'X' else 2
+    empty = len(search.cells) - len(search.stones)
+    if empty == 0:
+        return SearchResult(None, 0, 0, 0, 0, 0, time.perf_counter() - started)
+
+    moves, winning = search.candidates(piece, None)
+    best_move = winning if winning is not None else moves[0]
+    best_value = WIN if winning is not None else 0
+    depth_done = 0
+    if winning is None:
+        for depth in range(1, min(max_depth or empty, empty) + 1):
+            try:
+                best_value, best_move = search.root(depth, piece, best_move)
+            except _Timeout:
+                break
+            depth_done = depth
+            if abs(best_value) > WIN - 1000:  # forced result, deeper won't change it
+                break
+    return SearchResult(best_move, best_value, depth_done, search.nodes, search.tt_probes,
+                        search.tt_hits, time.perf_counter() - started)
+
+
+class SearchPool:
+    """Runs search_move in worker processes and keeps totals of their results.
+
+    A search that hasn't answered within time_budget plus grace seconds, for
+    example because every worker is busy, is abandoned: best_move returns None
+    and the caller falls back to a quicker move. So does a search asked for
+    before start has finished; best_move then starts the pool in the
+    background, so the wait for the processes never counts against a move's
+    budget. Used from the event loop.
+    """
+
+    def __init__(self, workers: int = 1, time_budget: float = 0.2, grace: float = 0.1):
+        self.workers = workers
+        self.time_budget = time_budget
+        self.grace = grace
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._start_lock = threading.Lock()
+        self._starting: Optional[asyncio.Future] = None
+        self.searches = 0
+        self.timeouts = 0
+        self.nodes = 0
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.depths = 0
+        self.seconds = 0.0
+
+    def start(self):
+        """Start the worker processes and wait until they are ready (blocks; safe from any thread)."""
+        with self._start_lock:
+            if self._executor is None:
+                # spawn, since forking a server with running threads can copy held locks
+                executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+                for future in [executor.submit(_geometry, Variant()) for _ in range(self.workers)]:
+                    future.result()
+                self._executor = executor
+
+    def shutdown(self):
+        with self._start_lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+            self._starting = None
+
+    async def best_move(self, board: str, variant: Variant, symbol: str = 'O') -> Optional[int]:
+        """Board index to play, or None if the search didn't answer in time or the pool isn't started."""
+        if self._executor is None:
+            if self._starting is None or self._starting.done():
+                self._starting = asyncio.get_running_loop().run_in_executor(None, self.start)
+            return None
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, search_move, board, variant.size, variant.win_length, symbol, self.time_budget
+        )
+        try:
+            result = await asyncio.wait_for(future, self.time_budget + self.grace)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            return None
+        self.searches += 1
+        self.nodes += result.nodes
+        self.tt_probes += result.tt_probes
+        self.tt_hits += result.tt_hits
+        self.depths += result.depth
+        self.seconds += result.seconds
+        return result.move
+
+    def stats(self) -> dict:
+        """Counters for tuning the search."""
+        return {
+            "workers": self.workers,
+            "time_budget_ms": self.time_budget * 1000,
+            "searches": self.searches,
+            "timeouts": self.timeouts,
+            "nodes": self.nodes,
+            "nodes_per_second": self.nodes / self.seconds if self.seconds else 0.0,
+            "tt_hit_rate": self.tt_hits / self.tt_probes if self.tt_probes else 0.0,
+            "avg_depth": self.depths / self.searches if self.searches else 0.0,
+            "avg_ms": self.seconds * 1000 / self.searches if self.searches else 0.0,
+        }
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""Headless self-play: play many games between strategies in memory.
+
+Games are played with game_logic on board strings, split across a process
+pool, and summarized as win/loss/tie rates and games/sec. With --insert, a
+sample of games is also written to the games and moves tables (as PvP games
+between two simulator players), to seed a database for load testing the
+history endpoints.
+
+Usage: python simulator.py [--x heuristic] [--o perfect] [--games 100000]
+                           [--workers N] [--seed 0] [--insert 0]
+"""
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import ai_table
+from game_logic import check_winner, empty_board, heuristic_move, make_move_on_board
+
+# A strategy picks a board index for symbol to play on board
+Strategy = Callable[[str, str, random.Random], int]
+
+
+def random_move(board: str, symbol: str, rng: random.Random) -> int:
+    """Any legal move, uniformly."""
+    return rng.choice([i for i in range(9) if board[i] == '.'])
+
+
+def perfect_move(board: str, symbol: str, rng: random.Random) -> int:
+    """Best move from the solved table."""
+    return ai_table.best_move(board, symbol)
+
+
+STRATEGIES: Dict[str, Strategy] = {
+    "heuristic": heuristic_move,
+    "random": random_move,
+    "perfect": perfect_move,
+}
+
+
+def play_game(x: Strategy, o: Strategy, rng: random.Random) -> Tuple[str, List[str]]:
+    """Play one game; returns the winner ('X', 'O' or 'TIE') and the board after each move."""
+    board = empty_board()
+    boards = []
+    symbol, strategy, other = 'X', x, o
+    while True:
+        pos = strategy(board, symbol, rng)
+        board = make_move_on_board(board, pos // 3, pos % 3, symbol)
+        boards.append(board)
+        winner = check_winner(board)
+        if winner is not None:
+            return winner, boards
+        symbol = 'O' if symbol == 'X' else 'X'
+        strategy, other = other, strategy
+
+
+class SimulationResult(NamedTuple):
+    """Totals for a simulation run."""
+    games: int
+    x_wins: int
+    o_wins: int
+    ties: int
+    seconds: float
+
+    def rates(self) -> Dict[str, float]:
+        return {
+            "x_win": self.x_wins / self.games,
+            "o_win": self.o_wins / self.games,
+            "tie": self.ties / self.games,
+        }
+
+    @property
+    def games_per_second(self) -> float:
+        return self.games / self.seconds if self.seconds else 0.0
+
+
+def _play_chunk(x_name: str, o_name: str, games: int, seed: int) -> Tuple[int, int, int]:
+    """Worker: play games and count (x wins, o wins, ties)."""
+    x, o = STRATEGIES[x_name], STRATEGIES[o_name]
+    rng = random.Random(seed)
+    counts = {'X': 0, 'O': 0, 'TIE': 0}
+    for _ in range(games):
+        counts[play_game(x, o, rng)[0]] += 1
+    return counts['X'], counts['O'], counts['TIE']
+
+
+def simulate(x_name: str, o_name: str, games: int, workers: Optional[int] = None,
+             seed: int = 0, chunk_size: int = 10000) -> SimulationResult:
+    """Play games between two named strategies across a process pool (workers=1 runs in-process)."""
+    chunks = [min(chunk_size, games - start) for start in range(0, games, chunk_size)]
+    args = [(x_name, o_name, n, seed + i) for i, n in enumerate(chunks)]
+    start = time.perf_counter()
+    if workers == 1:
+        totals = [_play_chunk(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            totals = list(pool.map(_play_chunk, *zip(*args)))
+    seconds = time.perf_counter() - start
+    x_wins, o_wins, ties = (sum(column) for column in zip(*totals)) if totals else (0, 0, 0)
+    return SimulationResult(games, x_wins, o_wins, ties, seconds)
+
+
+def _cell_played(boards: List[str], i: int) -> int:
+    """Board index that move i filled."""
+    before = boards[i - 1] if i else empty_board()
+    return next(j for j in range(9) if boards[i][j] != before[j])
+
+
+def insert_games(x_name: str, o_name: str, games: int, seed: int = 0, batch_size: int = 1000) -> int:
+    """Play games and bulk insert them, with every move, as finished PvP games.
+
+    The games are between two players named after the strategies (created if
+    missing). Returns the number of games inserted.
+    """
+    from sqlalchemy import insert, select
+    from database import Game, Move, Player, SessionLocal, WRITE_TRANSACTION, init_db, move_values
+
+    init_db()
+    x, o = STRATEGIES[x_name], STRATEGIES[o_name]
+    rng = random.Random(seed)
+    with SessionLocal() as db:
+        db.connection(execution_options=WRITE_TRANSACTION)
+        ids = {}
+        for name in (f"sim-x-{x_name}", f"sim-o-{o_name}"):
+            player = db.scalar(select(Player).where(Player.name == name))
+            if player is None:
+                player = Player(name=name)
+                db.add(player)
+                db.flush()
+            ids[name] = player.player_id
+        db.commit()
+    x_id, o_id = ids[f"sim-x-{x_name}"], ids[f"sim-o-{o_name}"]
+
+    inserted = 0
+    while inserted < games:
+        played = [play_game(x, o, rng) for _ in range(min(batch_size, games - inserted))]
+        with SessionLocal() as db:
+            db.connection(execution_options=WRITE_TRANSACTION)
+            game_ids = db.scalars(
+                insert(Game).returning(Game.game_id, sort_by_parameter_order=True),
+                [{
+                    "created_by": x_id,
+                    "opponent_id": o_id,
+                    "is_ai": False,
+                    "status": "done",
+                    "last_move": x_id if len(boards) % 2 else o_id,
+                    "board_state": boards[-1],
+                    "move_count": len(boards),
+                    "winner": winner,
+                } for winner, boards in played],
+            ).all()
+            db.execute(insert(Move), [
+                move_values(game_id, board_id, to_move, board, cell)
+                for game_id, (_, boards) in zip(game_ids, played)
+                for board_id, to_move, board, cell in [(0, "initial", empty_board(), None)] + [
+                    (i + 1, str(x_id if i % 2 == 0 else o_id), b, _cell_played(boards, i))
+                    for i, b in enumerate(boards)
+                ]
+            ])
+            db.commit()
+        inserted += len(played)
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--x", choices=STRATEGIES, default="heuristic", help="strategy for X (moves first)")
+    parser.add_argument("--o", choices=STRATEGIES, default="perfect", help="strategy for O")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes (1 = no pool)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--insert", type=int, default=0, help="also write this many games to the database")
+    args = parser.parse_args()
+
+    result = simulate(args.x, args.o, args.games, args.workers, args.seed)
+    rates = result.rates()
+    print(f"{args.x} (X) vs {args.o} (O): {result.games} games in {result.seconds:.2f}s "
+          f"({result.games_per_second:,.0f} games/s, {args.workers} workers)")
+    print(f"X wins {rates['x_win']:.2%}  O wins {rates['o_win']:.2%}  ties {rates['tie']:.2%}")
+
+    if args.insert:
+        start = time.perf_counter()
+        inserted = insert_games(args.x, args.o, args.insert, args.seed)
+        print(f"Inserted {inserted} games in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Tests for the precomputed perfect-play table."""
+import pytest
+import ai_table
+from game_logic import check_winner, ai_make_move, make_move_on_board, empty_board
+
+
+def _all_games(board, symbol):
+    """Yield every final board reachable with X playing anything and O playing the AI."""
+    winner = check_winner(board)
+    if winner is not None:
+        yield board
+        return
+    if symbol == 'X':
+        for i in range(9):
+            if board[i] == '.':
+                yield from _all_games(board[:i] + 'X' + board[i+1:], 'O')
+    else:
+        row, col = ai_make_move(board)
+        yield from _all_games(make_move_on_board(board, row, col, 'O'), 'X')
+
+
+class TestTable:
+    """Test the table contents."""
+
+    def test_covers_all_reachable_positions(self):
+        """Test the table holds every reachable position."""
+        assert len(ai_table.TABLE) == 5478
+        assert ai_table.lookup(empty_board()) is not None
+
+    def test_unreachable_position_missing(self):
+        """Test impossible boards aren't in the table."""
+        assert ai_table.lookup("OO.......") is None
+        assert ai_table.lookup("XXX.....O") is None  # X can't have 3 moves against 1
+
+    def test_terminal_values_match_check_winner(self):
+        """Test finished positions agree with check_winner."""
+        expected = {'X': 1, 'O': -1, 'TIE': 0}
+        for board, entry in ai_table.TABLE.items():
+            winner = check_winner(board)
+            if winner is None:
+                assert entry.best_move is not None
+                assert board[entry.best_move] == '.'
+            else:
+                assert entry.best_move is None
+                assert entry.value == expected[winner]
+
+    def test_empty_board_is_a_tie(self):
+        """Test perfect play from the start is a tie."""
+        assert ai_table.lookup(empty_board()).value == 0
+
+    def test_best_move_keeps_value(self):
+        """Test the stored best move leads to a position with the same value."""
+        for board, entry in ai_table.TABLE.items():
+            if entry.best_move is None:
+                continue
+            symbol = ai_table.side_to_move(board)
+            i = entry.best_move
+            child = ai_table.lookup(board[:i] + symbol + board[i+1:])
+            assert child.value == entry.value
+
+    def test_best_move_wrong_side(self):
+        """Test best_move refuses to play for the side not on move."""
+        assert ai_table.best_move(empty_board(), 'O') is None
+        assert ai_table.best_move(empty_board(), 'X') == 4
+
+
+class TestPerfectAI:
+    """Test the AI built on the table."""
+
+    def test_ai_never_loses(self):
+        """Test the AI never loses against any sequence of X moves."""
+        for board in _all_games(empty_board(), 'X'):
+            assert check_winner(board) in ('O', 'TIE')
+
+    @pytest.mark.parametrize("board,expected", [
+        ("XX..O....", (0, 2)),  # block
+        ("XX.OO.X..", (1, 2)),  # win beats block
+    ])
+    def test_ai_table_replies(self, board, expected):
+        """Test the AI picks forced moves in reachable positions."""
+        assert ai_make_move(board) == expected
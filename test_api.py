@@ -0,0 +1,1122 @@
+"""Tests for the API endpoints."""
+import asyncio
+import itertools
+import json
+import threading
+import time
+import pytest
+import requests
+import uvicorn
+from fastapi.testclient import TestClient
+from fastapi import HTTPException
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import database
+from events import GameEventHub
+from matchmaking import Match, MatchmakingQueue
+import main
+from main import app
+from schemas import MoveCreate
+
+client = TestClient(app)
+_names = itertools.count()
+
+
+def register(name=None):
+    """Register a player with a unique name and return its id."""
+    name = name or f"player-{next(_names)}"
+    return client.post("/players", json={"name": name}).json()["player_id"]
+
+
+def create_game(created_by, opponent="AI"):
+    """Create a game and return its id."""
+    response = client.post("/games", json={"created_by": created_by, "opponent": opponent})
+    assert response.status_code == 200
+    return response.json()["game_id"]
+
+
+def move(game_id, player_id, row, col):
+    return client.post("/moves", json={"game_id": game_id, "player_id": player_id, "row": row, "col": col})
+
+
+def record_writes(request):
+    """Run request() and return its response, commit count and executed statements."""
+    commits = []
+    statements = []
+    engine = database.async_engine.sync_engine
+
+    def on_commit(conn):
+        commits.append(conn)
+
+    def on_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(engine, "commit", on_commit)
+    event.listen(engine, "before_cursor_execute", on_execute)
+    try:
+        response = request()
+    finally:
+        event.remove(engine, "commit", on_commit)
+        event.remove(engine, "before_cursor_execute", on_execute)
+    return response, len(commits), statements
+
+
+class TestGameState:
+    """Test the current board kept on the game row."""
+
+    def test_new_game_status(self):
+        """Test a new game starts empty with the creator to move."""
+        player = register()
+        game_id = create_game(player)
+        status = client.get(f"/games/{game_id}").json()
+        assert status["board_state"] == "........."
+        assert status["current_turn"] == str(player)
+        assert status["winner"] is None
+
+    def test_ai_game_updates_row(self):
+        """Test the game row tracks board and move count through an AI game."""
+        player = register()
+        game_id = create_game(player)
+        response = move(game_id, player, 0, 0)
+        assert response.status_code == 200
+        board = response.json()["board_state"]
+        assert board.count("X") == 1 and board.count("O") == 1
+
+        status = client.get(f"/games/{game_id}").json()
+        assert status["board_state"] == board
+
+        db = database.SessionLocal()
+        try:
+            game = db.get(database.Game, game_id)
+            assert game.move_count == 2
+            assert game.board_state == board
+        finally:
+            db.close()
+
+        moves = client.get(f"/games/{game_id}/moves").json()["moves"]
+        assert [m["move_number"] for m in moves] == [0, 1, 2]
+        assert moves[-1]["board_state"] == board
+
+    def test_pvp_game_to_completion(self):
+        """Test the stored winner once a PvP game is won."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        for player, row, col in [(p1, 0, 0), (p2, 1, 0), (p1, 0, 1), (p2, 1, 1)]:
+            assert move(game_id, player, row, col).status_code == 200
+        response = move(game_id, p1, 0, 2)
+        assert response.json()["game_status"] == "done"
+        assert response.json()["winner"] == "X"
+
+        status = client.get(f"/games/{game_id}").json()
+        assert status["status"] == "done"
+        assert status["winner"] == "X"
+        assert status["board_state"] == "XXXOO...."
+
+    def test_wrong_turn_rejected(self):
+        """Test a move out of turn is rejected without changing the board."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        response = move(game_id, p2, 0, 0)
+        assert response.status_code == 400
+        assert client.get(f"/games/{game_id}").json()["board_state"] == "........."
+
+
+@pytest.fixture(scope="module")
+def live_server():
+    """Run the app with uvicorn on a free port, for responses TestClient would buffer."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join()
+
+
+def _events(response):
+    """Parse the data lines of a Server-Sent Events response (requests or TestClient)."""
+    for line in response.iter_lines():
+        if isinstance(line, bytes):
+            line = line.decode()
+        if line.startswith("data:"):
+            yield json.loads(line[len("data:"):])
+
+
+class TestEventHub:
+    """Test the in-process pub/sub hub."""
+
+    def test_publish_reaches_subscribers(self):
+        """Test only subscribers of the game get the event."""
+        hub = GameEventHub()
+
+        async def run():
+            with hub.subscription(1) as queue, hub.subscription(2) as other:
+                hub.publish(1, {"n": 1})
+                assert await asyncio.wait_for(queue.get(), 1) == {"n": 1}
+                assert other.empty()
+            assert hub.subscriber_count(1) == 0
+
+        asyncio.run(run())
+
+    def test_publish_from_another_thread(self):
+        """Test events published off the event loop are delivered."""
+        hub = GameEventHub()
+
+        async def run():
+            with hub.subscription(1) as queue:
+                threading.Thread(target=hub.publish, args=(1, {"n": 1})).start()
+                assert await asyncio.wait_for(queue.get(), 1) == {"n": 1}
+
+        asyncio.run(run())
+
+
+class TestGameEvents:
+    """Test the /games/{id}/events stream."""
+
+    def test_unknown_game(self):
+        """Test a stream for a missing game is a 404."""
+        assert client.get("/games/999999/events").status_code == 404
+
+    def test_finished_game_stream_ends(self):
+        """Test a finished game sends its final status and closes."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        for player, row, col in [(p1, 0, 0), (p2, 1, 0), (p1, 0, 1), (p2, 1, 1), (p1, 0, 2)]:
+            move(game_id, player, row, col)
+        with client.stream("GET", f"/games/{game_id}/events") as response:
+            events = list(_events(response))
+        assert len(events) == 1
+        assert events[0]["winner"] == "X"
+
+    def test_move_is_pushed(self, live_server):
+        """Test a move shows up on an open stream."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        with requests.get(f"{live_server}/games/{game_id}/events", stream=True, timeout=5) as response:
+            events = _events(response)
+            assert next(events)["board_state"] == "........."
+            move(game_id, p1, 1, 1)
+            pushed = next(events)
+        assert pushed["board_state"] == "....X...."
+        assert pushed["current_turn"] == str(p2)
+
+
+class TestTransactions:
+    """Test each write endpoint commits once."""
+
+    def test_create_game_single_commit(self):
+        """Test the game and its initial board are written in one transaction."""
+        player = register()
+        response, commits, statements = record_writes(
+            lambda: client.post("/games", json={"created_by": player, "opponent": "AI"})
+        )
+        assert response.status_code == 200
+        assert commits == 1
+        assert not any("count(" in s.lower() for s in statements)
+
+    def test_ai_move_single_commit(self):
+        """Test the human move and the AI reply are saved in one transaction."""
+        player = register()
+        game_id = create_game(player)
+        response, commits, statements = record_writes(lambda: move(game_id, player, 0, 0))
+        assert response.status_code == 200
+        assert commits == 1
+        assert sum(s.startswith("INSERT INTO moves") for s in statements) == 2
+        assert not any("count(" in s.lower() for s in statements)
+
+    def test_rejected_move_writes_nothing(self):
+        """Test a move out of turn leaves no partial update behind."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        response, commits, statements = record_writes(lambda: move(game_id, p2, 0, 0))
+        assert response.status_code == 400
+        assert commits == 0
+        assert not any(s.startswith(("INSERT", "UPDATE")) for s in statements)
+
+
+class TestBatch:
+    """Test the batch move and game creation endpoints."""
+
+    def test_create_games(self):
+        """Test games are created in order with a rejected one reported alongside."""
+        p1, p2 = register(), register()
+        response = client.post("/games/batch", json={"games": [
+            {"created_by": p1, "opponent": "AI"},
+            {"created_by": p1, "opponent": "nobody"},
+            {"created_by": p1, "opponent": str(p2)},
+        ]})
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert [r["status_code"] for r in results] == [200, 400, 200]
+        assert results[1]["game"] is None and "Opponent" in results[1]["detail"]
+        assert results[2]["game"]["opponent"] == str(p2)
+        status = client.get(f"/games/{results[0]['game']['game_id']}").json()
+        assert status["board_state"] == "........." and status["current_turn"] == str(p1)
+
+    def test_moves_in_one_commit(self):
+        """Test moves across games share one commit and later moves see earlier ones."""
+        p1, p2 = register(), register()
+        ai_game = create_game(p1)
+        pvp_game = create_game(p1, str(p2))
+        moves = [
+            {"game_id": pvp_game, "player_id": p1, "row": 0, "col": 0},
+            {"game_id": ai_game, "player_id": p1, "row": 1, "col": 1},
+            {"game_id": pvp_game, "player_id": p2, "row": 0, "col": 1},
+            {"game_id": pvp_game, "player_id": p2, "row": 0, "col": 2},
+        ]
+        response, commits, _ = record_writes(
+            lambda: client.post("/moves/batch", json={"moves": moves})
+        )
+        assert response.status_code == 200
+        assert commits == 1
+        results = response.json()["results"]
+        assert [r["status_code"] for r in results] == [200, 200, 200, 400]
+        assert results[3]["detail"] == "It's not your turn"
+        assert results[1]["move"]["to_move"] == "AI"
+
+        assert client.get(f"/games/{pvp_game}").json()["board_state"] == "XO......."
+        assert client.get(f"/games/{ai_game}").json()["move_count"] == 2
+        history = client.get(f"/games/{pvp_game}/moves").json()["moves"]
+        assert [m["move_number"] for m in history] == [0, 1, 2]
+
+    def test_failed_move_keeps_the_rest(self):
+        """Test a rejected move in the middle of a batch leaves the others applied."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        response = client.post("/moves/batch", json={"moves": [
+            {"game_id": game_id, "player_id": p1, "row": 0, "col": 0},
+            {"game_id": game_id, "player_id": p2, "row": 0, "col": 0},
+            {"game_id": game_id + 1000, "player_id": p2, "row": 0, "col": 1},
+            {"game_id": game_id, "player_id": p2, "row": 2, "col": 2},
+        ]})
+        assert [r["status_code"] for r in response.json()["results"]] == [200, 400, 404, 200]
+        assert client.get(f"/games/{game_id}").json()["board_state"] == "X.......O"
+
+    def test_batch_size_limit(self, monkeypatch):
+        """Test oversized batches are rejected before touching the database."""
+        import main
+        monkeypatch.setattr(main, "MAX_BATCH_SIZE", 1)
+        move = {"game_id": 1, "player_id": 1, "row": 0, "col": 0}
+        assert client.post("/moves/batch", json={"moves": [move, move]}).status_code == 400
+        game = {"created_by": 1, "opponent": "AI"}
+        assert client.post("/games/batch", json={"games": [game, game]}).status_code == 400
+
+
+class TestCreateGame:
+    """Test POST /games validation."""
+
+    def test_invalid_opponent(self):
+        """Test an opponent that isn't AI or a player ID is rejected."""
+        player = register()
+        response = client.post("/games", json={"created_by": player, "opponent": "bob"})
+        assert response.status_code == 400
+
+    def test_missing_opponent(self):
+        """Test a game against an unknown player is rejected."""
+        player = register()
+        response = client.post("/games", json={"created_by": player, "opponent": "999999"})
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Opponent not found"
+
+    def test_find_game(self):
+        """Test finding a PvP game from either side."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        found = client.get("/games/find", params={"player1": p2, "player2": p1}).json()
+        assert found["game_id"] == game_id
+        assert found["opponent"] == str(p2)
+        assert client.get(f"/players/{p2}/games").json()["games"][0]["game_id"] == game_id
+
+
+class TestLongPoll:
+    """Test GET /games/{id} with since and wait."""
+
+    def test_returns_immediately_when_behind(self):
+        """Test a stale since gets the current status right away."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        move(game_id, p1, 0, 0)
+        status = client.get(f"/games/{game_id}", params={"since": 0, "wait": 30}).json()
+        assert status["move_count"] == 1
+
+    def test_times_out_unchanged(self):
+        """Test the current status comes back once the wait runs out."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        start = time.monotonic()
+        status = client.get(f"/games/{game_id}", params={"since": 0, "wait": 0.2}).json()
+        assert time.monotonic() - start >= 0.2
+        assert status["move_count"] == 0
+
+    def test_wakes_on_move(self):
+        """Test a waiting request returns as soon as a move is made."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        result = {}
+
+        def wait():
+            result["status"] = client.get(f"/games/{game_id}", params={"since": 0, "wait": 10}).json()
+
+        waiter = threading.Thread(target=wait)
+        start = time.monotonic()
+        waiter.start()
+        time.sleep(0.2)
+        move(game_id, p1, 2, 2)
+        waiter.join(5)
+        assert time.monotonic() - start < 5
+        assert result["status"]["move_count"] == 1
+        assert result["status"]["board_state"] == "........X"
+
+    def test_wait_limit(self):
+        """Test waits longer than the limit are rejected."""
+        assert client.get("/games/1", params={"since": 0, "wait": 3600}).status_code == 422
+
+
+class TestPlayerHistory:
+    """Test GET /players/{id}/history."""
+
+    def _count_queries(self, path, **params):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(database.async_engine.sync_engine, "before_cursor_execute", record)
+        try:
+            response = client.get(path, params=params)
+        finally:
+            event.remove(database.async_engine.sync_engine, "before_cursor_execute", record)
+        return response, len(statements)
+
+    def test_query_count_does_not_grow(self):
+        """Test the number of queries is the same for 1 and 6 games."""
+        player = register()
+        create_game(player)
+        _, few = self._count_queries(f"/players/{player}/history")
+        for _ in range(5):
+            create_game(player)
+        response, many = self._count_queries(f"/players/{player}/history")
+        assert len(response.json()["games"]) == 6
+        assert few == many
+
+    def test_winner_and_order(self):
+        """Test games come back oldest first with stored winners."""
+        p1, p2 = register(), register()
+        first = create_game(p1, str(p2))
+        for player, row, col in [(p1, 0, 0), (p2, 1, 0), (p1, 0, 1), (p2, 1, 1), (p1, 0, 2)]:
+            move(first, player, row, col)
+        second = create_game(p2, str(p1))
+        games = client.get(f"/players/{p1}/history").json()["games"]
+        assert [g["game_id"] for g in games] == [first, second]
+        assert games[0]["winner"] == "X"
+        assert games[1]["winner"] is None
+        assert games[0]["created_at"] < games[1]["created_at"]
+
+    def test_keyset_pagination(self):
+        """Test paging through history with after and limit."""
+        player = register()
+        game_ids = [create_game(player) for _ in range(5)]
+        seen = []
+        after = None
+        while True:
+            params = {"limit": 2}
+            if after is not None:
+                params["after"] = after
+            page = client.get(f"/players/{player}/history", params=params).json()
+            seen += [g["game_id"] for g in page["games"]]
+            after = page["next_after"]
+            if after is None:
+                break
+        assert seen == game_ids
+
+    def test_pagination_without_initial_boards(self):
+        """Test games sharing created_at 0, having no initial board, are all paged through."""
+        player = register()
+        game_ids = [create_game(player) for _ in range(5)]
+        with database.engine.begin() as conn:
+            conn.execute(text("DELETE FROM moves WHERE board_id = 0 AND game_id IN (:a, :b, :c)"),
+                         {"a": game_ids[1], "b": game_ids[2], "c": game_ids[4]})
+        seen = []
+        params = {"limit": 2}
+        while True:
+            page = client.get(f"/players/{player}/history", params=params).json()
+            seen += [g["game_id"] for g in page["games"]]
+            if page["next_after"] is None:
+                break
+            params["after"] = page["next_after"]
+        assert seen == [game_ids[1], game_ids[2], game_ids[4], game_ids[0], game_ids[3]]
+
+    def test_malformed_cursor(self):
+        """Test an after that isn't a created_at:game_id cursor is rejected."""
+        assert client.get(f"/players/{register()}/history", params={"after": "5"}).status_code == 422
+
+    def test_unknown_player(self):
+        """Test history for a missing player is a 404."""
+        assert client.get("/players/999999/history").status_code == 404
+
+
+class TestGameCache:
+    """Test status reads are served from the game state cache."""
+
+    def test_status_read_skips_database(self):
+        """Test reading an active game after a move runs no queries."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        move(game_id, p1, 0, 0)
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = database.async_engine.sync_engine
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            status = client.get(f"/games/{game_id}").json()
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert status["board_state"] == "X........"
+        assert status["move_count"] == 1
+        assert statements == []
+
+    def test_finished_game_read_from_database(self):
+        """Test a finished game is no longer cached but still readable."""
+        import main
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        for player, row, col in [(p1, 0, 0), (p2, 1, 0), (p1, 0, 1), (p2, 1, 1), (p1, 0, 2)]:
+            move(game_id, player, row, col)
+        assert main.game_cache.get(game_id) is None
+        assert client.get(f"/games/{game_id}").json()["winner"] == "X"
+        assert main.game_cache.get(game_id) is None
+
+    def test_miss_keeps_move_committed_meanwhile(self, monkeypatch):
+        """Test a move written through while a miss reads the database isn't overwritten by that read."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        move(game_id, p1, 0, 0)
+        main.game_cache.evict(game_id)
+        read_status = main._game_status
+
+        def move_commits_during_read(game):
+            status = read_status(game)
+            main.game_cache.put(status.model_copy(update={"move_count": 2, "board_state": "XO......."}))
+            return status
+        monkeypatch.setattr(main, "_game_status", move_commits_during_read)
+
+        status = asyncio.run(main._load_game_status(game_id))
+        assert status.move_count == 2
+        assert main.game_cache.get(game_id).move_count == 2
+
+    def test_stats_endpoint(self):
+        """Test the cache counters are exposed."""
+        stats = client.get("/stats").json()["game_cache"]
+        assert {"entries", "hits", "misses", "evictions", "hit_rate"} <= stats.keys()
+
+
+class TestMovesCache:
+    """Test finished games' move histories are served from pre-serialized bytes."""
+
+    def _record_statements(self, request):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        engine = database.async_engine.sync_engine
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            return request(), statements
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+
+    def test_finished_game_cached(self):
+        """Test a finished game's moves are read from the database once, then from memory."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        for player, row, col in [(p1, 0, 0), (p2, 1, 0), (p1, 0, 1), (p2, 1, 1), (p1, 0, 2)]:
+            move(game_id, player, row, col)
+
+        first, statements = self._record_statements(lambda: client.get(f"/games/{game_id}/moves"))
+        assert statements
+        second, statements = self._record_statements(lambda: client.get(f"/games/{game_id}/moves"))
+        assert statements == []
+        assert second.content == first.content
+        assert second.headers["content-type"] == "application/json"
+        assert second.json()["moves"][-1]["board_state"] == "XXXOO...."
+
+    def test_game_in_progress_not_cached(self):
+        """Test an unfinished game's history picks up new moves."""
+        import main
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        assert len(client.get(f"/games/{game_id}/moves").json()["moves"]) == 1
+        move(game_id, p1, 0, 0)
+        assert len(client.get(f"/games/{game_id}/moves").json()["moves"]) == 2
+        assert main.moves_cache.get(game_id) is None
+
+    def test_stats_endpoint(self):
+        """Test the cache counters are exposed."""
+        stats = client.get("/stats").json()["moves_cache"]
+        assert {"entries", "bytes", "hits", "misses", "hit_rate"} <= stats.keys()
+
+
+class TestMatchmakingQueue:
+    """Test pairing order and bookkeeping of the matchmaking queue."""
+
+    def test_fifo_pairing(self):
+        """Test newcomers are paired with the longest waiting player, never themselves."""
+        async def run():
+            queue = MatchmakingQueue()
+            assert queue.pop_partner(1) is None
+            first, second = queue.join(1), queue.join(2)
+            assert queue.join(1) is first
+            assert len(queue) == 2
+            assert queue.pop_partner(1) == 2
+            assert queue.pop_partner(3) == 1
+            queue.resolve(1, Match(10, 3, 'X'))
+            assert await first == Match(10, 3, 'X')
+            assert len(queue) == 0
+            assert queue.stats()["matched"] == 1
+        asyncio.run(run())
+
+    def test_leave_and_requeue(self):
+        """Test a player being matched is told to keep waiting, and a failed match keeps their place."""
+        async def run():
+            queue = MatchmakingQueue()
+            queue.join(1)
+            queue.join(2)
+            assert queue.pop_partner(3) == 1
+            assert queue.leave(1) is False
+            queue.requeue(1)
+            assert queue.pop_partner(3) == 1
+            queue.requeue(1)
+            assert queue.leave(2) is True
+            assert queue.leave(2) is True
+            stats = queue.stats()
+            assert stats["depth"] == 1 and stats["timed_out"] == 1 and stats["enqueued"] == 2
+        asyncio.run(run())
+
+
+class TestMatchmaking:
+    """Test the matchmaking endpoint."""
+
+    def test_unknown_player(self):
+        response = client.post("/matchmaking/enqueue", json={"player_id": 999999, "wait": 0})
+        assert response.status_code == 404
+
+    def test_timeout(self):
+        """Test a player nobody pairs with gets a timeout and leaves the queue."""
+        player = register()
+        response = client.post("/matchmaking/enqueue", json={"player_id": player, "wait": 0.05})
+        assert response.json() == {"status": "timeout", "game_id": None, "opponent_id": None, "symbol": None}
+        assert client.get("/stats").json()["matchmaking"]["depth"] == 0
+
+    def test_pairs_waiting_players(self, live_server):
+        """Test two players looking for a match get the same new game, the first to wait as X."""
+        first, second = register(), register()
+        results = {}
+
+        def enqueue(player):
+            results[player] = requests.post(
+                f"{live_server}/matchmaking/enqueue", json={"player_id": player, "wait": 10}
+            ).json()
+
+        waiting = threading.Thread(target=enqueue, args=(first,))
+        waiting.start()
+        while client.get("/stats").json()["matchmaking"]["depth"] == 0:
+            time.sleep(0.01)
+        enqueue(second)
+        waiting.join()
+
+        assert results[first]["status"] == results[second]["status"] == "matched"
+        assert results[first]["game_id"] == results[second]["game_id"]
+        assert (results[first]["symbol"], results[first]["opponent_id"]) == ("X", second)
+        assert (results[second]["symbol"], results[second]["opponent_id"]) == ("O", first)
+        status = client.get(f"/games/{results[first]['game_id']}").json()
+        assert status["created_by"] == first and status["current_turn"] == str(first)
+        assert client.get("/stats").json()["matchmaking"]["depth"] == 0
+
+
+class TestHttpCaching:
+    """Test ETags, 304 Not Modified and Cache-Control on game state and history."""
+
+    def _finish(self, p1, p2, game_id):
+        for player, row, col in [(p1, 0, 0), (p2, 1, 0), (p1, 0, 1), (p2, 1, 1), (p1, 0, 2)]:
+            move(game_id, player, row, col)
+
+    def test_status_not_modified_from_cache(self):
+        """Test a matching If-None-Match gets a 304 without a query, until the next move."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        first = client.get(f"/games/{game_id}")
+        etag = first.headers["etag"]
+        assert first.headers["cache-control"] == "no-cache"
+
+        response, statements = TestMovesCache()._record_statements(
+            lambda: client.get(f"/games/{game_id}", headers={"If-None-Match": etag})
+        )
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == etag
+        assert statements == []
+
+        move(game_id, p1, 0, 0)
+        response = client.get(f"/games/{game_id}", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        assert response.json()["move_count"] == 1
+
+    def test_finished_game_immutable(self):
+        """Test finished games' status and moves are immutable and revalidate without queries."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        self._finish(p1, p2, game_id)
+        for path in (f"/games/{game_id}", f"/games/{game_id}/moves"):
+            first = client.get(path)
+            assert "immutable" in first.headers["cache-control"]
+            response, statements = TestMovesCache()._record_statements(
+                lambda: client.get(path, headers={"If-None-Match": f'"other", {first.headers["etag"]}'})
+            )
+            assert response.status_code == 304
+            assert "immutable" in response.headers["cache-control"]
+            assert statements == []
+
+    def test_moves_in_progress(self):
+        """Test an unfinished game's moves revalidate, and change with a move."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        etag = client.get(f"/games/{game_id}/moves").headers["etag"]
+        assert client.get(f"/games/{game_id}/moves", headers={"If-None-Match": etag}).status_code == 304
+        move(game_id, p1, 0, 0)
+        response = client.get(f"/games/{game_id}/moves", headers={"If-None-Match": etag})
+        assert response.status_code == 200 and len(response.json()["moves"]) == 2
+
+    def test_history_etag(self):
+        """Test the history ETag holds until the player's games change."""
+        player = register()
+        create_game(player)
+        etag = client.get(f"/players/{player}/history").headers["etag"]
+        assert client.get(f"/players/{player}/history", headers={"If-None-Match": etag}).status_code == 304
+        create_game(player)
+        assert client.get(f"/players/{player}/history", headers={"If-None-Match": etag}).status_code == 200
+
+    def test_client_sends_conditional_requests(self, live_server, monkeypatch):
+        """Test client.py reuses its copy on 304."""
+        import client as cli
+        monkeypatch.setattr(cli, "BASE_URL", live_server)
+        monkeypatch.setattr(cli, "_conditional_cache", {})
+        sent = []
+        original_get = requests.get
+
+        def get(url, **kwargs):
+            response = original_get(url, **kwargs)
+            sent.append((kwargs.get("headers", {}).get("If-None-Match"), response.status_code))
+            return response
+
+        monkeypatch.setattr(cli.requests, "get", get)
+        player = register()
+        game_id = create_game(player)
+        first = cli.get_game_status(game_id)
+        assert cli.get_game_status(game_id) == first
+        assert sent[0] == (None, 200)
+        assert sent[1][0] is not None and sent[1][1] == 304
+
+
+class TestCompactMoves:
+    """Test storing moves as cells only and rebuilding them on read."""
+
+    def _play(self):
+        """Play an AI game and an unfinished PvP game; return their histories and ids."""
+        p1, p2 = register(), register()
+        ai_game = create_game(p1)
+        for row, col in [(0, 0), (2, 2), (0, 2), (2, 0), (1, 2)]:
+            if move(ai_game, p1, row, col).json().get("game_status") == "done":
+                break
+        pvp_game = create_game(p1, str(p2))
+        move(pvp_game, p1, 1, 1)
+        move(pvp_game, p2, 0, 0)
+        move(pvp_game, p1, 2, 1)
+        game_ids = (ai_game, pvp_game)
+        return self._histories(game_ids, {str(p1): "creator", str(p2): "opponent"}), game_ids
+
+    def _histories(self, game_ids, roles):
+        """Move histories without move ids, with player ids replaced by roles."""
+        return [
+            [(m["move_number"], roles.get(m["player"], m["player"]), m["board_state"])
+             for m in client.get(f"/games/{g}/moves").json()["moves"]]
+            for g in game_ids
+        ]
+
+    def _stored(self, game_ids):
+        with database.engine.connect() as conn:
+            return conn.execute(
+                text("SELECT board_id, to_move, board_state, cell FROM moves WHERE game_id IN (:a, :b)"),
+                {"a": game_ids[0], "b": game_ids[1]},
+            ).all()
+
+    def test_history_unchanged(self, monkeypatch):
+        """Test compact moves give the same history response with no board copies stored."""
+        expected, _ = self._play()
+        monkeypatch.setattr(database, "COMPACT_MOVES", True)
+        histories, game_ids = self._play()
+        assert histories == expected
+        assert histories[1] == [
+            (0, "initial", "........."),
+            (1, "creator", "....X...."),
+            (2, "opponent", "O...X...."),
+            (3, "creator", "O...X..X."),
+        ]
+        stored = self._stored(game_ids)
+        assert all(to_move is None and board is None for _, to_move, board, _ in stored)
+        assert all((cell is None) == (board_id == 0) for board_id, _, _, cell in stored)
+
+    def test_compact_existing_moves(self):
+        """Test compact_moves converts stored boards to cells without changing the history."""
+        expected, game_ids = self._play()
+        with database.engine.connect() as conn:
+            players = conn.execute(
+                text("SELECT created_by, opponent_id FROM games WHERE game_id = :g"), {"g": game_ids[1]}
+            ).one()
+        database.compact_moves(database.engine, games_per_batch=1)
+        histories = self._histories(game_ids, {str(players[0]): "creator", str(players[1]): "opponent"})
+        assert histories == expected
+        stored = self._stored(game_ids)
+        assert all(board is None for _, _, board, _ in stored)
+        assert all((cell is None) == (board_id == 0) for board_id, _, _, cell in stored)
+
+
+class TestBoardVariants:
+    """Test games on larger boards, won by K in a row."""
+
+    def test_create_gomoku(self):
+        """Test a 15x15 game defaults to five in a row and reports its variant."""
+        player = register()
+        response = client.post("/games", json={"created_by": player, "opponent": "AI", "board_size": 15})
+        assert response.status_code == 200
+        assert (response.json()["board_size"], response.json()["win_length"]) == (15, 5)
+        status = client.get(f"/games/{response.json()['game_id']}").json()
+        assert status["board_state"] == "." * 225
+        assert (status["board_size"], status["win_length"]) == (15, 5)
+
+    def test_invalid_variants(self):
+        """Test sizes out of range and win lengths longer than the board are rejected."""
+        player = register()
+        assert client.post("/games", json={"created_by": player, "opponent": "AI", "board_size": 2}).status_code == 422
+        response = client.post("/games", json={"created_by": player, "opponent": "AI", "board_size": 5, "win_length": 6})
+        assert response.status_code == 400
+
+    def test_coordinates_checked_against_board_size(self):
+        """Test a move is valid anywhere on the game's board and nowhere off it."""
+        player = register()
+        game_id = client.post("/games", json={"created_by": player, "opponent": "AI", "board_size": 9}).json()["game_id"]
+        assert move(game_id, player, 9, 0).status_code == 400
+        response = move(game_id, player, 8, 8)
+        assert response.status_code == 200
+        board = response.json()["board_state"]
+        assert len(board) == 81 and board[80] == "X" and board.count("O") == 1
+
+    def test_ai_reply_searched(self, monkeypatch):
+        """Test AI replies on a larger board come from the search pool."""
+        monkeypatch.setattr(main.ai_search, "time_budget", 0.05)
+        main.ai_search.start()  # as the app's lifespan does
+        player = register()
+        game_id = client.post("/games", json={"created_by": player, "opponent": "AI", "board_size": 9}).json()["game_id"]
+        searches = client.get("/stats").json()["ai_search"]["searches"]
+        board = move(game_id, player, 4, 4).json()["board_state"]
+        assert board.count("X") == 1 and board.count("O") == 1
+        stats = client.get("/stats").json()["ai_search"]
+        assert stats["searches"] == searches + 1
+        assert stats["nodes_per_second"] > 0
+
+    def test_ai_reply_planned_from_cache_only(self):
+        """Test planning a reply reads nothing from the database and leaves the cache alone."""
+        player = register()
+        game_id = client.post("/games", json={"created_by": player, "opponent": "AI", "board_size": 9}).json()["game_id"]
+        main.game_cache.evict(game_id)
+        plan = MoveCreate(game_id=game_id, player_id=player, row=4, col=4)
+        _, _, statements = record_writes(lambda: asyncio.run(main._plan_ai_reply(plan)))
+        assert statements == []
+        assert main.game_cache.peek(game_id) is None
+
+    def test_pvp_win(self):
+        """Test four in a row wins a 7x7, four-in-a-row game, and the history replays."""
+        p1, p2 = register(), register()
+        game_id = client.post("/games", json={
+            "created_by": p1, "opponent": str(p2), "board_size": 7, "win_length": 4,
+        }).json()["game_id"]
+        for col in range(3):
+            assert move(game_id, p1, 3, col + 2).json()["game_status"] == "progress"
+            move(game_id, p2, 0, col)
+        response = move(game_id, p1, 3, 1)
+        assert response.json()["game_status"] == "done"
+        assert response.json()["winner"] == "X"
+        moves = client.get(f"/games/{game_id}/moves").json()["moves"]
+        assert moves[0]["board_state"] == "." * 49
+        assert moves[-1]["board_state"] == response.json()["board_state"]
+
+
+class TestConcurrentWrites:
+    """Test a move based on a stale copy of the game is refused instead of overwriting."""
+
+    def test_stale_game_conflict(self):
+        """Test a move applied to a game changed since it was read gets 409."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+
+        async def run():
+            engine = create_async_engine(database.ASYNC_DATABASE_URL)
+            try:
+                async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                    stale = await db.get(database.Game, game_id)  # held, or the session would forget it
+                    await db.commit()
+                    # Another request moves while this session holds the old version
+                    await asyncio.to_thread(move, game_id, p1, 0, 0)
+                    await db.connection(execution_options=database.WRITE_TRANSACTION)
+                    with pytest.raises(HTTPException) as error:
+                        await main._apply_move(db, MoveCreate(game_id=game_id, player_id=p1, row=1, col=1))
+                    await db.rollback()
+                return error.value.status_code
+            finally:
+                await engine.dispose()
+        assert asyncio.run(run()) == 409
+        assert client.get(f"/games/{game_id}").json()["board_state"] == "X........"
+
+    def test_duplicate_move_number_conflict(self):
+        """Test a move whose number was already taken gets 409 and writes nothing."""
+        player = register()
+        game_id = create_game(player)
+        with database.engine.begin() as conn:
+            conn.execute(text("INSERT INTO moves (game_id, board_id, cell) VALUES (:game_id, 1, 8)"),
+                         {"game_id": game_id})
+        response = move(game_id, player, 0, 0)
+        assert response.status_code == 409
+        assert client.get(f"/games/{game_id}").json()["move_count"] == 0
+
+
+class TestIdempotency:
+    """Test moves retried with the same Idempotency-Key are applied once."""
+
+    def _move(self, game_id, player_id, row, col, key):
+        return client.post("/moves", json={"game_id": game_id, "player_id": player_id, "row": row, "col": col},
+                           headers={"Idempotency-Key": key})
+
+    def test_retry_replayed_from_memory(self):
+        """Test a retry gets the first response back without touching the database."""
+        player = register()
+        game_id = create_game(player)
+        first = self._move(game_id, player, 0, 0, "retry-1")
+        retry, commits, statements = record_writes(lambda: self._move(game_id, player, 0, 0, "retry-1"))
+        assert first.status_code == retry.status_code == 200
+        assert retry.json() == first.json()
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert "Idempotent-Replayed" not in first.headers
+        assert commits == 0 and statements == []
+        assert client.get(f"/games/{game_id}").json()["move_count"] == 2
+
+    def test_retry_replayed_from_database(self):
+        """Test a key no longer in memory is answered from the saved row."""
+        player = register()
+        game_id = create_game(player)
+        first = self._move(game_id, player, 1, 1, "retry-2")
+        main.idempotency_cache.clear()
+        retry, commits, statements = record_writes(lambda: self._move(game_id, player, 1, 1, "retry-2"))
+        assert retry.json() == first.json()
+        assert retry.headers["Idempotent-Replayed"] == "true"
+        assert not any(s.startswith(("INSERT", "UPDATE")) for s in statements)
+        assert client.get(f"/games/{game_id}").json()["move_count"] == 2
+
+    def test_key_reused_for_different_move(self):
+        """Test a key sent again with a different move gets 422."""
+        player = register()
+        game_id = create_game(player)
+        self._move(game_id, player, 0, 0, "retry-3")
+        response = self._move(game_id, player, 2, 2, "retry-3")
+        assert response.status_code == 422
+        assert client.get(f"/games/{game_id}").json()["move_count"] == 2
+
+    def test_keys_scoped_to_player(self):
+        """Test two players using the same key value don't see each other's responses."""
+        p1, p2 = register(), register()
+        game_id = create_game(p1, str(p2))
+        assert self._move(game_id, p1, 0, 0, "same").status_code == 200
+        response = self._move(game_id, p2, 1, 1, "same")
+        assert response.status_code == 200
+        assert "Idempotent-Replayed" not in response.headers
+        assert client.get(f"/games/{game_id}").json()["board_state"] == "X...O...."
+
+    def test_prune_old_keys(self):
+        """Test prune_idempotency_keys drops only keys older than max_age."""
+        player = register()
+        game_id = create_game(player)
+        self._move(game_id, player, 0, 0, "retry-4")
+        assert database.prune_idempotency_keys(database.engine, max_age=3600) == 0
+        assert database.prune_idempotency_keys(database.engine, max_age=-1) >= 1
+        main.idempotency_cache.clear()
+        assert self._move(game_id, player, 0, 0, "retry-4").status_code == 400  # applied again: cell taken
+
+    def test_old_keys_pruned_by_server(self, monkeypatch):
+        """Test the server's periodic prune drops keys older than IDEMPOTENCY_KEY_TTL."""
+        player = register()
+        game_id = create_game(player)
+        self._move(game_id, player, 0, 0, "retry-5")
+        assert asyncio.run(main._prune_idempotency_keys()) == 0
+        monkeypatch.setattr(main, "IDEMPOTENCY_KEY_TTL", -1)
+        assert asyncio.run(main._prune_idempotency_keys()) >= 1
+
+    def test_key_saved_concurrently(self, monkeypatch):
+        """Test a key another request saved first is a 409 about the key, and the move isn't applied."""
+        player = register()
+        game_id = create_game(player)
+        apply_move = main._apply_move
+
+        async def key_saved_meanwhile(db, move, ai_reply=None):
+            result = await apply_move(db, move, ai_reply)
+            await db.execute(text(
+                "INSERT INTO idempotency_keys (key, request, response, created_at) VALUES (:key, '{}', '{}', 0)"
+            ), {"key": f"{player}:retry-6"})
+            return result
+        monkeypatch.setattr(main, "_apply_move", key_saved_meanwhile)
+
+        response = self._move(game_id, player, 0, 0, "retry-6")
+        assert response.status_code == 409
+        assert "Idempotency-Key" in response.json()["detail"]
+        assert client.get(f"/games/{game_id}").json()["move_count"] == 0
+
+
+class TestSchemaUpgrade:
+    """Test upgrading a database created before the current board columns."""
+
+    def test_backfills_games(self, tmp_path):
+        """Test board, move count and winner are filled in from moves."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE players (player_id INTEGER PRIMARY KEY, name VARCHAR)"))
+            conn.execute(text(
+                "CREATE TABLE games (game_id INTEGER PRIMARY KEY, created_by INTEGER, "
+                "opponent VARCHAR, status VARCHAR, last_move INTEGER)"
+            ))
+            conn.execute(text(
+                "CREATE TABLE moves (move_id INTEGER PRIMARY KEY, game_id INTEGER, "
+                "to_move VARCHAR, board_id INTEGER, board_state VARCHAR)"
+            ))
+            conn.execute(text("CREATE INDEX ix_moves_game_id ON moves (game_id)"))
+            conn.execute(text("INSERT INTO games VALUES (1, 1, 'AI', 'done', NULL), (2, 1, '2', 'progress', 1)"))
+            conn.execute(text(
+                "INSERT INTO moves (game_id, to_move, board_id, board_state) VALUES "
+                "(1, 'initial', 0, '.........'), (1, '1', 1, 'XOXOXOOXO'), "
+                "(2, 'initial', 0, '.........'), (2, '1', 1, 'X........')"
+            ))
+
+        database.upgrade_schema(engine)
+
+        with engine.connect() as conn:
+            rows = conn.execute(text("SELECT game_id, board_state, move_count, winner FROM games ORDER BY game_id")).all()
+            opponents = conn.execute(text("SELECT opponent_id, is_ai FROM games ORDER BY game_id")).all()
+        assert rows == [(1, "XOXOXOOXO", 1, "TIE"), (2, "X........", 1, None)]
+        assert opponents == [(None, 1), (2, 0)]
+        assert "cell" in {c["name"] for c in database.inspect(engine).get_columns("moves")}
+
+        db = database.SessionLocal(bind=engine)
+        try:
+            assert [g.opponent for g in db.query(database.Game).order_by(database.Game.game_id)] == ["AI", "2"]
+            assert {(g.board_size, g.win_length) for g in db.query(database.Game)} == {(3, 3)}
+        finally:
+            db.close()
+
+    def test_adds_indexes(self, tmp_path):
+        """Test the composite indexes exist and the old single-column ones are gone."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE players (player_id INTEGER PRIMARY KEY, name VARCHAR)"))
+            conn.execute(text(
+                "CREATE TABLE games (game_id INTEGER PRIMARY KEY, created_by INTEGER, "
+                "opponent VARCHAR, status VARCHAR, last_move INTEGER)"
+            ))
+            conn.execute(text(
+                "CREATE TABLE moves (move_id INTEGER PRIMARY KEY, game_id INTEGER, "
+                "to_move VARCHAR, board_id INTEGER, board_state VARCHAR)"
+            ))
+            conn.execute(text("CREATE INDEX ix_moves_game_id ON moves (game_id)"))
+            conn.execute(text("CREATE INDEX ix_moves_move_id ON moves (move_id)"))
+
+        database.upgrade_schema(engine)
+
+        with engine.connect() as conn:
+            indexes = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+            plan = " ".join(str(row) for row in conn.execute(text(
+                "EXPLAIN QUERY PLAN SELECT * FROM moves WHERE game_id = 1 ORDER BY board_id"
+            )))
+        assert {"ix_games_created_by_status", "ix_games_opponent_id_status", "ix_moves_game_id_board_id"} <= indexes
+        assert "ix_moves_game_id" not in indexes and "ix_moves_move_id" not in indexes
+        assert "ix_moves_game_id_board_id" in plan
+
+    def test_move_numbers_made_unique(self, tmp_path):
+        """Test the old non-unique move number index becomes unique, unless duplicates exist."""
+        def old_database(name, moves):
+            engine = create_engine(f"sqlite:///{tmp_path / name}")
+            with engine.begin() as conn:
+                conn.execute(text("CREATE TABLE players (player_id INTEGER PRIMARY KEY, name VARCHAR)"))
+                conn.execute(text(
+                    "CREATE TABLE games (game_id INTEGER PRIMARY KEY, created_by INTEGER, "
+                    "opponent VARCHAR, status VARCHAR, last_move INTEGER)"
+                ))
+                conn.execute(text(
+                    "CREATE TABLE moves (move_id INTEGER PRIMARY KEY, game_id INTEGER, "
+                    "to_move VARCHAR, board_id INTEGER, board_state VARCHAR)"
+                ))
+                conn.execute(text("CREATE INDEX ix_moves_game_id_board_id ON moves (game_id, board_id)"))
+                conn.execute(text("INSERT INTO games VALUES (1, 1, 'AI', 'progress', 1)"))
+                conn.execute(text(f"INSERT INTO moves (game_id, to_move, board_id, board_state) VALUES {moves}"))
+            database.upgrade_schema(engine)
+            return {index["name"]: index["unique"] for index in database.inspect(engine).get_indexes("moves")}
+
+        clean = old_database("clean.db", "(1, 'initial', 0, '.........'), (1, '1', 1, 'X........')")
+        assert clean["ix_moves_game_id_board_id"]
+        duplicated = old_database("duplicated.db", "(1, '1', 1, 'X........'), (1, '1', 1, '....X....')")
+        assert not duplicated["ix_moves_game_id_board_id"]
+
+    def test_duplicate_move_numbers_without_index(self, tmp_path):
+        """Test a database from before the move number index, with duplicates, still upgrades."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE TABLE players (player_id INTEGER PRIMARY KEY, name VARCHAR)"))
+            conn.execute(text(
+                "CREATE TABLE games (game_id INTEGER PRIMARY KEY, created_by INTEGER, "
+                "opponent VARCHAR, status VARCHAR, last_move INTEGER)"
+            ))
+            conn.execute(text(
+                "CREATE TABLE moves (move_id INTEGER PRIMARY KEY, game_id INTEGER, "
+                "to_move VARCHAR, board_id INTEGER, board_state VARCHAR)"
+            ))
+            conn.execute(text("CREATE INDEX ix_moves_game_id ON moves (game_id)"))
+            conn.execute(text("INSERT INTO games VALUES (1, 1, '2', 'progress', 1)"))
+            conn.execute(text(
+                "INSERT INTO moves (game_id, to_move, board_id, board_state) VALUES "
+                "(1, 'initial', 0, '.........'), (1, '1', 1, 'X........'), (1, '1', 1, '....X....')"
+            ))
+
+        database.upgrade_schema(engine)
+
+        indexes = {index["name"]: index["unique"] for index in database.inspect(engine).get_indexes("moves")}
+        assert not indexes["ix_moves_game_id_board_id"]
+        assert "ix_moves_game_id" not in indexes
+
+    def test_event_ids_autoincrement(self, tmp_path):
+        """Test a change feed table from before AUTOINCREMENT is recreated with it."""
+        engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+        database.Base.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE game_events"))
+            conn.execute(text(
+                "CREATE TABLE game_events (event_id INTEGER PRIMARY KEY, kind VARCHAR, key INTEGER, "
+                "origin VARCHAR, payload VARCHAR, created_at FLOAT)"
+            ))
+
+        database.upgrade_schema(engine)
+
+        with engine.connect() as conn:
+            sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE name = 'game_events'")).scalar()
+        assert "AUTOINCREMENT" in sql
@@ -0,0 +1,227 @@
+"""Tests for the state backends and running several server workers."""
+import asyncio
+import os
+import threading
+import pytest
+import requests
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import bench_api
+import main
+from backend import SQLiteChangeFeed
+from database import Base, Game, Player, configure_sqlite
+from matchmaking import Match
+from schemas import GameStatusResponse
+from test_api import client, create_game, register
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'feed.db'}")
+    configure_sqlite(engine.sync_engine)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(setup())
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    asyncio.run(engine.dispose())
+
+
+def _status(game_id, move_count, status="progress"):
+    return GameStatusResponse(game_id=game_id, created_by=1, opponent="2", status=status,
+                              board_state=".........", move_count=move_count)
+
+
+async def _create_game(db, created_by, opponent_id):
+    game = Game(created_by=created_by, opponent_id=opponent_id, is_ai=False, status="progress",
+                board_state=".........", move_count=0)
+    db.add(game)
+    await db.flush()
+    return game
+
+
+async def _add_players(session_factory, *names):
+    async with session_factory() as db:
+        players = [Player(name=name) for name in names]
+        db.add_all(players)
+        await db.commit()
+        return [player.player_id for player in players]
+
+
+class TestSQLiteChangeFeed:
+    """Test two workers, as two feeds on one database, sharing updates and matchmaking."""
+
+    def test_status_reaches_other_workers(self, session_factory):
+        """Test a staged status is delivered to other workers once committed, and not back to its own."""
+        async def run():
+            received = {"a": [], "b": []}
+            a = SQLiteChangeFeed(session_factory, poll_interval=3600, origin="a")
+            b = SQLiteChangeFeed(session_factory, poll_interval=3600, origin="b")
+            await a.start(received["a"].append)
+            await b.start(received["b"].append)
+            try:
+                async with session_factory() as db:
+                    a.stage_status(db, _status(7, 1))
+                    await db.rollback()
+                async with session_factory() as db:
+                    a.stage_status(db, _status(7, 2))
+                    a.stage_status(db, _status(7, 3))
+                    await db.commit()
+                await a.read_events()
+                await b.read_events()
+                await b.read_events()
+            finally:
+                await a.stop()
+                await b.stop()
+            assert received["a"] == []
+            assert [status.move_count for status in received["b"]] == [2, 3]
+        asyncio.run(run())
+
+    def test_status_after_prune(self, session_factory):
+        """Test events written after pruning emptied the feed still reach other workers."""
+        async def run():
+            received = []
+            a = SQLiteChangeFeed(session_factory, poll_interval=3600, retention=0, origin="a")
+            b = SQLiteChangeFeed(session_factory, poll_interval=3600, origin="b")
+            await a.start(lambda status: None)
+            await b.start(received.append)
+            try:
+                async with session_factory() as db:
+                    a.stage_status(db, _status(7, 1))
+                    a.stage_status(db, _status(7, 2))
+                    await db.commit()
+                await b.read_events()
+                await a._prune()
+                async with session_factory() as db:
+                    a.stage_status(db, _status(7, 3))
+                    await db.commit()
+                await b.read_events()
+            finally:
+                await a.stop()
+                await b.stop()
+            assert [status.move_count for status in received] == [1, 2, 3]
+        asyncio.run(run())
+
+    def test_match_across_workers(self, session_factory):
+        """Test a player waiting on one worker is paired by a player on another."""
+        async def run():
+            first, second = await _add_players(session_factory, "first", "second")
+            a = SQLiteChangeFeed(session_factory, poll_interval=0.01, origin="a")
+            b = SQLiteChangeFeed(session_factory, poll_interval=0.01, origin="b")
+            await a.start(lambda status: None)
+            await b.start(lambda status: None)
+            try:
+                waiting = asyncio.create_task(a.find_match(first, 5, _create_game))
+                while (await a.matchmaking_stats())["depth"] == 0:
+                    await asyncio.sleep(0.01)
+                theirs = await b.find_match(second, 5, _create_game)
+                mine = await waiting
+            finally:
+                await a.stop()
+                await b.stop()
+            assert theirs == Match(mine.game_id, first, 'O')
+            assert mine == Match(theirs.game_id, second, 'X')
+            assert (await a.matchmaking_stats())["depth"] == 0
+        asyncio.run(run())
+
+    def test_timeout_leaves_queue(self, session_factory):
+        """Test a player nobody pairs with leaves the shared queue."""
+        async def run():
+            (player,) = await _add_players(session_factory, "alone")
+            feed = SQLiteChangeFeed(session_factory, poll_interval=0.01)
+            await feed.start(lambda status: None)
+            try:
+                assert await feed.find_match(player, 0.05, _create_game) is None
+                return await feed.matchmaking_stats()
+            finally:
+                await feed.stop()
+        stats = asyncio.run(run())
+        assert stats["depth"] == 0
+        assert stats["timed_out"] == 1
+
+
+class TestRemoteStatus:
+    """Test how a worker applies statuses committed by other workers."""
+
+    def test_only_newer_states_applied(self):
+        """Test a status older than this worker's own is ignored, and newer ones are published."""
+        game_id = create_game(register())
+        main.game_cache.put(_status(game_id, 4))
+
+        async def run():
+            with main.hub.subscription(game_id) as queue:
+                main._remote_status(_status(game_id, 3))
+                assert main.game_cache.get(game_id).move_count == 4
+                main._remote_status(_status(game_id, 5))
+                assert main.game_cache.get(game_id).move_count == 5
+                return (await asyncio.wait_for(queue.get(), 1))["move_count"], queue.qsize()
+        assert asyncio.run(run()) == (5, 0)
+
+    def test_status_read_checks_database(self, monkeypatch):
+        """Test a status read doesn't answer from a cache entry another worker's move has outdated."""
+        monkeypatch.setattr(main, "backend", SQLiteChangeFeed(main.AsyncSessionLocal, poll_interval=3600))
+        first, second = register(), register()
+        game_id = create_game(first, str(second))
+        stale = main.game_cache.get(game_id)
+        assert client.post("/moves", json={"game_id": game_id, "player_id": first, "row": 0, "col": 0}).status_code == 200
+        main.game_cache.put(stale)  # as if the move was made on another worker
+
+        status = client.get(f"/games/{game_id}").json()
+        assert status["move_count"] == 1
+        assert main.game_cache.get(game_id).move_count == 1
+        assert client.get(f"/games/{game_id}").json()["move_count"] == 1
+
+
+@pytest.fixture(scope="module")
+def workers():
+    """main.py --workers 2 on its own database."""
+    process, base_url = bench_api.start_workers(2)
+    yield base_url
+    bench_api.stop_workers(process)
+
+
+class TestWorkers:
+    """Test several server processes behind one port."""
+
+    def test_turn_validation_is_race_free(self, workers):
+        """Test concurrent moves for the same turn, spread over the workers, let exactly one through."""
+        first, second = (requests.post(f"{workers}/players", json={"name": name}).json()["player_id"]
+                         for name in ("racer-1", "racer-2"))
+        game_id = requests.post(f"{workers}/games", json={"created_by": first, "opponent": str(second)}).json()["game_id"]
+        codes = []
+
+        def make_move(cell):
+            codes.append(requests.post(f"{workers}/moves", json={
+                "game_id": game_id, "player_id": first, "row": cell // 3, "col": cell % 3,
+            }).status_code)
+
+        threads = [threading.Thread(target=make_move, args=(cell,)) for cell in range(9)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(codes) == [200] + [400] * 8
+        # Each read may land on either worker, whichever made the move
+        assert {requests.get(f"{workers}/games/{game_id}").json()["move_count"] for _ in range(10)} == {1}
+
+    def test_long_polls_see_moves_from_any_worker(self, workers):
+        """Test PvP players waiting on one worker hear about moves made on the other."""
+        results = bench_api.run_load(workers, players=4, games=2, pvp=1.0)
+        assert all(row["errors"] == 0 for row in results["endpoints"].values())
+        # A missed notification would hold the long poll for its whole wait
+        assert results["endpoints"]["GET /games/{id}?wait"]["p95_ms"] < bench_api.LONG_POLL_WAIT * 1000 / 2
+
+    @pytest.mark.skipif((os.cpu_count() or 1) < 4, reason="needs cores for two workers and the load")
+    def test_throughput_scales_with_workers(self):
+        """Test two workers serve AI games at well over the rate of one."""
+        rates = {}
+        for count in (1, 2):
+            process, base_url = bench_api.start_workers(count)
+            try:
+                bench_api.run_load(base_url, players=4, games=1, pvp=0)  # warm up
+                rates[count] = bench_api.run_load(base_url, players=16, games=5, pvp=0)["moves_per_s"]
+            finally:
+                bench_api.stop_workers(process)
+        assert rates[2] > 1.4 * rates[1]
@@ -0,0 +1,57 @@
+"""Tests for vectorized board evaluation."""
+import itertools
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import batch_eval  # noqa: E402
+import bitboard  # noqa: E402
+from game_logic import check_winner  # noqa: E402
+
+# Every 9-cell combination of '.', 'X' and 'O', reachable or not
+ALL_BOARDS = ["".join(cells) for cells in itertools.product(".XO", repeat=9)]
+
+
+def _formats(boards):
+    """The same boards in every accepted input format."""
+    cells = np.array([[".XO".index(c) for c in b] for b in boards], dtype=np.uint8)
+    masks = np.array([bitboard.encode(b) for b in boards], dtype=np.uint16)
+    return {
+        "strings": boards,
+        "bytes": np.array(boards, dtype="S9"),
+        "uint8": cells,
+        "uint16": masks,
+    }
+
+
+class TestWinners:
+    """Test batched winners against check_winner."""
+
+    @pytest.mark.parametrize("fmt", ["strings", "bytes", "uint8", "uint16"])
+    def test_matches_check_winner(self, fmt):
+        """Test every possible board gives the same winner in every format."""
+        codes = batch_eval.winners(_formats(ALL_BOARDS)[fmt])
+        assert codes.dtype == np.uint8
+        assert batch_eval.winner_names(codes) == [check_winner(b) for b in ALL_BOARDS]
+
+    def test_empty_batch(self):
+        """Test an empty batch gives an empty result."""
+        assert len(batch_eval.winners([])) == 0
+
+    def test_bad_shape(self):
+        """Test arrays of the wrong shape are rejected."""
+        with pytest.raises(ValueError):
+            batch_eval.winners(np.zeros((4, 3), dtype=np.uint8))
+        with pytest.raises(ValueError):
+            batch_eval.winners(np.zeros((4, 9), dtype=np.uint16))
+
+
+class TestLegalMoves:
+    """Test batched legal moves against bitboard.legal_moves."""
+
+    def test_matches_bitboard(self):
+        """Test the masks and the per-cell view agree with the scalar version."""
+        masks = batch_eval.legal_moves(ALL_BOARDS)
+        assert masks.tolist() == [bitboard.legal_moves(*bitboard.encode(b)) for b in ALL_BOARDS]
+        cells = batch_eval.legal_move_cells(ALL_BOARDS[:500])
+        assert cells.tolist() == [[c == "." for c in b] for b in ALL_BOARDS[:500]]
@@ -0,0 +1,55 @@
+"""Tests for the game_logic micro-benchmark's baseline check."""
+import json
+import sys
+import pytest
+
+import bench_game_logic
+from bench_game_logic import check
+
+
+def _baseline(**mins):
+    return {"results": {name: {"min": value} for name, value in mins.items()}}
+
+
+def _run(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["bench_game_logic.py", "--repeats", "2", "--warmup", "0", *args])
+    bench_game_logic.main()
+
+
+class TestCheck:
+    """Test regressions are found against a baseline."""
+
+    def test_slowdown_over_threshold(self):
+        """Test only functions slower than the threshold are reported."""
+        baseline = _baseline(check_winner=100, ai_make_move=100)
+        results = _baseline(check_winner=124, ai_make_move=126)["results"]
+        assert check(results, baseline, 0.25) == [("ai_make_move", 100, 126)]
+
+    def test_functions_missing_from_results_ignored(self):
+        """Test a function the baseline has but the results don't isn't a regression."""
+        assert check({}, _baseline(check_winner=100), 0.25) == []
+
+
+class TestCommandLine:
+    """Test --save and --check, as a CI step runs them."""
+
+    def test_check_against_saved_baseline(self, monkeypatch, tmp_path, capsys):
+        """Test a baseline saved on this machine is checked against."""
+        baseline = tmp_path / "baseline.json"
+        _run(monkeypatch, "--save", str(baseline))
+        assert set(json.loads(baseline.read_text())["results"]) == set(bench_game_logic._cases())
+        _run(monkeypatch, "--check", str(baseline), "--threshold", "10")
+        assert "No function is more than" in capsys.readouterr().out
+
+    def test_check_fails_on_regression(self, monkeypatch, tmp_path):
+        """Test --check exits non-zero when a function got slower."""
+        baseline = tmp_path / "baseline.json"
+        baseline.write_text(json.dumps(_baseline(check_winner=0.001)))
+        with pytest.raises(SystemExit) as exc:
+            _run(monkeypatch, "--check", str(baseline))
+        assert exc.value.code == 1
+
+    def test_missing_baseline_skipped(self, monkeypatch, tmp_path, capsys):
+        """Test --check without a baseline file skips the comparison instead of failing."""
+        _run(monkeypatch, "--check", str(tmp_path / "missing.json"))
+        assert "Skipping the check" in capsys.readouterr().out
@@ -0,0 +1,57 @@
+"""Tests for the bitboard board representation."""
+import itertools
+import bitboard
+
+
+def _reference_winner(board):
+    """Plain string version of check_winner to compare against."""
+    lines = [(0, 1, 2), (3, 4, 5), (6, 7, 8), (0, 3, 6), (1, 4, 7), (2, 5, 8), (0, 4, 8), (2, 4, 6)]
+    for a, b, c in lines:
+        if board[a] != '.' and board[a] == board[b] == board[c]:
+            return board[a]
+    if '.' not in board:
+        return 'TIE'
+    return None
+
+
+ALL_BOARDS = ["".join(cells) for cells in itertools.product(".XO", repeat=9)]
+
+
+class TestEncoding:
+    """Test conversion to and from board strings."""
+
+    def test_encode_empty(self):
+        """Test empty board has no bits set."""
+        assert bitboard.encode(".........") == (0, 0)
+
+    def test_encode_bit_order(self):
+        """Test board index i maps to bit i."""
+        assert bitboard.encode("X.......O") == (0b1, 0b100000000)
+        assert bitboard.encode("....X....") == (0b10000, 0)
+
+    def test_round_trip(self):
+        """Test decode(encode(board)) gives back every board."""
+        for board in ALL_BOARDS:
+            assert bitboard.decode(*bitboard.encode(board)) == board
+
+
+class TestBitboardOps:
+    """Test winner detection and move generation."""
+
+    def test_winner_matches_reference(self):
+        """Test winner agrees with the string check on all 3^9 boards."""
+        for board in ALL_BOARDS:
+            x, o = bitboard.encode(board)
+            if bitboard.WINNING[x] and bitboard.WINNING[o]:
+                continue  # both sides have a line, can't happen in a real game
+            assert bitboard.winner(x, o) == _reference_winner(board)
+
+    def test_legal_moves(self):
+        """Test legal moves are exactly the empty cells."""
+        x, o = bitboard.encode("XO..X...O")
+        assert list(bitboard.iter_bits(bitboard.legal_moves(x, o))) == [2, 3, 5, 6, 7]
+
+    def test_legal_moves_full_board(self):
+        """Test a full board has no legal moves."""
+        x, o = bitboard.encode("XOXOXOOXO")
+        assert bitboard.legal_moves(x, o) == 0
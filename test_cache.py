@@ -0,0 +1,128 @@
+"""Tests for the in-memory caches."""
+from cache import CachedResponse, GameStateCache, IdempotencyCache, ResponseCache
+from schemas import GameStatusResponse
+
+
+def _status(game_id, status="progress", move_count=0):
+    return GameStatusResponse(
+        game_id=game_id, created_by=1, opponent="AI", status=status,
+        board_state=".........", move_count=move_count,
+    )
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestGameStateCache:
+    """Test LRU, TTL and write-through behavior."""
+
+    def test_hit_and_miss_counters(self):
+        """Test lookups are counted."""
+        cache = GameStateCache()
+        assert cache.get(1) is None
+        cache.put(_status(1))
+        assert cache.get(1).game_id == 1
+        assert cache.stats()["hits"] == 1
+        assert cache.stats()["misses"] == 1
+        assert cache.stats()["hit_rate"] == 0.5
+
+    def test_put_replaces_entry(self):
+        """Test writing through a new state replaces the old one."""
+        cache = GameStateCache()
+        cache.put(_status(1, move_count=1))
+        cache.put(_status(1, move_count=2))
+        assert cache.get(1).move_count == 2
+        assert len(cache) == 1
+
+    def test_put_if_newer(self):
+        """Test a status from another worker doesn't replace a later one."""
+        cache = GameStateCache()
+        assert cache.put_if_newer(_status(1, move_count=2))
+        assert not cache.put_if_newer(_status(1, move_count=1))
+        assert not cache.put_if_newer(_status(1, move_count=2))
+        assert cache.put_if_newer(_status(1, move_count=3))
+        assert cache.get(1).move_count == 3
+
+    def test_peek_not_counted(self):
+        """Test peeking neither counts a lookup nor keeps the entry from being evicted."""
+        clock = FakeClock()
+        cache = GameStateCache(max_entries=2, ttl=10, clock=clock)
+        assert cache.peek(1) is None
+        cache.put(_status(1))
+        cache.put(_status(2))
+        assert cache.peek(1).game_id == 1
+        cache.put(_status(3))
+        assert cache.peek(1) is None
+        clock.now = 10
+        assert cache.peek(2) is None
+        assert cache.stats()["hits"] == 0 and cache.stats()["misses"] == 0
+
+    def test_finished_game_evicted(self):
+        """Test a game that finishes is dropped."""
+        cache = GameStateCache()
+        cache.put(_status(1))
+        cache.put(_status(1, status="done"))
+        assert cache.get(1) is None
+        assert len(cache) == 0
+
+    def test_least_recently_used_evicted(self):
+        """Test the oldest unused entry goes first when full."""
+        cache = GameStateCache(max_entries=2)
+        cache.put(_status(1))
+        cache.put(_status(2))
+        cache.get(1)
+        cache.put(_status(3))
+        assert cache.get(2) is None
+        assert cache.get(1) is not None
+        assert cache.get(3) is not None
+
+    def test_entries_expire(self):
+        """Test an entry older than the TTL is a miss."""
+        clock = FakeClock()
+        cache = GameStateCache(ttl=10, clock=clock)
+        cache.put(_status(1))
+        clock.now = 9.9
+        assert cache.get(1) is not None
+        clock.now = 10
+        assert cache.get(1) is None
+        assert len(cache) == 0
+
+
+class TestResponseCache:
+    """Test the pre-serialized response cache."""
+
+    def test_least_recently_used_evicted(self):
+        """Test the cache stays within max_entries, dropping the oldest unused body."""
+        cache = ResponseCache(max_entries=2)
+        cache.put(1, CachedResponse(b"one", '"1"'))
+        cache.put(2, CachedResponse(b"two", '"2"'))
+        assert cache.get(1).body == b"one"
+        cache.put(3, CachedResponse(b"three", '"3"'))
+        assert cache.get(2) is None
+        assert cache.get(1).etag == '"1"' and cache.get(3).body == b"three"
+        stats = cache.stats()
+        assert stats["entries"] == 2 and stats["bytes"] == 8
+        assert stats["hits"] == 3 and stats["misses"] == 1
+
+
+class TestIdempotencyCache:
+    """Test the idempotency key cache."""
+
+    def test_least_recently_used_evicted(self):
+        """Test the cache keeps the most recently used keys within max_entries."""
+        cache = IdempotencyCache(max_entries=2)
+        cache.put("1:a", "req-a", "resp-a")
+        cache.put("1:b", "req-b", "resp-b")
+        assert cache.get("1:a") == ("req-a", "resp-a")
+        cache.put("1:c", "req-c", "resp-c")
+        assert cache.get("1:b") is None
+        assert len(cache) == 2
+        cache.clear()
+        assert cache.get("1:a") is None
+        stats = cache.stats()
+        assert stats["entries"] == 0 and stats["hits"] == 1 and stats["misses"] == 2
@@ -0,0 +1,115 @@
+"""Tests for the group commit writer."""
+import asyncio
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import database
+from database import Base, Player, configure_sqlite
+from group_commit import GroupCommitWriter
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'group.db'}")
+    configure_sqlite(engine.sync_engine)
+
+    async def setup():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(setup())
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    asyncio.run(engine.dispose())
+
+
+def _add_player(name):
+    async def work(db):
+        db.add(Player(name=name))
+        await db.flush()
+        return name
+    return work
+
+
+async def _player_names(session_factory):
+    async with session_factory() as db:
+        return sorted((await db.scalars(select(Player.name))).all())
+
+
+class TestGroupCommitWriter:
+    """Test batching and per-unit rollback."""
+
+    def test_concurrent_units_share_batches(self, session_factory):
+        """Test many concurrent units commit in fewer transactions."""
+        writer = GroupCommitWriter(session_factory, max_batch=50, max_delay=0.05)
+
+        async def run():
+            results = await asyncio.gather(*(writer.submit(_add_player(f"p{i}")) for i in range(20)))
+            await writer.close()
+            return results, await _player_names(session_factory)
+
+        results, names = asyncio.run(run())
+        assert results == [f"p{i}" for i in range(20)]
+        assert len(names) == 20
+        assert writer.units == 20
+        assert writer.batches < 20
+
+    def test_failing_unit_rolls_back_alone(self, session_factory):
+        """Test a unit that raises doesn't undo the rest of its batch."""
+        writer = GroupCommitWriter(session_factory, max_batch=50, max_delay=0.05)
+
+        async def failing(db):
+            db.add(Player(name="ghost"))
+            await db.flush()
+            raise ValueError("nope")
+
+        async def run():
+            results = await asyncio.gather(
+                writer.submit(_add_player("a")),
+                writer.submit(failing),
+                writer.submit(_add_player("b")),
+                return_exceptions=True,
+            )
+            await writer.close()
+            return results, await _player_names(session_factory)
+
+        results, names = asyncio.run(run())
+        assert results[0] == "a" and results[2] == "b"
+        assert isinstance(results[1], ValueError)
+        assert names == ["a", "b"]
+
+    def test_cancelled_unit_fails(self, session_factory):
+        """Test a unit that raises after its caller gave up doesn't break the rest of its batch."""
+        writer = GroupCommitWriter(session_factory, max_batch=50, max_delay=0.05)
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def failing(db):
+            started.set()
+            await release.wait()
+            raise ValueError("nope")
+
+        async def run():
+            abandoned = asyncio.ensure_future(writer.submit(failing))
+            good = asyncio.ensure_future(writer.submit(_add_player("a")))
+            await started.wait()
+            abandoned.cancel()
+            release.set()
+            result = await asyncio.wait_for(good, 5)
+            await writer.close()
+            return result, abandoned.cancelled(), await _player_names(session_factory)
+
+        assert asyncio.run(run()) == ("a", True, ["a"])
+
+    def test_make_move_through_writer(self, monkeypatch):
+        """Test the move endpoint works with group commit turned on."""
+        import main
+        from test_api import client, register, create_game, move
+
+        monkeypatch.setattr(main, "group_writer", GroupCommitWriter(database.AsyncSessionLocal))
+        player = register()
+        game_id = create_game(player)
+        response = move(game_id, player, 0, 0)
+        assert response.status_code == 200
+        assert client.get(f"/games/{game_id}").json()["move_count"] == 2
+        assert move(game_id, player, 0, 0).status_code == 400
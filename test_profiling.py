@@ -0,0 +1,104 @@
+"""Tests for the profiling middleware."""
+import logging
+import pstats
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+import main
+import profiling
+from profiling import ProfilingMiddleware, RequestStats, RouteMetrics
+from test_api import register, create_game
+
+
+@pytest.fixture
+def metrics():
+    return RouteMetrics()
+
+
+@pytest.fixture
+def profiled(metrics, monkeypatch, tmp_path):
+    """A client for main.app behind the middleware, with game logic timed."""
+    for name in ("check_winner_after", "ai_make_move", "make_move_on_board", "get_current_turn"):
+        monkeypatch.setattr(main, name, profiling.timed_logic(getattr(main, name)))
+    app = ProfilingMiddleware(main.app, metrics=metrics, engine=database.async_engine.sync_engine,
+                              slow_ms=10_000, profile_dir=str(tmp_path / "profiles"))
+    return app, TestClient(app)
+
+
+def _samples(text, name):
+    """Metric samples from Prometheus text as {labels: value}."""
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith(name + "{"):
+            labels, value = line[len(name) + 1:].rsplit("} ", 1)
+            samples[labels] = float(value)
+    return samples
+
+
+class TestRouteMetrics:
+    """Test aggregation and the Prometheus text format."""
+
+    def test_render(self, metrics):
+        """Test counts, histogram buckets and totals per route."""
+        metrics.observe("GET", "/games/{game_id}", 200, 0.02, RequestStats(2, 0.004, 0.001))
+        metrics.observe("GET", "/games/{game_id}", 404, 0.3, RequestStats(1, 0.002, 0.0))
+        text = metrics.render()
+        labels = 'method="GET",route="/games/{game_id}"'
+
+        assert _samples(text, "http_requests_total") == {
+            labels + ',status="200"': 1,
+            labels + ',status="404"': 1,
+        }
+        buckets = _samples(text, "http_request_duration_seconds_bucket")
+        assert buckets[labels + ',le="0.01"'] == 0
+        assert buckets[labels + ',le="0.025"'] == 1
+        assert buckets[labels + ',le="0.5"'] == 2
+        assert buckets[labels + ',le="+Inf"'] == 2
+        assert _samples(text, "http_request_db_queries_total") == {labels: 3}
+        assert "# TYPE http_request_duration_seconds histogram" in text
+
+
+class TestProfilingMiddleware:
+    """Test per-request numbers recorded by the middleware."""
+
+    def test_move_records_db_and_logic_time(self, profiled, metrics):
+        """Test a move against the AI counts its queries and game logic time under its route."""
+        app, client = profiled
+        player = register()
+        game_id = create_game(player)
+        response = client.post("/moves", json={"game_id": game_id, "player_id": player, "row": 0, "col": 0})
+        assert response.status_code == 200
+        client.get(f"/games/{game_id}")
+        client.get(f"/games/{game_id + 1000}")
+
+        text = client.get("/metrics").text
+        moves = 'method="POST",route="/moves"'
+        status = 'method="GET",route="/games/{game_id}"'
+        assert _samples(text, "http_requests_total")[moves + ',status="200"'] == 1
+        assert _samples(text, "http_requests_total")[status + ',status="404"'] == 1
+        assert _samples(text, "http_request_db_queries_total")[moves] >= 3
+        assert _samples(text, "http_request_db_seconds_total")[moves] > 0
+        assert _samples(text, "http_request_game_logic_seconds_total")[moves] > 0
+
+    def test_slow_requests_are_logged(self, profiled, caplog):
+        """Test requests over the threshold are logged with their breakdown."""
+        app, client = profiled
+        app.slow_ms = 0
+        with caplog.at_level(logging.WARNING, logger="profiling"):
+            client.get("/")
+        assert "slow request GET /" in caplog.text
+        assert "queries" in caplog.text
+
+    def test_profile_header_dumps_stats(self, profiled, tmp_path):
+        """Test a request with X-Profile writes a cProfile dump for that request only."""
+        app, client = profiled
+        player = register()
+        client.get(f"/players/{player}/history")
+        assert not (tmp_path / "profiles").exists()
+
+        client.get(f"/players/{player}/history", headers={"X-Profile": "1"})
+        dumps = list((tmp_path / "profiles").iterdir())
+        assert len(dumps) == 1
+        assert "players_player_id_history" in dumps[0].name
+        assert pstats.Stats(str(dumps[0])).total_calls > 0
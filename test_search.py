@@ -0,0 +1,120 @@
+"""Tests for the alpha-beta search AI."""
+import asyncio
+import time
+
+import ai_table
+import search
+from search import WIN, SearchPool, search_move
+from variants import Variant
+
+GOMOKU = Variant(15, 5)
+
+
+def _place(stones, variant=GOMOKU):
+    """Board with 'X'/'O' on the given (row, col) cells."""
+    board = list(variant.empty_board())
+    for symbol, row, col in stones:
+        board[variant.position(row, col)] = symbol
+    return "".join(board)
+
+
+MIDGAME = _place([('X', 7, 7), ('O', 7, 8), ('X', 8, 8), ('O', 6, 6), ('X', 8, 7), ('O', 6, 7), ('X', 9, 9)])
+
+
+class TestSearchMove:
+    """Test the moves search_move picks and how long it takes."""
+
+    def test_perfect_on_3x3(self):
+        """Test every move it picks on 3x3 keeps the game-theoretic result of the position."""
+        for board, entry in ai_table.TABLE.items():
+            side = ai_table.side_to_move(board)
+            if entry.best_move is None:
+                continue
+            move = search_move(board, 3, 3, side, time_budget=5).move
+            assert ai_table.TABLE[board[:move] + side + board[move + 1:]].value == entry.value, board
+
+    def test_wins_before_blocking(self):
+        """Test a win is taken straight away, ahead of blocking one."""
+        board = _place([('O', 3, c) for c in range(4)] + [('X', 9, c) for c in range(4)] + [('X', 12, 12)])
+        result = search_move(board, 15, 5, 'O')
+        assert result.move == GOMOKU.position(3, 4)
+        assert result.value == WIN
+
+    def test_blocks_open_three(self):
+        """Test an open three is blocked before it becomes an open four."""
+        board = _place([('X', 7, 6), ('X', 7, 7), ('X', 7, 8), ('O', 3, 3), ('O', 10, 12)])
+        move = search_move(board, 15, 5, 'O', time_budget=10, max_depth=4).move
+        assert move in (GOMOKU.position(7, 5), GOMOKU.position(7, 9))
+
+    def test_time_budget(self):
+        """Test the search answers within its budget, with at least one finished iteration."""
+        result = search_move(MIDGAME, 15, 5, 'O', time_budget=0.05)
+        assert result.seconds < 0.05 + 0.02
+        assert result.depth >= 1
+        assert MIDGAME[result.move] == '.'
+
+    def test_transposition_table_kept(self):
+        """Test searching the same position again starts from the table of the first search."""
+        search._tables.clear()
+        first = search_move(MIDGAME, 15, 5, 'O', time_budget=5, max_depth=3)
+        again = search_move(MIDGAME, 15, 5, 'O', time_budget=5, max_depth=3)
+        assert again.move == first.move
+        assert again.nodes < first.nodes
+        assert again.tt_hits > 0
+
+    def test_full_board(self):
+        """Test a full board has no move."""
+        assert search_move("XOXOXOOXO", 3, 3, 'X').move is None
+
+
+class TestSearchPool:
+    """Test searches run in worker processes."""
+
+    def test_search_in_worker(self):
+        """Test a search answers from the pool and is counted in the stats."""
+        pool = SearchPool(workers=1, time_budget=0.05)
+        pool.start()
+
+        async def run():
+            return await pool.best_move(MIDGAME, GOMOKU)
+        try:
+            move = asyncio.run(run())
+        finally:
+            pool.shutdown()
+        assert MIDGAME[move] == '.'
+        stats = pool.stats()
+        assert stats["searches"] == 1 and stats["timeouts"] == 0
+        assert stats["nodes"] > 0 and stats["nodes_per_second"] > 0
+        assert stats["avg_depth"] >= 1 and 0 <= stats["tt_hit_rate"] <= 1
+
+    def test_late_answer_abandoned(self):
+        """Test a search that doesn't answer in time gives None, for the caller to fall back."""
+        # Searches for 0.3s, but is only waited on for 0.05s
+        pool = SearchPool(workers=1, time_budget=0.3, grace=-0.25)
+        pool.start()
+
+        async def run():
+            return await pool.best_move(MIDGAME, GOMOKU)
+        try:
+            assert asyncio.run(run()) is None
+        finally:
+            pool.shutdown()
+        assert pool.stats()["timeouts"] == 1
+
+    def test_falls_back_while_starting(self):
+        """Test searches asked for before the pool is up answer None at once and start one pool."""
+        pool = SearchPool(workers=1, time_budget=0.05)
+
+        async def run():
+            started = time.monotonic()
+            first = await asyncio.gather(pool.best_move(MIDGAME, GOMOKU), pool.best_move(MIDGAME, GOMOKU))
+            waited = time.monotonic() - started
+            await pool._starting
+            return first, waited, await pool.best_move(MIDGAME, GOMOKU)
+        try:
+            first, waited, move = asyncio.run(run())
+        finally:
+            pool.shutdown()
+        assert first == [None, None] and waited < 0.05
+        assert MIDGAME[move] == '.'
+        assert pool.stats()["searches"] == 1 and pool.stats()["timeouts"] == 0
@@ -0,0 +1,71 @@
+"""Tests for the self-play simulator."""
+import random
+
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+
+from database import Player, SessionLocal
+from game_logic import check_winner
+from main import app
+from simulator import STRATEGIES, insert_games, play_game, simulate
+
+
+class TestPlayGame:
+    """Test single games between strategies."""
+
+    def test_game_is_legal(self):
+        """Test each move adds one symbol, alternating X and O, until the game ends."""
+        rng = random.Random(1)
+        for _ in range(50):
+            winner, boards = play_game(STRATEGIES["random"], STRATEGIES["heuristic"], rng)
+            previous = "........."
+            for i, board in enumerate(boards):
+                changed = [j for j in range(9) if board[j] != previous[j]]
+                assert len(changed) == 1 and previous[changed[0]] == "."
+                assert board[changed[0]] == ("X" if i % 2 == 0 else "O")
+                assert (check_winner(board) is None) == (i < len(boards) - 1)
+                previous = board
+            assert winner == check_winner(boards[-1])
+
+    def test_perfect_play_ties(self):
+        """Test perfect play against itself always ties."""
+        winner, boards = play_game(STRATEGIES["perfect"], STRATEGIES["perfect"], random.Random(0))
+        assert winner == "TIE" and len(boards) == 9
+
+
+class TestSimulate:
+    """Test simulation runs and their totals."""
+
+    def test_perfect_never_loses(self):
+        """Test perfect play as O never loses to random X."""
+        result = simulate("random", "perfect", 2000, workers=1, chunk_size=500)
+        assert result.games == result.x_wins + result.o_wins + result.ties == 2000
+        assert result.x_wins == 0
+        assert result.o_wins > 0
+
+    def test_process_pool_matches_in_process(self):
+        """Test the same seed gives the same totals with and without the pool."""
+        pooled = simulate("random", "random", 300, workers=2, seed=7, chunk_size=100)
+        local = simulate("random", "random", 300, workers=1, seed=7, chunk_size=100)
+        assert pooled[:4] == local[:4]
+        assert abs(sum(pooled.rates().values()) - 1) < 1e-9
+
+
+class TestInsertGames:
+    """Test seeding the database with simulated games."""
+
+    def test_inserted_games_show_in_history(self):
+        """Test inserted games and moves are served by the history endpoints."""
+        assert insert_games("random", "heuristic", 25, batch_size=10) == 25
+        with SessionLocal() as db:
+            player_id = db.scalar(select(Player.player_id).where(Player.name == "sim-x-random"))
+
+        client = TestClient(app)
+        games = client.get(f"/players/{player_id}/history").json()["games"]
+        assert len(games) == 25
+        assert all(g["status"] == "done" and g["winner"] in ("X", "O", "TIE") for g in games)
+
+        moves = client.get(f"/games/{games[0]['game_id']}/moves").json()["moves"]
+        assert moves[0]["player"] == "initial"
+        assert [m["move_number"] for m in moves] == list(range(len(moves)))
+        assert check_winner(moves[-1]["board_state"]) is not None
@@ -0,0 +1,124 @@
+"""Tests for N×N, K-in-a-row board variants."""
+import itertools
+import random
+import pytest
+
+import bitboard
+from game_logic import ai_make_move, variant_move
+from variants import STANDARD, Variant, variant_for
+
+
+def _reference_winner(board, variant):
+    """Check every line of win_length cells on the board."""
+    size, k = variant.size, variant.win_length
+    for row in range(size):
+        for col in range(size):
+            for dr, dc in ((0, 1), (1, 0), (1, 1), (1, -1)):
+                cells = [(row + i * dr, col + i * dc) for i in range(k)]
+                if all(variant.contains(r, c) for r, c in cells):
+                    symbols = {board[variant.position(r, c)] for r, c in cells}
+                    if len(symbols) == 1 and symbols != {'.'}:
+                        return symbols.pop()
+    return None if '.' in board else 'TIE'
+
+
+def _place(variant, stones):
+    """Board with 'X'/'O' on the given (row, col) cells."""
+    board = list(variant.empty_board())
+    for symbol, row, col in stones:
+        board[variant.position(row, col)] = symbol
+    return "".join(board)
+
+
+class TestVariantFor:
+    """Test variant validation and defaults."""
+
+    def test_defaults(self):
+        """Test win length defaults to the board size, up to five in a row."""
+        assert variant_for() == STANDARD == Variant(3, 3)
+        assert variant_for(4) == Variant(4, 4)
+        assert variant_for(15) == Variant(15, 5)
+        assert variant_for(15, 4) == Variant(15, 4)
+
+    @pytest.mark.parametrize("size, win_length", [(2, None), (20, None), (5, 6), (5, 2)])
+    def test_invalid(self, size, win_length):
+        """Test sizes and win lengths out of range are rejected."""
+        with pytest.raises(ValueError):
+            variant_for(size, win_length)
+
+
+class TestWinnerAfter:
+    """Test the incremental win check against a full scan."""
+
+    def test_lines_through_cell(self):
+        """Test rows, columns and both diagonals through the last stone win."""
+        gomoku = Variant(15, 5)
+        for stones in (
+            [('X', 7, c) for c in range(3, 8)],
+            [('O', r, 0) for r in range(10, 15)],
+            [('X', i, i) for i in range(5)],
+            [('O', i, 14 - i) for i in range(10, 15)],
+        ):
+            board = _place(gomoku, stones)
+            for _, row, col in stones:
+                assert gomoku.winner_after(board, gomoku.position(row, col), len(stones)) == stones[0][0]
+
+    def test_short_and_broken_lines(self):
+        """Test four in a row, or five with a gap or wrapping round the edge, doesn't win."""
+        gomoku = Variant(15, 5)
+        four = _place(gomoku, [('X', 0, c) for c in range(4)])
+        assert gomoku.winner_after(four, gomoku.position(0, 3), 4) is None
+        gap = _place(gomoku, [('X', 0, c) for c in (0, 1, 2, 4, 5)])
+        assert gomoku.winner_after(gap, gomoku.position(0, 5), 5) is None
+        wrapped = _place(gomoku, [('X', 0, 12), ('X', 0, 13), ('X', 0, 14), ('X', 1, 0), ('X', 1, 1)])
+        assert gomoku.winner_after(wrapped, gomoku.position(1, 1), 5) is None
+
+    def test_full_board_tie(self):
+        """Test a full board without a line is a tie."""
+        variant = Variant(4, 4)
+        board = "XXOO" "OOXX" "XXOO" "OOXX"
+        assert variant.winner_after(board, 15, 16) == 'TIE'
+        assert variant.winner(board) == 'TIE'
+
+    def test_matches_full_scan(self):
+        """Test random games stop on the same move as a scan of every line would."""
+        rng = random.Random(7)
+        for variant, games in ((Variant(3, 3), 20), (Variant(5, 4), 20), (Variant(7, 5), 10), (Variant(15, 5), 2)):
+            for _ in range(games):
+                board = variant.empty_board()
+                cells = list(range(variant.cells))
+                rng.shuffle(cells)
+                for stones, cell in enumerate(cells, start=1):
+                    board = board[:cell] + "XO"[stones % 2 == 0] + board[cell + 1:]
+                    winner = variant.winner_after(board, cell, stones)
+                    assert winner == _reference_winner(board, variant)
+                    if winner is not None:
+                        assert variant.winner(board) == winner
+                        break
+
+    def test_standard_matches_bitboard(self):
+        """Test 3x3 boards get the same result as the bitboard check."""
+        for cells in itertools.product(".XO", repeat=9):
+            board = "".join(cells)
+            x, o = bitboard.encode(board)
+            if not (bitboard.WINNING[x] and bitboard.WINNING[o]):  # unreachable, and the two break ties differently
+                assert STANDARD.winner(board) == bitboard.winner(x, o)
+
+
+class TestVariantAI:
+    """Test the AI on boards larger than 3x3."""
+
+    def test_wins_then_blocks(self):
+        """Test the AI completes its own line before blocking the opponent's."""
+        gomoku = Variant(15, 5)
+        board = _place(gomoku, [('O', 3, c) for c in range(4)] + [('X', 9, c) for c in range(4)])
+        assert variant_move(board, gomoku, 'O') == gomoku.position(3, 4)
+        board = _place(gomoku, [('X', 9, c) for c in range(1, 5)])
+        assert variant_move(board, gomoku, 'O') in (gomoku.position(9, 0), gomoku.position(9, 5))
+
+    def test_plays_near_the_stones(self):
+        """Test the AI answers next to the stones on the board."""
+        gomoku = Variant(15, 5)
+        row, col = ai_make_move(_place(gomoku, [('X', 2, 2)]), gomoku)
+        assert abs(row - 2) <= 1 and abs(col - 2) <= 1
+        assert ai_make_move("X" * gomoku.cells, gomoku) == (None, None)
@@ -0,0 +1,91 @@
+"""N×N boards won by K in a row, such as 15×15 gomoku.
+
+Boards are strings like the 3×3 ones: size * size cells in row-major order,
+'X', 'O' or '.'. Rather than rescanning the board after each move,
+winner_after only follows the four lines through the cell just played, at
+most win_length - 1 cells each way, so a move costs O(win_length) whatever
+the board size. A line of win_length or more wins. Standard 3×3 games keep
+using bitboard, which is faster still.
+"""
+from typing import NamedTuple, Optional
+
+MIN_SIZE = 3
+MAX_SIZE = 19
+# Win length of boards larger than this when none is given: five in a row, as in gomoku
+DEFAULT_WIN_LENGTH = 5
+
+# (row, col) steps along a row, a column and the two diagonals
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+class Variant(NamedTuple):
+    """Board size and the number in a row that wins."""
+    size: int = 3
+    win_length: int = 3
+
+    @property
+    def cells(self) -> int:
+        return self.size * self.size
+
+    def empty_board(self) -> str:
+        return "." * self.cells
+
+    def contains(self, row: int, col: int) -> bool:
+        return 0 <= row < self.size and 0 <= col < self.size
+
+    def position(self, row: int, col: int) -> int:
+        """Board index of (row, col)."""
+        return row * self.size + col
+
+    def completes_line(self, board: str, cell: int, symbol: str) -> bool:
+        """Whether symbol on cell makes win_length in a row, whatever is on cell now."""
+        size, needed = self.size, self.win_length - 1
+        row, col = divmod(cell, size)
+        for dr, dc in DIRECTIONS:
+            count = 0
+            for sign in (1, -1):
+                r, c = row + sign * dr, col + sign * dc
+                while count < needed and 0 <= r < size and 0 <= c < size and board[r * size + c] == symbol:
+                    count += 1
+                    r += sign * dr
+                    c += sign * dc
+            if count >= needed:
+                return True
+        return False
+
+    def winner_after(self, board: str, cell: int, stones: int) -> Optional[str]:
+        """'X', 'O', 'TIE' or None after a stone was played on cell.
+
+        stones is how many are on the board now (the game's move count), so a
+        full board is spotted without scanning it.
+        """
+        if self.completes_line(board, cell, board[cell]):
+            return board[cell]
+        if stones >= self.cells:
+            return 'TIE'
+        return None
+
+    def winner(self, board: str) -> Optional[str]:
+        """Same as winner_after, but checking the whole board, for boards not built move by move."""
+        for cell, symbol in enumerate(board):
+            if symbol != '.' and self.completes_line(board, cell, symbol):
+                return symbol
+        return None if '.' in board else 'TIE'
+
+
+STANDARD = Variant()
+
+
+def variant_for(size: int = 3, win_length: Optional[int] = None) -> Variant:
+    """Validated variant; win_length defaults to the board size, up to DEFAULT_WIN_LENGTH.
+
+    Raises ValueError for sizes outside MIN_SIZE..MAX_SIZE or win lengths
+    outside 3..size.
+    """
+    if not MIN_SIZE <= size <= MAX_SIZE:
+        raise ValueError(f"Board size must be between {MIN_SIZE} and {MAX_SIZE}")
+    if win_length is None:
+        win_length = min(size, DEFAULT_WIN_LENGTH)
+    if not 3 <= win_length <= size:
+        raise ValueError(f"Win length must be between 3 and the board size ({size})")
+    return Variant(size, win_length)